@@ -0,0 +1,145 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+# File download response with Range and conditional request support.
+# The file is never read as a whole: when the server implements the ASGI
+# "http.response.zerocopy" extension the open file is handed to it (sendfile);
+# otherwise it is streamed in CHUNK_SIZE pieces read in the thread pool.
+
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int):
+    # Returns (start, end) inclusive, or None to send the whole file.
+    # Several ranges in one request are answered with the whole file, which the spec allows.
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def _etag_in(header: str, etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+class FileDownload(Response):
+    def __init__(self, path, size: int, mtime: float, filename: str, etag: str, request_headers):
+        self.path = path
+        self.background = None
+        self.start, self.end = 0, size - 1
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(mtime, usegmt=True),
+            "content-disposition": content_disposition(filename),
+            "cache-control": "private, no-cache",
+        }
+
+        if_none_match = request_headers.get("if-none-match")
+        if_modified_since = request_headers.get("if-modified-since")
+        if_range = request_headers.get("if-range")
+        range_header = request_headers.get("range")
+        if (if_none_match and _etag_in(if_none_match, etag)) or (
+                not if_none_match and if_modified_since and _not_modified_since(if_modified_since, mtime)):
+            self.status_code = 304
+            self.body_length = 0
+        elif range_header and (not if_range or if_range.strip() == etag or _not_modified_since(if_range, mtime)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                self.body_length = 0
+                headers["content-range"] = f"bytes */{size}"
+            else:
+                if byte_range is None:
+                    self.status_code = 200
+                else:
+                    self.status_code = 206
+                    self.start, self.end = byte_range
+                    headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+                self.body_length = self.end - self.start + 1
+        else:
+            self.status_code = 200
+            self.body_length = size
+
+        if self.status_code != 304:
+            headers["content-length"] = str(self.body_length)
+            headers["content-type"] = media_type
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.body_length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": file,
+                            "offset": self.start, "count": self.body_length, "more_body": False})
+                return
+            await run_in_threadpool(file.seek, self.start)
+            remaining = self.body_length
+            while remaining > 0:
+                chunk = await run_in_threadpool(file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break  # file shrank while sending; nothing sensible left to do
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(file.close)
+
+
+def stat_file(path):
+    # (size, mtime) or None when the stored file is gone
+    try:
+        result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return result.st_size, result.st_mtime
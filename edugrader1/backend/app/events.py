@@ -0,0 +1,82 @@
+import asyncio
+import time
+from collections import deque
+
+import orjson
+
+from metrics import Counter, InstanceGauge
+
+# In-process pub/sub for server-sent events.
+# Routes publish after their commit; every open SSE connection holds a
+# Subscription with a bounded queue. Publishing never waits: a subscriber
+# that falls QUEUE_SIZE events behind is dropped and its client reconnects
+# with Last-Event-ID, which is answered from the replay buffer.
+# Only connections of this process are reached; with several workers a
+# client sees the events of the worker its connection landed on.
+
+QUEUE_SIZE = 256
+REPLAY_SIZE = 1000
+
+events_published = Counter("edugrader_events_published_total", "Events published to the SSE hub")
+subscribers_dropped = Counter("edugrader_events_dropped_subscribers_total",
+                              "SSE subscribers dropped because they fell behind")
+subscribers = InstanceGauge("edugrader_event_subscribers", "Open SSE subscriptions",
+                            lambda hub: len(hub._subscriptions))
+
+
+class Subscription:
+    def __init__(self, topics, accept):
+        self.topics = set(topics)
+        self.accept = accept  # accept(data) -> bool, per-user visibility
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def wants(self, topics, data) -> bool:
+        return not self.topics.isdisjoint(topics) and self.accept(data)
+
+
+class EventHub:
+    # Called only from the event loop, so no locking
+    def __init__(self, replay_size: int = REPLAY_SIZE):
+        self._subscriptions = set()
+        self._replay = deque(maxlen=replay_size)
+        # Ids start from the clock so they keep growing across restarts
+        self._last_id = int(time.time() * 1000)
+        subscribers.track(self)
+
+    def publish(self, topics, event: str, data: dict):
+        self._last_id += 1
+        message = (self._last_id, frozenset(topics), event, data)
+        self._replay.append(message)
+        events_published.inc(event=event)
+        for subscription in list(self._subscriptions):
+            if not subscription.wants(message[1], data):
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self._subscriptions.discard(subscription)
+                subscribers_dropped.inc()
+
+    def subscribe(self, topics, accept=lambda data: True) -> Subscription:
+        subscription = Subscription(topics, accept)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def missed(self, subscription: Subscription, last_event_id: int):
+        # Events after last_event_id, or None when some of them are no longer in the
+        # buffer (or the id is from before a restart)
+        oldest_known = self._replay[0][0] - 1 if self._replay else self._last_id
+        if not oldest_known <= last_event_id <= self._last_id:
+            return None
+        return [message for message in self._replay
+                if message[0] > last_event_id and subscription.wants(message[1], message[3])]
+
+
+def format_event(message) -> str:
+    event_id, _, event, data = message
+    return f"id: {event_id}\nevent: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
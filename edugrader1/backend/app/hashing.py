@@ -0,0 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Counter, Gauge, Histogram
+
+HASH_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 5)
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# bcrypt runs on its own small executor so a login storm cannot take every
+# worker thread of the app. Requests beyond max_workers + max_queue are
+# rejected right away instead of piling up.
+class PasswordHasher:
+    def __init__(self, context, max_workers: int = 4, max_queue: int = 32):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+
+        self.latency = Histogram("edugrader_password_hash_seconds",
+                                 "Time spent in bcrypt per operation", HASH_BUCKETS)
+        self.rejected = Counter("edugrader_password_hash_rejected_total",
+                                "Hash requests rejected because the pool was full")
+        Gauge("edugrader_password_hash_queue_length",
+              "Hash requests waiting for a free bcrypt worker", lambda: self.queue_length)
+        Gauge("edugrader_password_hash_in_flight",
+              "Hash requests running or waiting in the bcrypt pool", lambda: self._in_flight)
+
+    @property
+    def queue_length(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", self.context.verify, plain_password, hashed_password)
+
+    async def _run(self, operation, func, *args):
+        # Called only from the event loop, so the counter needs no lock
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self.rejected.inc(operation=operation)
+            raise HashPoolBusy()
+
+        self._in_flight += 1
+        try:
+            result, elapsed = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed, func, *args
+            )
+            self.latency.observe(elapsed, operation=operation)
+            return result
+        finally:
+            self._in_flight -= 1
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+
+from metrics import Counter, Histogram, InstanceGauge
+
+# In-process background job queue.
+# The jobs table is the source of truth: a job row is written in the same
+# transaction as the work that needs it, and only its id travels through the
+# asyncio queue. `recover` returns the ids of jobs that still have to run; it is
+# called at start (jobs left over from before a restart) and then every
+# `sweep_interval` seconds (jobs whose worker process died). The handler has to
+# claim the job in the database before running it, so an id that is queued
+# twice, or in two processes, still runs once.
+
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger("edugrader.jobs")
+
+job_seconds = Histogram("edugrader_job_seconds", "Time spent running background jobs", JOB_BUCKETS)
+jobs_rejected = Counter("edugrader_job_rejected_total", "Requests rejected because the job queue was full")
+queue_depth = InstanceGauge("edugrader_job_queue_depth", "Background jobs waiting or running",
+                            lambda job_queue: job_queue.depth)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, handler, recover, workers: int = 2, max_depth: int = 200, sweep_interval: float = 60):
+        self.handler = handler  # async handler(job_id)
+        self.recover = recover  # async recover() -> [job_id]
+        self.workers = workers
+        self.max_depth = max_depth
+        self.sweep_interval = sweep_interval
+        self._queue = None
+        self._queued = set()
+        self._running = 0
+        self._tasks = []
+        queue_depth.track(self)
+
+    @property
+    def depth(self) -> int:
+        return len(self._queued) + self._running
+
+    def check_capacity(self):
+        # Called before accepting work that will enqueue a job
+        if self.depth >= self.max_depth:
+            jobs_rejected.inc()
+            raise JobQueueFull()
+
+    def enqueue(self, job_id: int):
+        if self._queue is None or job_id in self._queued:
+            return  # not started: recover() picks it up at start
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    def enqueue_later(self, job_id: int, delay: float):
+        asyncio.get_running_loop().call_later(delay, self.enqueue, job_id)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job_id in await self.recover():
+            self.enqueue(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        # Unfinished jobs stay queued/running in the table and are recovered on the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+    async def join(self):
+        # Waits until every queued job has been handled (used by tests and benchmarks)
+        while self.depth:
+            await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            self._running += 1
+            start = time.perf_counter()
+            try:
+                await self.handler(job_id)
+            except Exception:
+                logger.exception("Job %s crashed", job_id)
+            finally:
+                self._running -= 1
+                job_seconds.observe(time.perf_counter() - start)
+                self._queue.task_done()
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                for job_id in await self.recover():
+                    self.enqueue(job_id)
+            except Exception:
+                logger.exception("Job recovery failed")
@@ -1,211 +1,419 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, JSON, Text, Boolean, Table
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.datastructures import State
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from sqlalchemy import create_engine, select, func, event, update
+from sqlalchemy.orm import sessionmaker, object_session, make_transient_to_detached
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from contextlib import asynccontextmanager
+from functools import partial
 from datetime import datetime, timedelta
-import os
-import shutil
-from pathlib import Path
+import csv
+import io
+import json
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, TypeAdapter
 from typing import Optional, List, Dict
+from models import (Base, course_students, cache_versions, User, Course, Assignment, Submission, Grade,
+                    AssignmentStats, Job, ScoreBucket, CriterionSum, HISTOGRAM_BUCKETS, as_dict)
+from schemas import (UserCreate, UserOut, Token, CourseCreate, CourseOut, AssignmentCreate, AssignmentOut,
+                     SubmissionOut, GradeCreate, SearchResults, COURSE_LIST, ASSIGNMENT_LIST, SUBMISSION_LIST)
+from repository import InvalidGrade
+from repository_orm import OrmRepository
+from repository_sql import SqlRepository
+from search import fts_query
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, split_page, page_headers
+from storage import SubmissionStorage, UploadTooLarge, DEFAULT_MAX_UPLOAD_SIZE
+from hashing import PasswordHasher, HashPoolBusy
+from metrics import render_metrics
+from user_cache import UserCache
+from sessions import ThreadedSession
+from migrations import migrate_engine, pending_migrations
+from response_cache import ResponseCache, etag_matches, response_etag
+from query_metrics import QueryMetricsMiddleware, instrument_engine
+from jobs import JobQueue, JobQueueFull
+from processing import process_submission_file
+from downloads import FileDownload, stat_file
+from uploads import UPLOAD_FORM, InvalidUpload, receive_form
+from zipstream import ZipStream, safe_name
+from events import EventHub, format_event
+from write_queue import WriteQueue, configure_sqlite
+from settings import Settings
+import asyncio
 
 # Security
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+HASH_POOL_WORKERS = 4  # bcrypt threads
+HASH_POOL_MAX_QUEUE = 32  # waiting hash requests before answering 503
+HASH_POOL_RETRY_AFTER = 2  # seconds
+JOB_WORKERS = 2  # concurrent post-upload jobs
+JOB_MAX_DEPTH = 200  # queued + running jobs before uploads get 503
+JOB_RETRY_AFTER = 10  # seconds, Retry-After when the job queue is full
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 5  # seconds, multiplied by the attempt number
+JOB_STALE_AFTER = timedelta(minutes=5)  # a running job this old lost its worker
+password_hasher = PasswordHasher(pwd_context, max_workers=HASH_POOL_WORKERS, max_queue=HASH_POOL_MAX_QUEUE)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# Create upload directory
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-# Database setup - SQLite
-SQLALCHEMY_DATABASE_URL = "sqlite:///./edugrader.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# Association table for courses and students
-course_students = Table(
-    'course_students',
-    Base.metadata,
-    Column('course_id', Integer, ForeignKey('courses.id')),
-    Column('student_id', Integer, ForeignKey('users.id'))
-)
-
-# Models
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True)
-    username = Column(String, unique=True, index=True)
-    full_name = Column(String)
-    hashed_password = Column(String)
-    role = Column(String, default="student")  # admin, teacher, student
-    group = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.now)
-
-class Course(Base):
-    __tablename__ = "courses"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
-    code = Column(String, unique=True)
-    description = Column(Text)
-    teacher_id = Column(Integer, ForeignKey('users.id'))
-    academic_year = Column(String)
-    semester = Column(Integer)
-    
-    teacher = relationship("User", foreign_keys=[teacher_id])
-    students = relationship("User", secondary=course_students, backref="enrolled_courses")
-    assignments = relationship("Assignment", back_populates="course")
-
-class Assignment(Base):
-    __tablename__ = "assignments"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    course_id = Column(Integer, ForeignKey('courses.id'))
-    title = Column(String)
-    description = Column(Text)
-    max_score = Column(Float, default=100)
-    criteria = Column(JSON)  # [{"name": "criteria1", "max": 30}, ...]
-    deadline = Column(DateTime)
-    
-    course = relationship("Course", back_populates="assignments")
-    submissions = relationship("Submission", back_populates="assignment")
-
-class Submission(Base):
-    __tablename__ = "submissions"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    assignment_id = Column(Integer, ForeignKey('assignments.id'))
-    student_id = Column(Integer, ForeignKey('users.id'))
-    file_path = Column(String)
-    file_name = Column(String)
-    comment = Column(Text)
-    status = Column(String, default="submitted")  # submitted, graded
-    submitted_at = Column(DateTime, default=datetime.now)
-    
-    assignment = relationship("Assignment", back_populates="submissions")
-    student = relationship("User", foreign_keys=[student_id])
-
-class Grade(Base):
-    __tablename__ = "grades"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    submission_id = Column(Integer, ForeignKey('submissions.id'))
-    grader_id = Column(Integer, ForeignKey('users.id'))
-    scores = Column(JSON)  # {"criteria1": 25, "criteria2": 15}
-    total_score = Column(Float)
-    feedback = Column(Text)
-    graded_at = Column(DateTime, default=datetime.now)
-    
-    submission = relationship("Submission")
-    grader = relationship("User", foreign_keys=[grader_id])
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Pydantic schemas
-class UserCreate(BaseModel):
-    email: EmailStr
-    username: str
-    full_name: str
-    password: str
-    role: str = "student"
-    group: Optional[str] = None
-
-class UserOut(BaseModel):
-    id: int
-    email: str
-    username: str
-    full_name: str
-    role: str
-    group: Optional[str]
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-class CourseCreate(BaseModel):
-    name: str
-    code: str
-    description: Optional[str] = None
-    academic_year: str
-    semester: int
-
-class CourseOut(BaseModel):
-    id: int
-    name: str
-    code: str
-    description: Optional[str]
-    teacher_id: int
-    academic_year: str
-    semester: int
-    students_count: int = 0
-
-class Criteria(BaseModel):
-    name: str
-    max_score: float
-
-class AssignmentCreate(BaseModel):
-    course_id: int
-    title: str
-    description: Optional[str] = None
-    max_score: float = 100
-    criteria: List[Criteria]
-    deadline: datetime
-
-class AssignmentOut(BaseModel):
-    id: int
-    course_id: int
-    title: str
-    description: Optional[str]
-    max_score: float
-    criteria: List[Dict]
-    deadline: datetime
-
-class GradeCreate(BaseModel):
-    submission_id: int
-    scores: Dict[str, float]
-    feedback: str
-
-# App initialization
-app = FastAPI(title="EduGrader")
-
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Database dependency
-def get_db():
-    db = SessionLocal()
+# Database setup - SQLite by default, see settings.py for the modes.
+# Engines are created by the lifespan handler (Database below), the schema by
+# `python main.py migrate`; importing this module touches neither.
+# Models are in models.py, the storage backends of the shared routes in repository*.py.
+WRITE_BATCH = 64  # max writes per group commit
+SQLITE_POOL_SIZE = 20  # connections kept open; more are opened on demand
+
+def migrate(settings: Optional[Settings] = None):
+    # Schema setup: creates missing tables, then applies pending migrations.
+    # Run once per deploy (python main.py migrate), not on every worker start
+    settings = settings or Settings.from_env()
+    engine = create_engine(settings.database_url)
     try:
+        Base.metadata.create_all(bind=engine)
+        return migrate_engine(engine)
+    finally:
+        engine.dispose()
+
+# User cache - get_current_user serves hot users from memory instead of SQLite
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60  # seconds
+
+@event.listens_for(User, "before_update")
+def bump_user_version(mapper, connection, target):
+    # Enrollment changes only touch course_students, not the users row
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    # Only sessions opened for an app (open_session, the write queue) have a cache to invalidate
+    state = object_session(target).info.get("state")
+    if state is not None:
+        state.user_cache.invalidate(target.id)
+
+# Pydantic schemas; the ones shared with main_simple.py are in schemas.py
+class HistogramBucket(BaseModel):
+    low: float
+    high: float
+    count: int
+
+class AssignmentStatsOut(BaseModel):
+    assignment_id: int
+    submissions: int
+    graded: int
+    ungraded: int
+    mean: Optional[float]
+    stddev: Optional[float]
+    median: Optional[float]  # exact up to two grades, otherwise estimated from the histogram
+    histogram: List[HistogramBucket]
+    criteria_means: Dict[str, float]
+
+MAX_GRADE_BATCH = 500
+
+class BulkEnrollment(BaseModel):
+    usernames: List[str] = []
+    groups: List[str] = []
+
+MAX_BULK_ENROLLMENT = 5000  # usernames + group names per request
+MAX_BULK_ENROLLMENT_BYTES = 1024 * 1024  # CSV body
+
+def dump_rows(adapter: TypeAdapter, rows: List[dict]) -> bytes:
+    # The list serializers of schemas.py take the repositories' plain dicts:
+    # validating dicts is several times faster than from_attributes on Row or ORM objects
+    return adapter.dump_json(adapter.validate_python(rows))
+
+def json_bytes_response(body: bytes, **kwargs):
+    # For bodies that are already JSON: skips response_model validation and re-encoding
+    return Response(content=body, media_type="application/json", **kwargs)
+
+# Routes; create_app() at the bottom builds the application around them.
+# orjson instead of json.dumps for every route that returns plain data
+router = APIRouter(default_response_class=ORJSONResponse)
+
+async def hash_pool_busy_handler(request: Request, exc: HashPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": str(HASH_POOL_RETRY_AFTER)},
+    )
+
+async def job_queue_full_handler(request: Request, exc: JobQueueFull):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many submissions are being processed, try again later"},
+        headers={"Retry-After": str(JOB_RETRY_AFTER)},
+    )
+
+class Database:
+    # Engines and session factories of the running app
+    def __init__(self, settings: Settings):
+        self.mode = settings.db_mode
+        self.repository = REPOSITORIES[settings.repository]
+        # WAL readers never block each other, so the SQLite pool grows instead of making
+        # thread pool workers wait for a connection - the sessions holding the connections
+        # could themselves be waiting for a free worker
+        pool_options = {"pool_size": SQLITE_POOL_SIZE, "max_overflow": -1} if settings.is_sqlite else {}
+        self.engine = create_engine(settings.database_url, connect_args={"check_same_thread": False},
+                                    **pool_options)
+        self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False,
+                                         bind=self.engine)
+        instrument_engine(self.engine)
+        self.async_engine = None
+        if self.mode == "async":
+            self.async_engine = create_async_engine(settings.async_database_url)
+            self.async_sessionmaker = async_sessionmaker(self.async_engine, autoflush=False,
+                                                         expire_on_commit=False)
+            instrument_engine(self.async_engine.sync_engine)
+        # On SQLite the hot writes (grades, uploads, enrollment) go through one
+        # writer thread that group-commits them, see write_queue.py
+        self.write_engine = None
+        if settings.is_sqlite:
+            configure_sqlite(self.engine)
+            if self.async_engine is not None:
+                configure_sqlite(self.async_engine.sync_engine)
+            if settings.write_queue:
+                self.write_engine = create_engine(settings.database_url, connect_args={"check_same_thread": False})
+                configure_sqlite(self.write_engine, immediate=True)
+                instrument_engine(self.write_engine)
+    
+    @property
+    def dialect(self) -> str:
+        return (self.async_engine or self.engine).dialect.name
+    
+    def write_sessionmaker(self, info: Optional[dict] = None):
+        return sessionmaker(autoflush=False, expire_on_commit=False, bind=self.write_engine, info=info)
+    
+    def pending_migrations(self):
+        raw = self.engine.raw_connection()
+        try:
+            return pending_migrations(raw.driver_connection)
+        finally:
+            raw.close()
+    
+    async def dispose(self):
+        self.engine.dispose()
+        if self.write_engine is not None:
+            self.write_engine.dispose()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+
+REPOSITORIES = {"orm": OrmRepository, "sql": SqlRepository}
+
+# Everything that depends on the settings lives on app.state, never in module
+# globals, so several apps (tests, benchmarks) can run in one process:
+#   settings - given to create_app
+#   user_cache, response_cache, event_hub - in-memory, created by create_app
+#   write_queue, job_queue - created by create_app, started by the lifespan handler
+#   database (Database above), storage (uploaded files) - opened by the lifespan handler
+# Routes reach it through request.app.state. Every session is opened for one
+# app's state and carries it in session.info, so helpers that only get a
+# session (repository, run_write) use the right backend and queue.
+
+def session_state(db) -> State:
+    # app.state of the app the session (AsyncSession, ThreadedSession or sync Session) was opened for
+    return db.info["state"]
+
+# Database dependency - both modes expose the AsyncSession API to the routes
+@asynccontextmanager
+async def open_session(state: State):
+    database = state.database
+    if database.mode == "async":
+        async with database.async_sessionmaker(info={"state": state}) as db:
+            yield db
+    else:
+        db = ThreadedSession(database.sessionmaker(info={"state": state}))
+        try:
+            yield db
+        finally:
+            await db.close()
+
+async def get_db(request: Request):
+    async with open_session(request.app.state) as db:
         yield db
+
+def repository(session):
+    # Storage backend of the shared routes, on a sync Session (see repository.py)
+    return session_state(session).database.repository.from_session(session)
+
+async def with_repository(db: AsyncSession, operation):
+    # Reads: operation(repo) runs in the thread pool (sync mode) or on the async connection
+    return await db.run_sync(lambda session: operation(repository(session)))
+
+async def run_write(db: AsyncSession, operation):
+    # operation(session) gets a sync Session and does the reads that decide the
+    # write plus the write itself, so nothing can change in between
+    write_queue = session_state(db).write_queue
+    if not write_queue.running:
+        # Write and commit in one call: the SQLite write lock is not held while
+        # the request waits for a thread pool worker to commit
+        def write_and_commit(session):
+            result = operation(session)
+            session.commit()
+            return result
+        return await db.run_sync(write_and_commit)
+    # End the request's read transaction first, so its pooled connection is
+    # not held while the write waits for its group
+    await db.commit()
+    return await write_queue.run(operation)
+
+# Post-upload processing (checksums, text extraction, preview, malware scan)
+# runs in the background job queue, never inside the upload request
+async def pending_jobs(state: State):
+    async with open_session(state) as db:
+        await db.execute(
+            update(Job)
+            .where(Job.status == "running", Job.started_at < datetime.now() - JOB_STALE_AFTER)
+            .values(status="queued")
+        )
+        await db.commit()
+        return (await db.scalars(select(Job.id).where(Job.status == "queued").order_by(Job.id))).all()
+
+async def run_job(state: State, job_id: int):
+    async with open_session(state) as db:
+        # Claim the job; another worker or process may have taken it already
+        def claim(session):
+            claimed = session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", attempts=Job.attempts + 1, started_at=datetime.now())
+            )
+            if claimed.rowcount != 1:
+                return None
+            job = session.get(Job, job_id)
+            submission = session.get(Submission, job.submission_id)
+            submission.processing_status = "processing"
+            return job, submission, session.get(Assignment, submission.assignment_id).course_id
+        
+        claimed = await run_write(db, claim)
+        if claimed is None:
+            return
+        job, submission, course_id = claimed
+        
+        try:
+            result = await run_in_threadpool(process_submission_file, submission.file_path, submission.file_name)
+            if submission.file_sha256 and result["checksums"]["sha256"] != submission.file_sha256:
+                raise ValueError("Stored file does not match the uploaded checksum")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            
+            def record_failure(session):
+                failed = session.get(Job, job_id)
+                failed.last_error = error
+                if failed.attempts < JOB_MAX_ATTEMPTS:
+                    failed.status = "queued"
+                    session.get(Submission, submission.id).processing_status = "pending"
+                else:
+                    failed.status = "failed"
+                    failed.finished_at = datetime.now()
+                    session.get(Submission, submission.id).processing_status = "failed"
+                return failed.status
+            
+            if await run_write(db, record_failure) == "queued":
+                state.job_queue.enqueue_later(job_id, JOB_RETRY_DELAY * job.attempts)
+            return
+        
+        def record_result(session):
+            processed = session.get(Submission, submission.id)
+            processed.checksums = result["checksums"]
+            processed.scan_result = result["scan_result"]
+            processed.extracted_text = result["extracted_text"]
+            processed.preview = result["preview"]
+            processed.processing_status = "ready" if result["scan_result"] == "clean" else "quarantined"
+            done = session.get(Job, job_id)
+            done.status = "done"
+            done.finished_at = datetime.now()
+            return as_dict(processed)
+        
+        submission = await run_write(db, record_result)
+        publish_submission_event(state, "submission_processed", course_id, submission)
+
+# Server-sent events: writes publish here after commit, so pages subscribe
+# once instead of polling the list endpoints
+EVENT_KEEPALIVE = 15  # seconds between comment lines on an idle stream
+EVENT_RETRY = 3000  # ms, client reconnect delay
+
+def event_topics(course_id: int, assignment_id: int):
+    return (f"course:{course_id}", f"assignment:{assignment_id}")
+
+def publish_submission_event(state: State, event: str, course_id: int, submission: dict, **extra):
+    state.event_hub.publish(event_topics(course_id, submission["assignment_id"]), event, {
+        "submission_id": submission["id"],
+        "assignment_id": submission["assignment_id"],
+        "student_id": submission["student_id"],
+        "file_name": submission["file_name"],
+        "status": submission["status"],
+        "processing_status": submission["processing_status"],
+        **extra,
+    })
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything that touches the disk or the database is opened here, once per worker
+    state = app.state
+    settings = state.settings
+    state.database = database = Database(settings)
+    pending = await run_in_threadpool(database.pending_migrations) if settings.is_sqlite else []
+    if pending:
+        await database.dispose()
+        raise RuntimeError(f"Database schema is out of date (migrations {pending} not applied), "
+                           f"run `python main.py migrate`")
+    settings.upload_dir.mkdir(exist_ok=True)
+    state.storage = SubmissionStorage(settings.upload_dir)
+    if database.write_engine is not None:
+        state.write_queue.start(database.write_sessionmaker(info={"state": state}))
+    await state.job_queue.start()
+    try:
+        yield
     finally:
-        db.close()
+        await state.job_queue.stop()
+        await run_in_threadpool(state.write_queue.stop)
+        await database.dispose()
+
+# Conditional GET for list endpoints. Writes bump the versions of the resources
+# they touch in the database (triggers, see response_cache.py), so an unchanged
+# list is answered with 304 after one primary-key lookup instead of its query.
+async def cached_response(request: Request, db: AsyncSession, key: tuple, resources: tuple, render):
+    # render() is only awaited on a cache miss and returns the JSON body and its
+    # headers (the next page cursor), which are cached together. It runs in the
+    # same read transaction as the version lookup, so it never sees older data
+    response_cache = request.app.state.response_cache
+    versions = (await db.execute(
+        select(cache_versions.c.resource, cache_versions.c.version).where(cache_versions.c.resource.in_(resources))
+    )).all()
+    etag = response_etag(key, dict(versions))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    page = response_cache.get(key, etag)
+    if page is None:
+        page = await render()
+        response_cache.put(key, etag, page)
+    body, page_header = page
+    return json_bytes_response(body, headers={**headers, **page_header})
+
+async def render_page(adapter, db: AsyncSession, list_rows, limit: int):
+    # One row more than the page tells whether there is a next one (pagination.py)
+    rows, next_cursor = split_page(await with_repository(db, lambda repo: list_rows(repo, limit + 1)), limit)
+    return dump_rows(adapter, rows), page_headers(next_cursor)
 
 # Security functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt runs on the dedicated password_hasher pool, not in the request thread
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
-def authenticate_user(db, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await with_repository(db, lambda repo: repo.get_user_by_username(username))
+    if not user or not await verify_password(password, user["hashed_password"]):
         return False
     return user
 
@@ -215,7 +423,19 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def create_user_token(user: dict):
+    return create_access_token(data={"sub": user["username"], "id": user["id"], "role": user["role"],
+                                     "ver": user["version"]})
+
+def attach_cached_user(db: AsyncSession, values: dict):
+    # Rebuild the row as a persistent object of this session without a SELECT
+    user = User(**values)
+    make_transient_to_detached(user)
+    db.add(user)
+    return user
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -224,212 +444,686 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = db.query(User).filter(User.username == username).first()
+    user_id = payload.get("id")
+    version = payload.get("ver")
+    user_cache = request.app.state.user_cache
+    if user_id is not None:
+        cached = user_cache.get(user_id)
+        if cached is not None and cached["version"] == version:
+            return attach_cached_user(db, cached)
+    
+    user = await with_repository(db, lambda repo: repo.get_user_by_username(username))
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    # The user changed since the token was issued (e.g. new role) - log in again
+    if version is not None and user["version"] != version:
+        raise HTTPException(status_code=401, detail="Token is outdated")
+    user_cache.put(user["id"], user)
+    return attach_cached_user(db, user)
 
 # Routes
-@app.post("/api/auth/register", response_model=UserOut)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(
-        (User.username == user.username) | (User.email == user.email)
-    ).first()
-    if existing:
+@router.post("/api/auth/register", response_model=UserOut)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    if await with_repository(db, lambda repo: repo.user_exists(user.username, user.email)):
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
-    db_user = User(
+    hashed_password = await get_password_hash(user.password)
+    db_user = await with_repository(db, lambda repo: repo.create_user(
         email=user.email,
         username=user.username,
         full_name=user.full_name,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
         role=user.role,
         group=user.group
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    ))
+    await db.commit()
     return db_user
 
-@app.post("/api/auth/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+@router.post("/api/auth/login", response_model=Token)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/api/users/me", response_model=UserOut)
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return render_metrics()
+
+@router.get("/api/users/me", response_model=UserOut)
 def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
-@app.get("/api/courses", response_model=list[CourseOut])
-def get_courses(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    if current_user.role == "teacher":
-        courses = db.query(Course).filter(Course.teacher_id == current_user.id).all()
-    elif current_user.role == "student":
-        courses = current_user.enrolled_courses
-    else:
-        courses = db.query(Course).all()
-    
-    result = []
-    for course in courses:
-        course_dict = {
-            "id": course.id,
-            "name": course.name,
-            "code": course.code,
-            "description": course.description,
-            "teacher_id": course.teacher_id,
-            "academic_year": course.academic_year,
-            "semester": course.semester,
-            "students_count": len(course.students)
-        }
-        result.append(course_dict)
-    return result
-
-@app.post("/api/courses", response_model=CourseOut)
-def create_course(course: CourseCreate, db: Session = Depends(get_db), 
+@router.get("/api/courses", response_model=list[CourseOut])
+async def get_courses(request: Request, academic_year: Optional[str] = None, semester: Optional[int] = None,
+                      cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      db: AsyncSession = Depends(get_db),
+                      current_user: User = Depends(get_current_user)):
+    after_id = decode_cursor(cursor)
+    user_id, role = current_user.id, current_user.role
+    return await cached_response(
+        request, db, ("courses", user_id, role, current_user.version, academic_year, semester, after_id, limit),
+        ("courses",),
+        lambda: render_page(COURSE_LIST, db, lambda repo, rows: repo.list_courses(
+            user_id, role, academic_year=academic_year, semester=semester, after_id=after_id, limit=rows,
+        ), limit),
+    )
+
+@router.post("/api/courses", response_model=CourseOut)
+async def create_course(course: CourseCreate, db: AsyncSession = Depends(get_db),
                   current_user: User = Depends(get_current_user)):
     if current_user.role not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    db_course = Course(
+    teacher_id = current_user.id
+    db_course = await with_repository(db, lambda repo: repo.create_course(
+        teacher_id=teacher_id,
         name=course.name,
         code=course.code,
         description=course.description,
-        teacher_id=current_user.id,
         academic_year=course.academic_year,
         semester=course.semester
-    )
-    db.add(db_course)
-    db.commit()
-    db.refresh(db_course)
+    ))
+    await db.commit()
     return db_course
 
-@app.post("/api/courses/{course_id}/enroll")
-def enroll_course(course_id: int, db: Session = Depends(get_db), 
-                  current_user: User = Depends(get_current_user)):
+@router.post("/api/courses/{course_id}/enroll")
+async def enroll_course(course_id: int, db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(get_current_user)):
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can enroll")
     
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
+    if not await with_repository(db, lambda repo: repo.get_course(course_id)):
         raise HTTPException(status_code=404, detail="Course not found")
     
-    if current_user not in course.students:
-        course.students.append(current_user)
-        db.commit()
+    student_id = current_user.id
+    await run_write(db, lambda session: repository(session).enroll(course_id, [student_id]))
     
     return {"message": "Enrolled successfully"}
 
-@app.get("/api/assignments/course/{course_id}", response_model=list[AssignmentOut])
-def get_course_assignments(course_id: int, db: Session = Depends(get_db),
-                          current_user: User = Depends(get_current_user)):
-    assignments = db.query(Assignment).filter(Assignment.course_id == course_id).all()
-    return assignments
-
-@app.post("/api/assignments", response_model=AssignmentOut)
-def create_assignment(assignment: AssignmentCreate, db: Session = Depends(get_db),
-                     current_user: User = Depends(get_current_user)):
-    course = db.query(Course).filter(Course.id == assignment.course_id).first()
-    if not course or course.teacher_id != current_user.id:
+def parse_enrollment_csv(text: str) -> BulkEnrollment:
+    # Header row with a "username" and/or "group" column; other columns are ignored
+    reader = csv.DictReader(io.StringIO(text))
+    columns = {name.strip().lower(): name for name in reader.fieldnames or []}
+    if "username" not in columns and "group" not in columns:
+        raise HTTPException(status_code=400, detail="CSV needs a 'username' or 'group' column")
+    usernames, groups = [], []
+    for row in reader:
+        if "username" in columns and (row.get(columns["username"]) or "").strip():
+            usernames.append(row[columns["username"]].strip())
+        if "group" in columns and (row.get(columns["group"]) or "").strip():
+            groups.append(row[columns["group"]].strip())
+    return BulkEnrollment(usernames=usernames, groups=groups)
+
+async def read_limited_body(request: Request, max_size: int) -> bytes:
+    # A body over max_size is rejected on its Content-Length, or else as soon
+    # as the chunks read so far pass the limit - it is never held in memory whole
+    too_large = HTTPException(status_code=413, detail=f"Body exceeds {max_size} bytes")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_size:
+            raise too_large
+    return bytes(body)
+
+@router.post("/api/courses/{course_id}/enroll/bulk")
+async def enroll_course_bulk(course_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(get_current_user)):
+    # Body: {"usernames": [...], "groups": [...]} or text/csv with a username/group column
+    course = await with_repository(db, lambda repo: repo.get_course(course_id))
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if current_user.role != "admin" and course["teacher_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    db_assignment = Assignment(
+    body = await read_limited_body(request, MAX_BULK_ENROLLMENT_BYTES)
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            payload = parse_enrollment_csv(body.decode("utf-8-sig"))
+        else:
+            payload = BulkEnrollment.model_validate_json(body)
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid enrollment list: {e}")
+    usernames, groups = set(payload.usernames), set(payload.groups)
+    if len(usernames) + len(groups) > MAX_BULK_ENROLLMENT:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ENROLLMENT} usernames and groups per request")
+    
+    # Every name and group resolved in one query
+    users = (await db.execute(
+        select(User.id, User.username, User.role, User.group)
+        .where((User.username.in_(usernames)) | ((User.group.in_(groups)) & (User.role == "student")))
+    )).all()
+    students = {user.id for user in users if user.role == "student"}
+    found_usernames = {user.username for user in users}
+    found_groups = {user.group for user in users if user.role == "student"}
+    
+    enrolled = 0
+    if students:
+        enrolled = await run_write(db, lambda session: repository(session).enroll(course_id, sorted(students)))
+    
+    return {
+        "enrolled": enrolled,
+        "already_enrolled": len(students) - enrolled,
+        "unknown_usernames": sorted(usernames - found_usernames),
+        "unknown_groups": sorted(groups - found_groups),
+        "not_students": sorted(user.username for user in users if user.role != "student"),
+    }
+
+GRADEBOOK_BATCH = 500  # rows fetched from the cursor at a time
+
+def gradebook_query(course_id: int):
+    # Best grade of every (student, assignment) pair of the course, ordered by student
+    return (
+        select(User.id, User.full_name, User.group,
+               Assignment.id.label("assignment_id"), func.max(Grade.total_score).label("score"))
+        .select_from(course_students)
+        .join(User, User.id == course_students.c.student_id)
+        .outerjoin(Assignment, Assignment.course_id == course_students.c.course_id)
+        .outerjoin(Submission, (Submission.assignment_id == Assignment.id) & (Submission.student_id == User.id))
+        .outerjoin(Grade, Grade.submission_id == Submission.id)
+        .where(course_students.c.course_id == course_id)
+        .group_by(User.id, Assignment.id)
+        .order_by(User.id, Assignment.id)
+    )
+
+async def gradebook_rows(state: State, course_id: int, assignment_ids: List[int]):
+    # Pivots the ordered query result into one row per student; only the current
+    # student is kept in memory. Opens its own session because the response
+    # is streamed after the route has returned.
+    async with open_session(state) as db:
+        result = await db.stream(gradebook_query(course_id))
+        student = None
+        async for rows in result.partitions(GRADEBOOK_BATCH):
+            for student_id, full_name, group, assignment_id, score in rows:
+                if student is None or student["student_id"] != student_id:
+                    if student is not None:
+                        yield student
+                    student = {"student_id": student_id, "student_name": full_name, "group": group,
+                               "scores": dict.fromkeys(assignment_ids)}
+                if assignment_id is not None:
+                    student["scores"][assignment_id] = score
+        if student is not None:
+            yield student
+
+def gradebook_total(student: dict):
+    return sum(score for score in student["scores"].values() if score is not None)
+
+async def gradebook_ndjson(state: State, course_id: int, assignments):
+    assignment_ids = [a.id for a in assignments]
+    yield json.dumps({"assignments": [{"id": a.id, "title": a.title, "max_score": a.max_score}
+                                      for a in assignments]}) + "\n"
+    async for student in gradebook_rows(state, course_id, assignment_ids):
+        student["total"] = gradebook_total(student)
+        yield json.dumps(student) + "\n"
+
+async def gradebook_csv(state: State, course_id: int, assignments):
+    assignment_ids = [a.id for a in assignments]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["student_id", "student_name", "group"] + [a.title for a in assignments] + ["total"])
+    async for student in gradebook_rows(state, course_id, assignment_ids):
+        writer.writerow([student["student_id"], student["student_name"], student["group"]]
+                        + [student["scores"][i] for i in assignment_ids] + [gradebook_total(student)])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@router.get("/api/courses/{course_id}/gradebook")
+async def get_gradebook(course_id: int, request: Request,
+                        format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                        db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(get_current_user)):
+    course = await db.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if current_user.role != "admin" and course.teacher_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    assignments = (await db.scalars(
+        select(Assignment).where(Assignment.course_id == course_id).order_by(Assignment.id)
+    )).all()
+    
+    if format == "csv":
+        return StreamingResponse(
+            gradebook_csv(request.app.state, course_id, assignments),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="gradebook_{course.code}.csv"'},
+        )
+    return StreamingResponse(gradebook_ndjson(request.app.state, course_id, assignments),
+                             media_type="application/x-ndjson")
+
+@router.get("/api/assignments/course/{course_id}", response_model=list[AssignmentOut])
+async def get_course_assignments(course_id: int, request: Request, deadline_from: Optional[datetime] = None,
+                                 deadline_to: Optional[datetime] = None, cursor: Optional[str] = None,
+                                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                 db: AsyncSession = Depends(get_db),
+                                 current_user: User = Depends(get_current_user)):
+    # deadline_from / deadline_to: assignments due in this window, both ends included
+    after_id = decode_cursor(cursor)
+    return await cached_response(
+        request, db, ("assignments", course_id, deadline_from, deadline_to, after_id, limit), (f"course:{course_id}",),
+        lambda: render_page(ASSIGNMENT_LIST, db, lambda repo, rows: repo.list_assignments(
+            course_id, deadline_from=deadline_from, deadline_to=deadline_to, after_id=after_id, limit=rows,
+        ), limit),
+    )
+
+@router.post("/api/assignments", response_model=AssignmentOut)
+async def create_assignment(assignment: AssignmentCreate, db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(get_current_user)):
+    course = await with_repository(db, lambda repo: repo.get_course(assignment.course_id))
+    if not course or course["teacher_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db_assignment = await with_repository(db, lambda repo: repo.create_assignment(
         course_id=assignment.course_id,
         title=assignment.title,
         description=assignment.description,
         max_score=assignment.max_score,
         criteria=[c.dict() for c in assignment.criteria],
-        deadline=assignment.deadline
-    )
-    db.add(db_assignment)
-    db.commit()
-    db.refresh(db_assignment)
+        deadline=assignment.deadline,
+        max_upload_size=assignment.max_upload_size
+    ))
+    await db.commit()
     return db_assignment
 
-@app.post("/api/submissions")
-async def upload_submission(
-    assignment_id: int = Form(...),
-    comment: str = Form(None),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
+def estimate_median(histogram, count, max_score, mean):
+    # The median of one or two grades is their mean. Otherwise it is estimated
+    # by linear interpolation inside the bucket that holds the middle grade,
+    # so it can be off by up to one bucket width (max_score / HISTOGRAM_BUCKETS)
+    if count <= 2:
+        return mean
+    width = (max_score or 0) / HISTOGRAM_BUCKETS
+    cumulative = 0
+    for i, bucket_count in enumerate(histogram):
+        if bucket_count and cumulative + bucket_count >= count / 2:
+            return width * (i + (count / 2 - cumulative) / bucket_count)
+        cumulative += bucket_count
+    return None
+
+@router.get("/api/assignments/{assignment_id}/stats", response_model=AssignmentStatsOut)
+async def get_assignment_stats_view(assignment_id: int, db: AsyncSession = Depends(get_db),
+                                    current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    assignment = await db.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    stats = await db.get(AssignmentStats, assignment_id) or AssignmentStats.empty(assignment_id)
+    histogram = [0] * HISTOGRAM_BUCKETS
+    for bucket, bucket_count in (await db.execute(
+        select(ScoreBucket.bucket, ScoreBucket.count).where(ScoreBucket.assignment_id == assignment_id)
+    )).all():
+        histogram[bucket] = bucket_count
+    criteria_sums = dict((await db.execute(
+        select(CriterionSum.criterion, CriterionSum.score_sum).where(CriterionSum.assignment_id == assignment_id)
+    )).all())
+    
+    count = stats.graded_count
+    mean = stats.score_sum / count if count else None
+    variance = max(stats.score_sq_sum / count - mean * mean, 0) if count else None
+    width = (assignment.max_score or 0) / HISTOGRAM_BUCKETS
+    return {
+        "assignment_id": assignment_id,
+        "submissions": stats.submission_count,
+        "graded": count,
+        "ungraded": stats.submission_count - count,
+        "mean": mean,
+        "stddev": variance ** 0.5 if count else None,
+        "median": estimate_median(histogram, count, assignment.max_score, mean) if count else None,
+        "histogram": [{"low": width * i, "high": width * (i + 1), "count": c} for i, c in enumerate(histogram)],
+        "criteria_means": {name: total / count for name, total in criteria_sums.items()} if count else {},
+    }
+
+# multipart/form-data with assignment_id, optional comment and then the file,
+# read from the request stream (uploads.py)
+@router.post("/api/submissions", openapi_extra=UPLOAD_FORM)
+async def upload_submission(request: Request, db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(get_current_user)):
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can submit")
     
+    assignment = None
+    
+    async def max_upload_size(fields):
+        # Called when the file part starts, before any of it is stored
+        nonlocal assignment
+        assignment_id = fields.get("assignment_id", "")
+        if not assignment_id.isdigit():
+            raise HTTPException(status_code=400, detail="assignment_id must be sent before the file")
+        assignment = await with_repository(db, lambda repo: repo.get_assignment(int(assignment_id)))
+        if not assignment:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+        request.app.state.job_queue.check_capacity()
+        return assignment["max_upload_size"] or DEFAULT_MAX_UPLOAD_SIZE
+    
     # Save file
-    file_path = UPLOAD_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        form = await receive_form(request, request.app.state.storage, "file", max_upload_size)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stored = form.stored
+    assignment_id = assignment["id"]
+    comment = form.fields.get("comment")
     
-    # Create submission
-    submission = Submission(
+    # Create submission; its processing job is queued in the same transaction
+    student_id = current_user.id
+    submission = await run_write(db, lambda session: repository(session).create_submission(
         assignment_id=assignment_id,
-        student_id=current_user.id,
-        file_path=str(file_path),
-        file_name=file.filename,
-        comment=comment
+        student_id=student_id,
+        file_path=str(stored.path),
+        file_name=form.file_name,
+        comment=comment,
+        file_sha256=stored.sha256,
+        file_size=stored.size
+    ))
+    request.app.state.job_queue.enqueue(submission["job_id"])
+    publish_submission_event(request.app.state, "submission", assignment["course_id"], submission,
+                             student_name=current_user.full_name, submitted_at=submission["submitted_at"])
+    
+    return {"message": "File uploaded successfully", "id": submission["id"],
+            "processing_status": submission["processing_status"]}
+
+@router.api_route("/api/submissions/{submission_id}/file", methods=["GET", "HEAD"])
+async def download_submission(submission_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                              current_user: User = Depends(get_current_user)):
+    row = (await db.execute(
+        select(Submission.student_id, Submission.file_path, Submission.file_name, Submission.file_sha256,
+               Submission.processing_status, Course.teacher_id)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .join(Course, Course.id == Assignment.course_id)
+        .where(Submission.id == submission_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    # The student who submitted, the course teacher and admins
+    if current_user.role != "admin" and current_user.id not in (row.student_id, row.teacher_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if row.processing_status == "quarantined":
+        raise HTTPException(status_code=403, detail="File is quarantined by the malware scan")
+    
+    stat = await run_in_threadpool(stat_file, row.file_path) if row.file_path else None
+    if stat is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    size, mtime = stat
+    # Stored files are content-addressed, so the sha256 is a strong validator
+    etag = f'"{row.file_sha256}"' if row.file_sha256 else f'"{size}-{int(mtime)}"'
+    return FileDownload(row.file_path, size, mtime, row.file_name or f"submission-{submission_id}", etag,
+                        request.headers)
+
+async def get_stream_user(request: Request, token: Optional[str] = Query(None),
+                          db: AsyncSession = Depends(get_db)):
+    # EventSource cannot send an Authorization header, so the token may also come as ?token=
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_current_user(request, token=token, db=db)
+
+async def event_stream(event_hub: EventHub, topics, accept, last_event_id: Optional[int]):
+    # Subscribing and reading the replay buffer happen with no await in between,
+    # so an event is neither lost nor sent twice on reconnect
+    subscription = event_hub.subscribe(topics, accept)
+    try:
+        yield f"retry: {EVENT_RETRY}\n\n"
+        if last_event_id is not None:
+            missed = event_hub.missed(subscription, last_event_id)
+            if missed is None:
+                yield "event: reset\ndata: {}\n\n"  # events were lost - reload the lists
+            else:
+                for message in missed:
+                    yield format_event(message)
+        while not (subscription.overflowed and subscription.queue.empty()):
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), EVENT_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(message)
+    finally:
+        event_hub.unsubscribe(subscription)
+
+async def subscribe_course_events(request: Request, db: AsyncSession, current_user: User, course_id: int, topics):
+    course = await db.get(Course, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    staff = current_user.role == "admin" or course.teacher_id == current_user.id
+    if not staff:
+        enrolled = await db.scalar(select(course_students.c.course_id).where(
+            course_students.c.course_id == course_id,
+            course_students.c.student_id == current_user.id
+        ))
+        if enrolled is None:
+            raise HTTPException(status_code=403, detail="Not authorized")
+    # The stream can stay open for hours - do not hold a connection for it
+    await db.close()
+    
+    # Students only see events about their own submissions
+    user_id = current_user.id
+    accept = (lambda data: True) if staff else (lambda data: data["student_id"] == user_id)
+    last_event_id = request.headers.get("last-event-id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    return StreamingResponse(
+        event_stream(request.app.state.event_hub, topics, accept, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    db.add(submission)
-    db.commit()
-    
-    return {"message": "File uploaded successfully", "id": submission.id}
-
-@app.get("/api/submissions/assignment/{assignment_id}")
-def get_submissions(assignment_id: int, db: Session = Depends(get_db),
-                   current_user: User = Depends(get_current_user)):
-    query = db.query(Submission).filter(Submission.assignment_id == assignment_id)
-    
-    if current_user.role == "student":
-        query = query.filter(Submission.student_id == current_user.id)
-    
-    submissions = query.all()
-    result = []
-    
-    for sub in submissions:
-        grade = db.query(Grade).filter(Grade.submission_id == sub.id).first()
-        result.append({
-            "id": sub.id,
-            "student_name": sub.student.full_name,
-            "file_name": sub.file_name,
-            "submitted_at": sub.submitted_at,
-            "status": sub.status,
-            "grade": grade.total_score if grade else None,
-            "feedback": grade.feedback if grade else None
-        })
+
+@router.get("/api/courses/{course_id}/events")
+async def course_events(course_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(get_stream_user)):
+    return await subscribe_course_events(request, db, current_user, course_id, (f"course:{course_id}",))
+
+@router.get("/api/assignments/{assignment_id}/events")
+async def assignment_events(assignment_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                            current_user: User = Depends(get_stream_user)):
+    assignment = await db.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    return await subscribe_course_events(request, db, current_user, assignment.course_id,
+                                         (f"assignment:{assignment_id}",))
+
+EXPORT_BATCH = 200  # submissions looked up per query while the archive streams
+
+async def submission_export_batches(state: State, assignment_id: int):
+    # Keyset batches with a short session each, so no read transaction stays
+    # open while gigabytes of files are being sent
+    after_id = 0
+    while True:
+        async with open_session(state) as db:
+            rows = (await db.execute(
+                select(Submission.id, Submission.file_path, Submission.file_name, Submission.submitted_at,
+                       Submission.processing_status, User.username, User.full_name)
+                .join(User, User.id == Submission.student_id)
+                .where(Submission.assignment_id == assignment_id, Submission.id > after_id)
+                .order_by(Submission.id)
+                .limit(EXPORT_BATCH)
+            )).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+async def submission_archive(state: State, assignment_id: int):
+    # <student name> (<username>)/<submission id>_<file name>; skipped files are listed in SKIPPED.txt
+    archive = ZipStream()
+    skipped = []
+    async for rows in submission_export_batches(state, assignment_id):
+        for row in rows:
+            if row.processing_status == "quarantined":
+                skipped.append(f"{row.id}\t{row.username}\t{row.file_name}\tquarantined")
+                continue
+            if not row.file_path or await run_in_threadpool(stat_file, row.file_path) is None:
+                skipped.append(f"{row.id}\t{row.username}\t{row.file_name}\tfile missing")
+                continue
+            folder = safe_name(f"{row.full_name} ({row.username})" if row.full_name else row.username, "student")
+            arcname = f"{folder}/{row.id}_{safe_name(row.file_name)}"
+            async for chunk in iterate_in_threadpool(archive.add_file(row.file_path, arcname, row.submitted_at)):
+                if chunk:
+                    yield chunk
+    if skipped:
+        yield await run_in_threadpool(archive.add_text, "SKIPPED.txt", "\n".join(skipped) + "\n")
+    yield await run_in_threadpool(archive.finish)
+
+@router.get("/api/assignments/{assignment_id}/submissions.zip")
+async def export_submissions(assignment_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(get_current_user)):
+    assignment = await db.get(Assignment, assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    course = await db.get(Course, assignment.course_id)
+    if current_user.role != "admin" and (course is None or course.teacher_id != current_user.id):
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    return result
+    return StreamingResponse(
+        submission_archive(request.app.state, assignment_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="assignment_{assignment_id}_submissions.zip"'},
+    )
+
+@router.get("/api/submissions/assignment/{assignment_id}", response_model=List[SubmissionOut])
+async def get_submissions(assignment_id: int, status: Optional[str] = None, group: Optional[str] = None,
+                          cursor: Optional[str] = None,
+                          limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          after_id: Optional[int] = Query(None, include_in_schema=False),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(get_current_user)):
+    # group: the students' group; after_id is the raw id cursor of older clients
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+    # Students only see their own submissions
+    student_id = current_user.id if current_user.role == "student" else None
+    body, headers = await render_page(SUBMISSION_LIST, db, lambda repo, rows: repo.list_submissions(
+        assignment_id, student_id, status=status, group=group, after_id=after_id, limit=rows,
+    ), limit)
+    return json_bytes_response(body, headers=headers)
 
-@app.post("/api/grades")
-def create_grade(grade_data: GradeCreate, db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+@router.post("/api/grades")
+async def create_grade(grade_data: GradeCreate, request: Request, db: AsyncSession = Depends(get_db),
+                       current_user: User = Depends(get_current_user)):
     if current_user.role not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    submission = db.query(Submission).filter(Submission.id == grade_data.submission_id).first()
+    submission = await with_repository(db, lambda repo: repo.get_submission(grade_data.submission_id))
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
+    course_id = (await with_repository(db, lambda repo: repo.get_assignment(submission["assignment_id"])))["course_id"]
     
-    total_score = sum(grade_data.scores.values())
+    # One grade per submission - regrading replaces the previous grade
+    grader_id = current_user.id
+    try:
+        grade = await run_write(db, lambda session: repository(session).save_grade(
+            grade_data.submission_id, grader_id, grade_data.scores, grade_data.feedback
+        ))
+    except InvalidGrade as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    publish_submission_event(request.app.state, "grade", course_id, {**submission, "status": "graded"},
+                             total_score=grade["total_score"], feedback=grade["feedback"], graded_at=grade["graded_at"])
     
-    grade = Grade(
-        submission_id=grade_data.submission_id,
-        grader_id=current_user.id,
-        scores=grade_data.scores,
-        total_score=total_score,
-        feedback=grade_data.feedback
-    )
+    return {"message": "Grade saved", "total_score": grade["total_score"]}
+
+@router.post("/api/grades/batch")
+async def create_grades_batch(grades: List[GradeCreate], request: Request, db: AsyncSession = Depends(get_db),
+                              current_user: User = Depends(get_current_user)):
+    if current_user.role not in ["teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if len(grades) > MAX_GRADE_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_GRADE_BATCH} grades per batch")
+    
+    # Lookups, validation, grades, status changes and statistics are one write
+    # (repository save_grades), so nothing can change between reading and writing
+    grader_id = current_user.id
+    rows = [grade.dict() for grade in grades]
+    saved = await run_write(db, lambda session: repository(session).save_grades(grader_id, rows)) if rows else []
+    
+    results = []
+    for result in saved:
+        if result["status"] != "ok":
+            results.append(result)
+            continue
+        results.append({"submission_id": result["submission_id"], "status": "ok", "total_score": result["total_score"]})
+        request.app.state.event_hub.publish(event_topics(result["course_id"], result["assignment_id"]), "grade", {
+            "submission_id": result["submission_id"],
+            "assignment_id": result["assignment_id"],
+            "student_id": result["student_id"],
+            "file_name": result["file_name"],
+            "status": "graded",
+            "total_score": result["total_score"],
+            "feedback": result["feedback"],
+            "graded_at": result["graded_at"],
+        })
     
-    submission.status = "graded"
+    return results
+
+@router.get("/api/search", response_model=SearchResults)
+async def search_view(q: str = Query(..., min_length=1, max_length=200),
+                      scope: str = Query("all", pattern="^(all|assignments|submissions)$"),
+                      course_id: Optional[int] = None, academic_year: Optional[str] = None,
+                      limit: int = Query(20, ge=1, le=100),
+                      db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    # Ranked full-text search (search.py) over what the user can see
+    results = {"assignments": [], "submissions": []}
+    match = fts_query(q)
+    if match is None:
+        return results
+    user_id, role = current_user.id, current_user.role
+    
+    def run(repo):
+        if scope != "submissions":
+            results["assignments"] = repo.search_assignments(match, user_id, role, course_id, academic_year, limit)
+        if scope != "assignments":
+            results["submissions"] = repo.search_submissions(match, user_id, role, course_id, academic_year, limit)
+        return results
+    
+    return await with_repository(db, run)
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    # Builds the app without opening anything; the lifespan handler does that
+    app = FastAPI(title="EduGrader", default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.settings = settings or Settings.from_env()
+    app.state.user_cache = UserCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+    app.state.response_cache = ResponseCache()
+    app.state.event_hub = EventHub()
+    app.state.write_queue = WriteQueue(max_batch=WRITE_BATCH)
+    app.state.job_queue = JobQueue(partial(run_job, app.state), partial(pending_jobs, app.state),
+                                   workers=JOB_WORKERS, max_depth=JOB_MAX_DEPTH)
     
-    db.add(grade)
-    db.commit()
+    # CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
+    )
+    
+    # Query count, SQL time and latency per route, exported on /metrics
+    app.add_middleware(QueryMetricsMiddleware, query_budget=app.state.settings.query_budget)
     
-    return {"message": "Grade saved", "total_score": total_score}
+    app.add_exception_handler(HashPoolBusy, hash_pool_busy_handler)
+    app.add_exception_handler(JobQueueFull, job_queue_full_handler)
+    app.include_router(router)
+    return app
+
+# uvicorn main:app, or uvicorn --factory main:create_app
+app = create_app()
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if sys.argv[1:] == ["migrate"]:
+        applied = migrate()
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+    else:
+        uvicorn.run("main:create_app", factory=True, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,15 +1,27 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timedelta
 import sqlite3
+import threading
 import os
 import shutil
 import json
 import hashlib
-from pathlib import Path
 import jwt
-from typing import Optional, List, Dict
-from pydantic import BaseModel, EmailStr
+from typing import Optional, List
+from pathlib import Path
+from migrations import migrate
+from repository import InvalidGrade
+from repository_sql import SqlRepository
+from schemas import (
+    UserCreate, UserOut, UserLogin, Token, CourseCreate, CourseOut, AssignmentCreate, AssignmentOut,
+    SubmissionOut, GradeCreate, SearchResults,
+)
+from search import fts_query
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, split_page, page_headers
+from storage import SubmissionStorage, UploadTooLarge, DEFAULT_MAX_UPLOAD_SIZE
+from uploads import UPLOAD_FORM, InvalidUpload, receive_form
 
 # Security
 SECRET_KEY = "your-secret-key-here"
@@ -23,19 +35,40 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
 
-# Create upload directory
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
 # Database setup
 DB_PATH = "edugrader.db"
+UPLOAD_DIR = Path("uploads")  # тот же каталог, что settings.upload_dir в main.py
+STATEMENT_CACHE_SIZE = 256  # подготовленные запросы, кешируются sqlite3 на соединение
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # читатели не блокируют писателя
+    "PRAGMA synchronous=NORMAL",  # в режиме WAL безопасно и намного быстрее FULL
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",  # 64 MB
+    "PRAGMA busy_timeout=5000",  # ждать блокировку до 5 секунд вместо ошибки
+)
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+_local = threading.local()
+
+def open_db():
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-# Initialize database
+# Одно соединение на поток: открывается при первом обращении и дальше
+# переиспользуется всеми запросами этого потока, поэтому закрывать его не нужно
+def get_db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = open_db()
+    elif conn.in_transaction:
+        # незавершенная транзакция после упавшего запроса
+        conn.rollback()
+    return conn
+
+# Создание таблиц и миграции: python main_simple.py migrate
+# (при импорте модуль базу не трогает)
 def init_db():
     conn = get_db()
     cursor = conn.cursor()
@@ -119,75 +152,9 @@ def init_db():
     ''')
     
     conn.commit()
-    conn.close()
-
-init_db()
-
-# Pydantic schemas
-class UserCreate(BaseModel):
-    email: EmailStr
-    username: str
-    full_name: str
-    password: str
-    role: str = "student"
-
-class UserOut(BaseModel):
-    id: int
-    email: str
-    username: str
-    full_name: str
-    role: str
-
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-class LoginRequest(BaseModel):
-    username: str
-    password: str
-
-class CourseCreate(BaseModel):
-    name: str
-    code: str
-    description: Optional[str] = None
-    academic_year: str
-    semester: int
-
-class CourseOut(BaseModel):
-    id: int
-    name: str
-    code: str
-    description: Optional[str]
-    teacher_id: int
-    academic_year: str
-    semester: int
-    students_count: int = 0
-
-class Criteria(BaseModel):
-    name: str
-    max_score: float
-
-class AssignmentCreate(BaseModel):
-    course_id: int
-    title: str
-    description: Optional[str] = None
-    max_score: float = 100
-    criteria: List[Criteria]
-    deadline: datetime
-
-class AssignmentOut(BaseModel):
-    id: int
-    course_id: int
-    title: str
-    description: Optional[str]
-    max_score: float
-    criteria: List[Dict]
-    deadline: datetime
-
-class GradeCreate(BaseModel):
-    submission_id: int
-    scores: Dict[str, float]
-    feedback: str
+    
+    # Индексы и новые колонки добавляются версионными миграциями
+    migrate(conn)
 
 # App initialization
 app = FastAPI(title="EduGrader")
@@ -199,8 +166,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Файлы работ: каталог создается при первой загрузке, а не при импорте
+_storage: Optional[SubmissionStorage] = None
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = SubmissionStorage(UPLOAD_DIR)
+    return _storage
+
 # Security functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -215,45 +192,53 @@ def verify_token(token: str):
     except jwt.PyJWTError:
         return None
 
+# Все запросы к базе - через SqlRepository (repository_sql.py), тот же код, что
+# у main.py с EDUGRADER_REPOSITORY=sql. Репозиторий не делает commit: роут
+# коммитит сам, на том же соединении потока
+def get_repository(conn: sqlite3.Connection):
+    return SqlRepository.from_sqlite3(conn)
+
 def get_user_by_username(username: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
-    return dict(user) if user else None
+    return get_repository(get_db()).get_user_by_username(username)
+
+def get_user_from_token(token: str):
+    payload = verify_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    username = payload.get("sub")
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user = get_user_by_username(username)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
 # Routes
 @app.post("/api/auth/register", response_model=UserOut)
 def register(user: UserCreate, request: Request = None):
     conn = get_db()
-    cursor = conn.cursor()
+    repo = get_repository(conn)
     
     # Check if user exists
-    cursor.execute("SELECT id FROM users WHERE username = ? OR email = ?", 
-                  (user.username, user.email))
-    if cursor.fetchone():
-        conn.close()
+    if repo.user_exists(user.username, user.email):
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
-    # Create user - без group_name
-    cursor.execute('''
-        INSERT INTO users (email, username, full_name, hashed_password, role)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (user.email, user.username, user.full_name, 
-          get_password_hash(user.password), user.role))
-    
+    new_user = repo.create_user(
+        email=user.email,
+        username=user.username,
+        full_name=user.full_name,
+        hashed_password=get_password_hash(user.password),
+        role=user.role,
+        group=user.group,
+    )
     conn.commit()
-    user_id = cursor.lastrowid
-    
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    new_user = cursor.fetchone()
-    conn.close()
     
-    return dict(new_user)
+    return new_user
 
 @app.post("/api/auth/login", response_model=Token)
-def login(request: LoginRequest):
+def login(request: UserLogin):
     user = get_user_by_username(request.username)
     
     if not user or not verify_password(request.password, user['hashed_password']):
@@ -264,131 +249,217 @@ def login(request: LoginRequest):
 
 @app.get("/api/users/me", response_model=UserOut)
 def get_current_user_info(token: str):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = get_user_by_username(username)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    return user
+    return get_user_from_token(token)
 
 @app.get("/api/courses", response_model=list[CourseOut])
-def get_courses(token: str):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = get_user_by_username(username)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    if user['role'] == "teacher":
-        cursor.execute("SELECT * FROM courses WHERE teacher_id = ?", (user['id'],))
-    elif user['role'] == "student":
-        cursor.execute('''
-            SELECT c.* FROM courses c
-            JOIN course_students cs ON c.id = cs.course_id
-            WHERE cs.student_id = ?
-        ''', (user['id'],))
-    else:
-        cursor.execute("SELECT * FROM courses")
-    
-    courses = cursor.fetchall()
-    result = []
-    
-    for course in courses:
-        cursor.execute("SELECT COUNT(*) as count FROM course_students WHERE course_id = ?", 
-                      (course['id'],))
-        count = cursor.fetchone()['count']
-        
-        course_dict = dict(course)
-        course_dict['students_count'] = count
-        result.append(course_dict)
-    
-    conn.close()
-    return result
+def get_courses(token: str, response: Response, academic_year: Optional[str] = None, semester: Optional[int] = None,
+                cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    user = get_user_from_token(token)
+    
+    # Количество студентов считается по индексу только для курсов этой страницы
+    rows = get_repository(get_db()).list_courses(
+        user['id'], user['role'], academic_year=academic_year, semester=semester,
+        after_id=decode_cursor(cursor), limit=limit + 1,
+    )
+    return send_page(response, rows, limit)
+
+def send_page(response: Response, rows, limit):
+    # Запрошено на одну строку больше: она только показывает, что есть следующая страница
+    rows, next_cursor = split_page(rows, limit)
+    response.headers.update(page_headers(next_cursor))
+    return rows
 
 @app.post("/api/courses", response_model=CourseOut)
 def create_course(course: CourseCreate, token: str):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = get_user_by_username(username)
-    if not user or user['role'] not in ["teacher", "admin"]:
+    user = get_user_from_token(token)
+    if user['role'] not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
     conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO courses (name, code, description, teacher_id, academic_year, semester)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (course.name, course.code, course.description, 
-          user['id'], course.academic_year, course.semester))
-    
+    new_course = get_repository(conn).create_course(
+        teacher_id=user['id'],
+        name=course.name,
+        code=course.code,
+        description=course.description,
+        academic_year=course.academic_year,
+        semester=course.semester,
+    )
     conn.commit()
-    course_id = cursor.lastrowid
-    
-    cursor.execute("SELECT * FROM courses WHERE id = ?", (course_id,))
-    new_course = cursor.fetchone()
-    conn.close()
     
-    result = dict(new_course)
-    result['students_count'] = 0
-    return result
+    return new_course
 
 @app.post("/api/courses/{course_id}/enroll")
 def enroll_course(course_id: int, token: str):
-    payload = verify_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    username = payload.get("sub")
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = get_user_by_username(username)
-    if not user or user['role'] != "student":
+    user = get_user_from_token(token)
+    if user['role'] != "student":
         raise HTTPException(status_code=403, detail="Only students can enroll")
     
+    # Одна запись без предварительного SELECT: транзакция сразу пишущая, поэтому
+    # при нескольких воркерах она ждет busy_timeout, а не падает с "database is locked"
     conn = get_db()
-    cursor = conn.cursor()
+    get_repository(conn).enroll(course_id, [user['id']])
+    conn.commit()
     
-    cursor.execute('''
-        SELECT * FROM course_students 
-        WHERE course_id = ? AND student_id = ?
-    ''', (course_id, user['id']))
-    
-    if not cursor.fetchone():
-        cursor.execute('''
-            INSERT INTO course_students (course_id, student_id)
-            VALUES (?, ?)
-        ''', (course_id, user['id']))
-        conn.commit()
-    
-    conn.close()
     return {"message": "Enrolled successfully"}
 
-# Остальные роуты (assignments, submissions, grades) можно добавить позже
+@app.get("/api/assignments/course/{course_id}", response_model=list[AssignmentOut])
+def get_course_assignments(course_id: int, token: str, response: Response,
+                           deadline_from: Optional[datetime] = None, deadline_to: Optional[datetime] = None,
+                           cursor: Optional[str] = None,
+                           limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    get_user_from_token(token)
+    # Задания со сроком сдачи в окне [deadline_from, deadline_to]
+    rows = get_repository(get_db()).list_assignments(
+        course_id, deadline_from=deadline_from, deadline_to=deadline_to,
+        after_id=decode_cursor(cursor), limit=limit + 1,
+    )
+    return send_page(response, rows, limit)
+
+@app.post("/api/assignments", response_model=AssignmentOut)
+def create_assignment(assignment: AssignmentCreate, token: str):
+    user = get_user_from_token(token)
+    
+    conn = get_db()
+    repo = get_repository(conn)
+    course = repo.get_course(assignment.course_id)
+    if not course or course['teacher_id'] != user['id']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Вместе с заданием создается пустая строка статистики
+    new_assignment = repo.create_assignment(
+        course_id=assignment.course_id,
+        title=assignment.title,
+        description=assignment.description,
+        max_score=assignment.max_score,
+        criteria=[c.dict() for c in assignment.criteria],
+        deadline=assignment.deadline,
+        max_upload_size=assignment.max_upload_size,
+    )
+    conn.commit()
+    
+    return new_assignment
+
+def find_upload_student(token: str):
+    user = get_user_from_token(token)
+    if user['role'] != "student":
+        raise HTTPException(status_code=403, detail="Only students can submit")
+    return user
+
+def find_assignment(assignment_id: int):
+    assignment = get_repository(get_db()).get_assignment(assignment_id)
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    return assignment
+
+def save_submission(**values):
+    conn = get_db()
+    submission = get_repository(conn).create_submission(**values)
+    conn.commit()
+    return submission
+
+# Асинхронный роут: тело multipart читается из потока запроса (uploads.py), файл
+# пишется в хранилище по мере получения и обрывается, как только превысит лимит
+# задания, - без промежуточного временного файла Starlette. Запросы к базе
+# выполняются в пуле потоков (соединение у каждого потока свое)
+@app.post("/api/submissions", openapi_extra=UPLOAD_FORM)
+async def upload_submission(token: str, request: Request):
+    user = await run_in_threadpool(find_upload_student, token)
+    assignment = None
+    
+    async def max_upload_size(fields):
+        # assignment_id должен идти в форме до файла
+        nonlocal assignment
+        assignment_id = fields.get("assignment_id", "")
+        if not assignment_id.isdigit():
+            raise HTTPException(status_code=400, detail="assignment_id must be sent before the file")
+        assignment = await run_in_threadpool(find_assignment, int(assignment_id))
+        return assignment['max_upload_size'] or DEFAULT_MAX_UPLOAD_SIZE
+    
+    try:
+        form = await receive_form(request, get_storage(), "file", max_upload_size)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stored = form.stored
+    
+    # Задача обработки файла ставится в очередь jobs в той же транзакции;
+    # выполняет ее воркер main.py
+    submission = await run_in_threadpool(
+        save_submission,
+        assignment_id=assignment['id'],
+        student_id=user['id'],
+        file_path=str(stored.path),
+        file_name=form.file_name,
+        comment=form.fields.get("comment"),
+        file_sha256=stored.sha256,
+        file_size=stored.size,
+    )
+    
+    return {"message": "File uploaded successfully", "id": submission['id'],
+            "processing_status": submission['processing_status']}
+
+@app.get("/api/submissions/assignment/{assignment_id}", response_model=List[SubmissionOut])
+def get_submissions(assignment_id: int, token: str, response: Response, status: Optional[str] = None,
+                    group: Optional[str] = None, cursor: Optional[str] = None,
+                    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    after_id: Optional[int] = Query(None, include_in_schema=False)):
+    user = get_user_from_token(token)
+    
+    # after_id - старый вариант курсора (id последней строки)
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+    # Студент видит только свои работы
+    student_id = user['id'] if user['role'] == "student" else None
+    rows = get_repository(get_db()).list_submissions(
+        assignment_id, student_id, status=status, group=group, after_id=after_id, limit=limit + 1,
+    )
+    return send_page(response, rows, limit)
+
+@app.post("/api/grades")
+def create_grade(grade_data: GradeCreate, token: str):
+    user = get_user_from_token(token)
+    if user['role'] not in ["teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    conn = get_db()
+    repo = get_repository(conn)
+    if not repo.get_submission(grade_data.submission_id):
+        raise HTTPException(status_code=404, detail="Submission not found")
+    
+    # Одна оценка на работу - повторная оценка заменяет предыдущую
+    try:
+        grade = repo.save_grade(grade_data.submission_id, user['id'], grade_data.scores, grade_data.feedback)
+    except InvalidGrade as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    conn.commit()
+    
+    return {"message": "Grade saved", "total_score": grade['total_score']}
+
+# Поиск по заданиям и комментариям/именам файлов работ (FTS5, см. search.py)
+@app.get("/api/search", response_model=SearchResults)
+def search_view(token: str, q: str = Query(..., min_length=1, max_length=200),
+                scope: str = Query("all", pattern="^(all|assignments|submissions)$"),
+                course_id: Optional[int] = None, academic_year: Optional[str] = None,
+                limit: int = Query(20, ge=1, le=100)):
+    user = get_user_from_token(token)
+    
+    results = {"assignments": [], "submissions": []}
+    match = fts_query(q)
+    if match is None:
+        return results
+    
+    repo = get_repository(get_db())
+    if scope != "submissions":
+        results["assignments"] = repo.search_assignments(match, user['id'], user['role'], course_id, academic_year, limit)
+    if scope != "assignments":
+        results["submissions"] = repo.search_submissions(match, user['id'], user['role'], course_id, academic_year, limit)
+    return results
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if sys.argv[1:] == ["migrate"]:
+        init_db()
+    else:
+        uvicorn.run("main_simple:app", host="0.0.0.0", port=8000, reload=True)
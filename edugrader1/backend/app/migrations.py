@@ -0,0 +1,361 @@
+import json
+import sqlite3
+import sys
+
+# Versioned schema migrations for the shared SQLite database.
+# The migrate command of each backend (python main.py migrate /
+# python main_simple.py migrate) creates the tables first (create_all /
+# init_db) and then calls migrate(), which applies every migration newer than
+# the recorded version; main.py only checks pending_migrations() on start.
+# Migrations must be idempotent: a fresh database already has the current
+# columns and indexes from the models.
+#
+#   python migrations.py [db_path]          apply pending migrations
+#   python migrations.py status [db_path]   show applied migrations
+#   python migrations.py check [db_path]    EXPLAIN QUERY PLAN of the repository's route
+#                                           queries, fails on any full scan (query_plans.py)
+
+DEFAULT_DB_PATH = "edugrader.db"
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def _add_column(conn, table, column, ddl):
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN {ddl}')
+
+
+def _has_unique_index(conn, table, columns):
+    for index in conn.execute(f'PRAGMA index_list("{table}")'):
+        name, unique = index[1], index[2]
+        if unique and [row[2] for row in conn.execute(f'PRAGMA index_info("{name}")')] == list(columns):
+            return True
+    return False
+
+
+def _delete_duplicates(conn, table, columns):
+    # Keeps the oldest row of every group
+    column_list = ", ".join(columns)
+    conn.execute(f'''
+        DELETE FROM "{table}" WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM "{table}" GROUP BY {column_list}
+        )
+    ''')
+
+
+def add_missing_columns(conn):
+    # Columns added after the first release; main_simple.py databases never had "group"
+    _add_column(conn, "users", "group", '"group" VARCHAR')
+    _add_column(conn, "users", "version", "version INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "assignments", "max_upload_size", "max_upload_size INTEGER")
+    _add_column(conn, "submissions", "file_sha256", "file_sha256 VARCHAR(64)")
+    _add_column(conn, "submissions", "file_size", "file_size INTEGER")
+
+
+def add_indexes(conn):
+    # Index names match the Index() declarations in main.py / models.py
+    if not _has_unique_index(conn, "course_students", ("course_id", "student_id")):
+        _delete_duplicates(conn, "course_students", ("course_id", "student_id"))
+        conn.execute("CREATE UNIQUE INDEX ux_course_students_course_id_student_id "
+                     "ON course_students (course_id, student_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_course_students_student_id_course_id "
+                 "ON course_students (student_id, course_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_courses_teacher_id ON courses (teacher_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_assignments_course_id_id ON assignments (course_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submissions_assignment_id_id "
+                 "ON submissions (assignment_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_submissions_student_id_assignment_id "
+                 "ON submissions (student_id, assignment_id)")
+    # One grade per submission: regrading updates the existing row
+    if not _has_unique_index(conn, "grades", ("submission_id",)):
+        _delete_duplicates(conn, "grades", ("submission_id",))
+        conn.execute("CREATE UNIQUE INDEX ux_grades_submission_id ON grades (submission_id)")
+
+
+def add_assignment_stats(conn):
+    # Same table as models.AssignmentStats. Databases created before migration 7
+    # also have the histogram/criteria_sums JSON columns, which are no longer
+    # read; the rows are filled by rebuild_assignment_stats() in migration 7
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assignment_stats (
+            assignment_id INTEGER NOT NULL PRIMARY KEY REFERENCES assignments (id),
+            submission_count INTEGER NOT NULL,
+            graded_count INTEGER NOT NULL,
+            score_sum FLOAT NOT NULL,
+            score_sq_sum FLOAT NOT NULL
+        )
+    ''')
+
+
+def rebuild_assignment_stats(conn):
+    # Recomputes every assignment's statistics from the submissions and grades
+    # (also used by benchmarks that bulk-load rows behind the routes' back)
+    for table in ("assignment_stats", "assignment_score_buckets", "assignment_criterion_sums"):
+        conn.execute(f"DELETE FROM {table}")
+
+    buckets = 10  # models.HISTOGRAM_BUCKETS when this was written
+    stats = {}
+    max_scores = {}
+    for assignment_id, max_score in conn.execute("SELECT id, max_score FROM assignments"):
+        max_scores[assignment_id] = max_score
+        stats[assignment_id] = {"submissions": 0, "graded": 0, "sum": 0.0, "sq_sum": 0.0,
+                                "histogram": {}, "criteria": {}}
+    for assignment_id, count in conn.execute(
+            "SELECT assignment_id, COUNT(*) FROM submissions GROUP BY assignment_id"):
+        if assignment_id in stats:
+            stats[assignment_id]["submissions"] = count
+    for assignment_id, total_score, scores in conn.execute('''
+        SELECT s.assignment_id, g.total_score, g.scores
+        FROM grades g JOIN submissions s ON s.id = g.submission_id
+    '''):
+        if assignment_id not in stats or total_score is None:
+            continue
+        row = stats[assignment_id]
+        max_score = max_scores[assignment_id]
+        row["graded"] += 1
+        row["sum"] += total_score
+        row["sq_sum"] += total_score * total_score
+        bucket = min(max(int(total_score / max_score * buckets), 0), buckets - 1) if max_score and max_score > 0 else 0
+        row["histogram"][bucket] = row["histogram"].get(bucket, 0) + 1
+        for name, value in json.loads(scores or "{}").items():
+            row["criteria"][name] = row["criteria"].get(name, 0) + value
+
+    conn.executemany(
+        "INSERT INTO assignment_stats (assignment_id, submission_count, graded_count, score_sum, score_sq_sum) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(assignment_id, row["submissions"], row["graded"], row["sum"], row["sq_sum"])
+         for assignment_id, row in stats.items()],
+    )
+    conn.executemany(
+        "INSERT INTO assignment_score_buckets (assignment_id, bucket, count) VALUES (?, ?, ?)",
+        [(assignment_id, bucket, count) for assignment_id, row in stats.items()
+         for bucket, count in row["histogram"].items()],
+    )
+    conn.executemany(
+        "INSERT INTO assignment_criterion_sums (assignment_id, criterion, score_sum) VALUES (?, ?, ?)",
+        [(assignment_id, name, total) for assignment_id, row in stats.items()
+         for name, total in row["criteria"].items()],
+    )
+
+
+def add_submission_processing(conn):
+    # Same columns/table as main.Submission and main.Job; existing uploads are
+    # queued for processing so they get text, previews and a scan result too
+    _add_column(conn, "submissions", "processing_status", "processing_status VARCHAR")
+    _add_column(conn, "submissions", "checksums", "checksums JSON")
+    _add_column(conn, "submissions", "extracted_text", "extracted_text TEXT")
+    _add_column(conn, "submissions", "preview", "preview TEXT")
+    _add_column(conn, "submissions", "scan_result", "scan_result VARCHAR")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER NOT NULL PRIMARY KEY,
+            kind VARCHAR NOT NULL,
+            submission_id INTEGER REFERENCES submissions (id),
+            status VARCHAR NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_id ON jobs (id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_id ON jobs (status, id)")
+    conn.execute('''
+        INSERT INTO jobs (kind, submission_id, status, attempts, created_at)
+        SELECT 'process_submission', id, 'queued', 0, CURRENT_TIMESTAMP FROM submissions
+        WHERE processing_status IS NULL AND file_path IS NOT NULL AND file_path != ''
+    ''')
+    conn.execute("UPDATE submissions SET processing_status = 'pending' WHERE processing_status IS NULL")
+
+
+def add_user_group_index(conn):
+    # Bulk enrollment resolves whole groups at once
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_users_group ON users ("group")')
+
+
+def _fts_index(conn, table, columns, weights):
+    # External-content FTS5 index of table(columns), kept in sync by triggers.
+    # rank = bm25 with the given column weights; prefix indexes serve the
+    # prefix match of the last search word (search.fts_query)
+    fts = f"{table}_fts"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    # Only updates of the indexed columns reindex the row
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    """)
+    conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")  # rows written before the triggers
+    conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')")
+
+
+def add_full_text_search(conn):
+    # Used by /api/search (search.py); a title match outranks a description match
+    _fts_index(conn, "assignments", ("title", "description"), (10.0, 1.0))
+    _fts_index(conn, "submissions", ("comment", "file_name"), (1.0, 2.0))
+    # Searches scoped to an academic year look its courses up by year
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_courses_academic_year_semester ON courses (academic_year, semester)")
+
+
+def split_assignment_stats(conn):
+    # The histogram and criteria sums move out of assignment_stats' JSON
+    # columns into rows that writers increment in place (models.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assignment_score_buckets (
+            assignment_id INTEGER NOT NULL REFERENCES assignments (id),
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (assignment_id, bucket)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assignment_criterion_sums (
+            assignment_id INTEGER NOT NULL REFERENCES assignments (id),
+            criterion VARCHAR NOT NULL,
+            score_sum FLOAT NOT NULL,
+            PRIMARY KEY (assignment_id, criterion)
+        )
+    ''')
+    rebuild_assignment_stats(conn)
+
+
+def _version_trigger(conn, name, event, table, resources):
+    # Trigger incrementing the cache_versions row of every resource (SQL expressions over new./old.)
+    bumps = "".join(f"""
+            INSERT INTO cache_versions (resource, version) VALUES ({resource}, 1)
+            ON CONFLICT (resource) DO UPDATE SET version = version + 1;""" for resource in resources)
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN{bumps}\n        END")
+
+
+def add_cache_versions(conn):
+    # Same table as models.cache_versions. The cached list responses of main.py
+    # (response_cache.py) depend on "courses" (course list with enrollment
+    # counts) and "course:<id>" (its assignments); every write to those tables
+    # bumps them in its own transaction, whichever process or backend sends it
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            resource VARCHAR NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        _version_trigger(conn, f"cache_courses_{event.lower()}", event, "courses", ("'courses'",))
+    for event in ("INSERT", "DELETE"):
+        _version_trigger(conn, f"cache_course_students_{event.lower()}", event, "course_students", ("'courses'",))
+    _version_trigger(conn, "cache_assignments_insert", "INSERT", "assignments", ("'course:' || new.course_id",))
+    _version_trigger(conn, "cache_assignments_update", "UPDATE", "assignments",
+                     ("'course:' || old.course_id", "'course:' || new.course_id"))
+    _version_trigger(conn, "cache_assignments_delete", "DELETE", "assignments", ("'course:' || old.course_id",))
+
+
+MIGRATIONS = [
+    (1, "add columns introduced after the first release", add_missing_columns),
+    (2, "indexes for list endpoints, unique enrollments and grades", add_indexes),
+    (3, "per-assignment grade statistics", add_assignment_stats),
+    (4, "background processing of submissions", add_submission_processing),
+    (5, "index users by group", add_user_group_index),
+    (6, "full-text search of assignments and submissions", add_full_text_search),
+    (7, "grade histogram and criteria sums as incremented rows", split_assignment_stats),
+    (8, "version counters of cached responses, bumped by triggers", add_cache_versions),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def pending_migrations(conn):
+    # Versions not applied yet; read-only, unlike current_version()
+    try:
+        applied = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    except sqlite3.OperationalError:
+        applied = 0  # never migrated
+    return [version for version, _, _ in MIGRATIONS if version > applied]
+
+
+def migrate(conn):
+    # conn is a sqlite3 connection; returns the versions that were applied
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have applied it while we waited for the lock
+            if version > conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]:
+                apply(conn)
+                conn.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                             (version, description))
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def migrate_engine(engine):
+    raw = engine.raw_connection()
+    try:
+        return migrate(raw.driver_connection)
+    finally:
+        raw.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args.pop(0) if args and args[0] in ("migrate", "status", "check") else "migrate"
+    conn = sqlite3.connect(args[0] if args else DEFAULT_DB_PATH)
+
+    if command == "migrate":
+        applied = migrate(conn)
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+    elif command == "status":
+        current_version(conn)
+        for version, description, applied_at in conn.execute(
+                "SELECT version, description, applied_at FROM schema_migrations ORDER BY version"):
+            print(f"{version:>3}  {applied_at}  {description}")
+    else:
+        pending = pending_migrations(conn)
+        if pending:
+            print(f"Migrations {pending} are not applied, run `python migrations.py migrate` first")
+            sys.exit(1)
+        from query_plans import check_calls, read_calls
+        from repository_sql import SqlRepository
+        calls = read_calls(SqlRepository.from_sqlite3(conn))
+        problems = check_calls(conn, calls)
+        for name, statements in problems.items():
+            for sql, scans in statements:
+                print(f"FULL SCAN in '{name}': {' / '.join(scans)}\n    {sql}")
+        print(f"{len(calls) - len(problems)}/{len(calls)} route queries use an index")
+        sys.exit(1 if problems else 0)
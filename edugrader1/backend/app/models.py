@@ -1,23 +1,35 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, JSON, Text, Boolean, Table
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, JSON, Text, Boolean, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
 from datetime import datetime
 import os
+from migrations import migrate_engine
 
-# Database setup
+# Models shared by main.py and the storage backends (repository_orm.py maps
+# them, repository_sql.py queries the same tables by hand). Importing this
+# module opens nothing.
 DATABASE_URL = "sqlite:///./edugrader.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Association table for courses and students
 course_students = Table(
     'course_students',
     Base.metadata,
-    Column('course_id', Integer, ForeignKey('courses.id')),
-    Column('student_id', Integer, ForeignKey('users.id'))
+    Column('course_id', Integer, ForeignKey('courses.id'), primary_key=True),
+    Column('student_id', Integer, ForeignKey('users.id'), primary_key=True),
+    Index('ix_course_students_student_id_course_id', 'student_id', 'course_id')
 )
 
+# Version of every cached resource ("courses", "course:<id>"), incremented by
+# triggers on the tables behind the cached lists (migrations.add_cache_versions)
+cache_versions = Table(
+    'cache_versions',
+    Base.metadata,
+    Column('resource', String, primary_key=True),
+    Column('version', Integer, nullable=False)
+)
+
+# Models
 class User(Base):
     __tablename__ = "users"
     
@@ -29,6 +41,9 @@ class User(Base):
     role = Column(String, default="student")  # admin, teacher, student
     group = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # bumped on every change
+    
+    __table_args__ = (Index('ix_users_group', 'group'),)
 
 class Course(Base):
     __tablename__ = "courses"
@@ -41,6 +56,11 @@ class Course(Base):
     academic_year = Column(String)
     semester = Column(Integer)
     
+    __table_args__ = (
+        Index('ix_courses_teacher_id', 'teacher_id'),
+        Index('ix_courses_academic_year_semester', 'academic_year', 'semester'),
+    )
+    
     teacher = relationship("User", foreign_keys=[teacher_id])
     students = relationship("User", secondary=course_students, backref="enrolled_courses")
     assignments = relationship("Assignment", back_populates="course")
@@ -55,6 +75,9 @@ class Assignment(Base):
     max_score = Column(Float, default=100)
     criteria = Column(JSON)  # [{"name": "criteria1", "max": 30}, ...]
     deadline = Column(DateTime)
+    max_upload_size = Column(Integer, nullable=True)  # bytes, None = storage.DEFAULT_MAX_UPLOAD_SIZE
+    
+    __table_args__ = (Index('ix_assignments_course_id_id', 'course_id', 'id'),)
     
     course = relationship("Course", back_populates="assignments")
     submissions = relationship("Submission", back_populates="assignment")
@@ -67,9 +90,22 @@ class Submission(Base):
     student_id = Column(Integer, ForeignKey('users.id'))
     file_path = Column(String)
     file_name = Column(String)
+    file_sha256 = Column(String(64))
+    file_size = Column(Integer)
     comment = Column(Text)
     status = Column(String, default="submitted")  # submitted, graded
     submitted_at = Column(DateTime, default=datetime.now)
+    # Filled in by the background processing job
+    processing_status = Column(String, default="pending")  # pending, processing, ready, quarantined, failed
+    checksums = Column(JSON)  # {"md5": ..., "sha1": ..., "sha256": ...}
+    extracted_text = Column(Text)
+    preview = Column(Text)
+    scan_result = Column(String)  # clean, infected
+    
+    __table_args__ = (
+        Index('ix_submissions_assignment_id_id', 'assignment_id', 'id'),
+        Index('ix_submissions_student_id_assignment_id', 'student_id', 'assignment_id'),
+    )
     
     assignment = relationship("Assignment", back_populates="submissions")
     student = relationship("User", foreign_keys=[student_id])
@@ -85,8 +121,107 @@ class Grade(Base):
     feedback = Column(Text)
     graded_at = Column(DateTime, default=datetime.now)
     
+    __table_args__ = (Index('ux_grades_submission_id', 'submission_id', unique=True),)  # one grade per submission
+    
     submission = relationship("Submission")
     grader = relationship("User", foreign_keys=[grader_id])
 
-# Create tables
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+HISTOGRAM_BUCKETS = 10  # equal ranges of the assignment's max_score
+
+def histogram_bucket(total_score, max_score):
+    if not max_score or max_score <= 0:
+        return 0
+    return min(max(int(total_score / max_score * HISTOGRAM_BUCKETS), 0), HISTOGRAM_BUCKETS - 1)
+
+# Running grade statistics per assignment, updated in the same transaction
+# as the submission/grade write so reading them never scans grades. Writers
+# never read them: every change is an increment applied by the database
+# (UPDATE ... SET graded_count = graded_count + 1), so concurrent grades of one
+# assignment cannot overwrite each other. The histogram and the criteria sums
+# are rows of their own for the same reason.
+class AssignmentStats(Base):
+    __tablename__ = "assignment_stats"
+    
+    assignment_id = Column(Integer, ForeignKey('assignments.id'), primary_key=True)
+    submission_count = Column(Integer, nullable=False, default=0)
+    graded_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0)
+    score_sq_sum = Column(Float, nullable=False, default=0)
+    
+    @classmethod
+    def empty(cls, assignment_id: int):
+        return cls(assignment_id=assignment_id, submission_count=0, graded_count=0, score_sum=0, score_sq_sum=0)
+
+class ScoreBucket(Base):
+    __tablename__ = "assignment_score_buckets"
+    
+    assignment_id = Column(Integer, ForeignKey('assignments.id'), primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # histogram_bucket()
+    count = Column(Integer, nullable=False, default=0)
+
+class CriterionSum(Base):
+    __tablename__ = "assignment_criterion_sums"
+    
+    assignment_id = Column(Integer, ForeignKey('assignments.id'), primary_key=True)
+    criterion = Column(String, primary_key=True)
+    score_sum = Column(Float, nullable=False, default=0)
+
+class StatsDelta:
+    # Change of one assignment's statistics, collected from the grades written
+    # in a transaction and applied as increments (repository_*.py)
+    def __init__(self):
+        self.submission_count = 0
+        self.graded_count = 0
+        self.score_sum = 0.0
+        self.score_sq_sum = 0.0
+        self.buckets = {}  # bucket -> count
+        self.criteria = {}  # criterion -> score sum
+    
+    def add_grade(self, total_score, scores, max_score, sign=1):
+        # sign=-1 removes a previous grade when a submission is regraded
+        self.graded_count += sign
+        self.score_sum += sign * total_score
+        self.score_sq_sum += sign * total_score * total_score
+        bucket = histogram_bucket(total_score, max_score)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + sign
+        for name, value in (scores or {}).items():
+            self.criteria[name] = self.criteria.get(name, 0) + sign * value
+    
+    def counters(self, assignment_id: int) -> dict:
+        return {"assignment_id": assignment_id, "submission_count": self.submission_count,
+                "graded_count": self.graded_count, "score_sum": self.score_sum, "score_sq_sum": self.score_sq_sum}
+    
+    def bucket_rows(self, assignment_id: int) -> list:
+        return [{"assignment_id": assignment_id, "bucket": bucket, "count": count}
+                for bucket, count in sorted(self.buckets.items()) if count]
+    
+    def criterion_rows(self, assignment_id: int) -> list:
+        return [{"assignment_id": assignment_id, "criterion": name, "score_sum": total}
+                for name, total in sorted(self.criteria.items())]
+
+# Background jobs; survive restarts because the queue is rebuilt from this table
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # process_submission
+    submission_id = Column(Integer, ForeignKey('submissions.id'))
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (Index('ix_jobs_status_id', 'status', 'id'),)
+
+def as_dict(instance) -> dict:
+    # Column values of a model instance, e.g. for caches and events
+    return {attr.key: getattr(instance, attr.key) for attr in instance.__mapper__.column_attrs}
+
+# Create tables and bring older databases up to date (python models.py);
+# not on import, same as main.py
+if __name__ == "__main__":
+    engine = create_engine(DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    migrate_engine(engine)
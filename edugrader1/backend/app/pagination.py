@@ -0,0 +1,53 @@
+import base64
+import binascii
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Keyset pagination of the list routes (courses, assignments of a course,
+# submissions of an assignment), the same in main.py and main_simple.py:
+#
+#   GET /api/courses?limit=50                  first page
+#   GET /api/courses?limit=50&cursor=<cursor>  next page
+#
+# Lists are ordered by id and a page is the `limit` rows after the cursor,
+# read through an index as WHERE id > ? ORDER BY id LIMIT ? - the cost of a
+# page does not grow with the number of pages before it, and rows inserted
+# meanwhile do not shift the pages. The body stays a JSON list; the cursor of
+# the next page is in the X-Next-Cursor header, which is missing on the last
+# page. Cursors are opaque to clients (they only pass them back) so the
+# ordering can change without breaking them. Filters are not part of the
+# cursor: send the same filters with every page.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    # Id of the last row of the previous page, or None for the first page
+    if cursor is None:
+        return None
+    try:
+        last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+def split_page(rows: List[dict], limit: int) -> Tuple[List[dict], Optional[str]]:
+    # rows were fetched with limit + 1: the extra row only tells that there is a next page
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1]["id"])
+    return rows, None
+
+
+def page_headers(next_cursor: Optional[str]) -> dict:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
@@ -0,0 +1,106 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from metrics import Counter, Histogram
+
+# Per-request SQL query counting and route latency for main.py.
+# QueryMetricsMiddleware puts a RequestQueries object into a context variable;
+# the engine events below find it from whatever thread or greenlet runs the
+# query (run_in_threadpool and AsyncSession both carry the request's context).
+# Routes are labelled by their path template, so ids do not create new series.
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+logger = logging.getLogger("edugrader.queries")
+
+request_seconds = Histogram("edugrader_request_seconds", "Request latency by route")
+request_queries = Histogram("edugrader_request_queries", "SQL queries per request by route", QUERY_COUNT_BUCKETS)
+request_query_seconds = Histogram("edugrader_request_query_seconds", "Time spent in SQL per request by route")
+requests_total = Counter("edugrader_requests_total", "Requests by route and status code")
+budget_exceeded = Counter("edugrader_query_budget_exceeded_total",
+                          "Requests that ran more SQL queries than the query budget")
+
+
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_current = ContextVar("edugrader_request_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    queries = _current.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += elapsed
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine):
+    # Pass the sync Engine; for an AsyncEngine use async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def route_label(scope):
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+
+class QueryMetricsMiddleware:
+    # Plain ASGI middleware: unlike BaseHTTPMiddleware it also times the body
+    # of streaming responses, which is where the gradebook export runs its queries
+    def __init__(self, app, query_budget: int = 20):
+        self.app = app
+        self.query_budget = query_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = _current.set(queries)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            self.record(scope, status, elapsed, queries)
+
+    def record(self, scope, status, elapsed, queries):
+        method, route = scope["method"], route_label(scope)
+        request_seconds.observe(elapsed, method=method, route=route)
+        request_queries.observe(queries.count, method=method, route=route)
+        request_query_seconds.observe(queries.seconds, method=method, route=route)
+        requests_total.inc(method=method, route=route, status=status)
+        if queries.count > self.query_budget:
+            budget_exceeded.inc(method=method, route=route)
+            logger.warning("%s %s ran %d SQL queries (budget %d), %.1f ms in SQL, %.1f ms total",
+                           method, scope["path"], queries.count, self.query_budget,
+                           queries.seconds * 1000, elapsed * 1000)
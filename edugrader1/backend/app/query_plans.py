@@ -0,0 +1,95 @@
+import re
+from datetime import datetime
+
+from search import fts_query
+
+# EXPLAIN QUERY PLAN check of the statements the routes send to SQLite.
+# No SQL is copied here: the repository methods behind the routes run on a
+# migrated database while sqlite3's trace callback records every statement
+# they send (parameters filled in), and the plan of each one is checked.
+# A SCAN step is a failure whether it reads the table or walks a covering
+# index - both cost time proportional to the table, not to the result. Only
+# FTS5 virtual tables may be "scanned": for them that step is the MATCH lookup.
+#
+# tests/test_query_plans.py runs every call on a fresh database for both
+# repositories; `python migrations.py check [db_path]` runs the read-only
+# ones on an existing database.
+
+TRACED_STATEMENTS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+# FTS5 reads and writes its shadow tables with statements of its own, which show up in the trace too
+FTS5_SHADOW_TABLE = re.compile(r"_fts_(config|data|idx|docsize|content)\b")
+
+
+def full_scans(conn, sql):
+    # Full-scan steps of the statement's plan; conn is a sqlite3 connection
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    return [step for step in plan if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step]
+
+
+class StatementTrace:
+    # Statements sent on a sqlite3 connection inside the with block
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []
+
+    def __enter__(self):
+        self.conn.set_trace_callback(self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.conn.set_trace_callback(None)
+
+    def _record(self, sql):
+        words = sql.split(None, 1)
+        if words and words[0].upper() in TRACED_STATEMENTS and not FTS5_SHADOW_TABLE.search(sql):
+            self.statements.append(sql)
+
+
+def read_calls(repo, user_id=1, course_id=1, assignment_id=1, submission_id=1):
+    # The lookups and list pages behind the GET routes. The admin course list
+    # pages through every course by id and is expected to scan courses
+    match = fts_query("lab")
+    return {
+        "user by username": lambda: repo.get_user_by_username("student"),
+        "user exists": lambda: repo.user_exists("student", "student@example.com"),
+        "courses of a teacher": lambda: repo.list_courses(user_id, "teacher", limit=101),
+        "courses of a student": lambda: repo.list_courses(user_id, "student", limit=101),
+        "courses of a semester": lambda: repo.list_courses(user_id, "teacher", academic_year="2025/2026",
+                                                           semester=1, after_id=0, limit=101),
+        "course": lambda: repo.get_course(course_id),
+        "assignments of a course": lambda: repo.list_assignments(course_id, after_id=0, limit=101),
+        "assignments due in a window": lambda: repo.list_assignments(
+            course_id, deadline_from=datetime(2025, 9, 1), deadline_to=datetime(2026, 1, 31), limit=101),
+        "assignment": lambda: repo.get_assignment(assignment_id),
+        "submissions page": lambda: repo.list_submissions(assignment_id, after_id=0, limit=51),
+        "submissions of a student": lambda: repo.list_submissions(assignment_id, student_id=user_id, limit=51),
+        "submissions by status and group": lambda: repo.list_submissions(assignment_id, status="graded",
+                                                                         group="IS-21", limit=51),
+        "submission": lambda: repo.get_submission(submission_id),
+        "search assignments": lambda: repo.search_assignments(match, user_id, "teacher", academic_year="2025/2026"),
+        "search submissions": lambda: repo.search_submissions(match, user_id, "student", course_id=course_id),
+    }
+
+
+def write_calls(repo, user_id=1, course_id=1, assignment_id=1, submission_id=1):
+    # The writes behind the POST routes; they change the database
+    return {
+        "enroll": lambda: repo.enroll(course_id, [user_id]),
+        "create submission": lambda: repo.create_submission(assignment_id, user_id, "", "lab.zip", None),
+        "grade": lambda: repo.save_grade(submission_id, user_id, {}, ""),
+        "grade batch": lambda: repo.save_grades(user_id, [{"submission_id": submission_id, "scores": {},
+                                                           "feedback": ""}]),
+    }
+
+
+def check_calls(conn, calls):
+    # {name: [(statement, full-scan steps)]} for every call that sent a statement with a full scan
+    problems = {}
+    for name, call in calls.items():
+        with StatementTrace(conn) as trace:
+            call()
+        for sql in trace.statements:
+            scans = full_scans(conn, sql)
+            if scans:
+                problems.setdefault(name, []).append((" ".join(sql.split()), scans))
+    return problems
@@ -0,0 +1,223 @@
+import math
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import StatsDelta
+
+# Storage interface behind the routes that main.py and main_simple.py share
+# (users, courses, enrollment, assignments, submissions, grades).
+# Routes get plain dicts back - never ORM objects or driver rows - so the two
+# implementations are interchangeable:
+#   orm - SQLAlchemy ORM/Core queries on a Session (repository_orm.py)
+#   sql - hand-written SQLite SQL on one connection (repository_sql.py)
+# main.py picks one with EDUGRADER_REPOSITORY (settings.py); main_simple.py has
+# no SQLAlchemy session and always uses the sql one.
+# Methods are synchronous and never commit: main.py runs them through
+# run_sync or the write queue, main_simple.py in its worker threads, and the
+# caller commits. benchmarks/bench_repositories.py runs the same contract
+# checks against both and times them.
+
+REPOSITORY_KINDS = ("orm", "sql")
+
+# Lists are ordered by id and filtered in SQL. after_id/limit select a keyset
+# page (rows with id > after_id, at most limit of them; see pagination.py)
+
+# Keys of the dicts returned for whole rows
+USER_COLUMNS = ("id", "email", "username", "full_name", "hashed_password", "role", "group", "created_at",
+                "version")
+COURSE_COLUMNS = ("id", "name", "code", "description", "teacher_id", "academic_year", "semester")
+ASSIGNMENT_COLUMNS = ("id", "course_id", "title", "description", "max_score", "criteria", "deadline",
+                      "max_upload_size")
+SUBMISSION_COLUMNS = ("id", "assignment_id", "student_id", "file_path", "file_name", "file_sha256", "file_size",
+                      "comment", "status", "submitted_at", "processing_status", "checksums", "extracted_text",
+                      "preview", "scan_result")
+GRADE_COLUMNS = ("id", "submission_id", "grader_id", "scores", "total_score", "feedback", "graded_at")
+# Submission and current grade of every submission in a grade batch, read by
+# save_grades after it has locked the submissions
+GRADE_TARGET_COLUMNS = ("id", "assignment_id", "student_id", "file_name", "course_id", "criteria", "max_score",
+                        "grade_id", "total_score", "scores")
+
+
+class InvalidGrade(ValueError):
+    # Raised by save_grade for scores that validate_scores rejects
+    pass
+
+
+def validate_scores(criteria, scores: Dict[str, float], max_score: Optional[float] = None):
+    # Returns an error message or None; criteria is Assignment.criteria JSON
+    limits = {c["name"]: c.get("max_score", c.get("max")) for c in criteria or []}
+    for name, value in scores.items():
+        if not math.isfinite(value):
+            return f"Score for '{name}' is not a finite number"
+        if value < 0:
+            return f"Negative score for '{name}'"
+        if limits:
+            if name not in limits:
+                return f"Unknown criterion '{name}'"
+            if limits[name] is not None and value > limits[name]:
+                return f"Score for '{name}' exceeds {limits[name]}"
+    if max_score is not None and sum(scores.values()) > max_score:
+        return f"Total score exceeds {max_score}"
+    return None
+
+
+def plan_grade_batch(grader_id: int, grades: List[dict], targets: Dict[int, dict]):
+    # The part of save_grades both implementations share: validates every
+    # grade against targets (submission_id -> GRADE_TARGET_COLUMNS) and returns
+    # (results, grade rows to insert, grade rows to update by id, StatsDelta per assignment)
+    results, new_grades, regrades, deltas = [], [], [], {}
+    saved = set()
+    graded_at = datetime.now()
+    for grade in grades:
+        submission_id = grade["submission_id"]
+        target = targets.get(submission_id)
+        if target is None:
+            error = "Submission not found"
+        elif submission_id in saved:
+            error = "Duplicate submission in batch"
+        else:
+            error = validate_scores(target["criteria"], grade["scores"], target["max_score"])
+        if error:
+            results.append({"submission_id": submission_id, "status": "error", "detail": error})
+            continue
+
+        saved.add(submission_id)
+        total_score = sum(grade["scores"].values())
+        row = {"submission_id": submission_id, "grader_id": grader_id, "scores": grade["scores"],
+               "total_score": total_score, "feedback": grade["feedback"], "graded_at": graded_at}
+        delta = deltas.setdefault(target["assignment_id"], StatsDelta())
+        if target["grade_id"] is None:
+            new_grades.append(row)
+        else:
+            regrades.append({"id": target["grade_id"], **row})
+            delta.add_grade(target["total_score"], target["scores"], target["max_score"], sign=-1)
+        delta.add_grade(total_score, grade["scores"], target["max_score"])
+        results.append({**row, "status": "ok", "assignment_id": target["assignment_id"],
+                        "course_id": target["course_id"], "student_id": target["student_id"],
+                        "file_name": target["file_name"]})
+    return results, new_grades, regrades, deltas
+
+
+class Repository(ABC):
+    kind = None
+
+    @classmethod
+    @abstractmethod
+    def from_session(cls, session) -> "Repository":
+        # Works inside the session's connection and transaction
+        ...
+
+    # Users
+
+    @abstractmethod
+    def get_user_by_username(self, username: str) -> Optional[dict]:
+        # USER_COLUMNS, or None
+        ...
+
+    @abstractmethod
+    def user_exists(self, username: str, email: str) -> bool:
+        ...
+
+    @abstractmethod
+    def create_user(self, email: str, username: str, full_name: str, hashed_password: str,
+                    role: str = "student", group: Optional[str] = None) -> dict:
+        ...
+
+    # Courses
+
+    @abstractmethod
+    def list_courses(self, user_id: int, role: str, academic_year: Optional[str] = None,
+                     semester: Optional[int] = None, after_id: Optional[int] = None,
+                     limit: Optional[int] = None) -> List[dict]:
+        # CourseOut rows: a teacher's own courses, a student's enrolled ones, everything for admins
+        ...
+
+    @abstractmethod
+    def get_course(self, course_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def create_course(self, teacher_id: int, name: str, code: str, description: Optional[str],
+                      academic_year: str, semester: int) -> dict:
+        # CourseOut row
+        ...
+
+    @abstractmethod
+    def enroll(self, course_id: int, student_ids: List[int]) -> int:
+        # Number of students newly enrolled; existing enrollments are left as they are
+        ...
+
+    # Assignments
+
+    @abstractmethod
+    def list_assignments(self, course_id: int, deadline_from: Optional[datetime] = None,
+                         deadline_to: Optional[datetime] = None, after_id: Optional[int] = None,
+                         limit: Optional[int] = None) -> List[dict]:
+        # AssignmentOut rows; the deadline window includes both ends
+        ...
+
+    @abstractmethod
+    def get_assignment(self, assignment_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def create_assignment(self, course_id: int, title: str, description: Optional[str], max_score: float,
+                          criteria: List[dict], deadline: datetime,
+                          max_upload_size: Optional[int] = None) -> dict:
+        # Also creates the assignment's empty statistics row
+        ...
+
+    # Submissions
+
+    @abstractmethod
+    def list_submissions(self, assignment_id: int, student_id: Optional[int] = None, status: Optional[str] = None,
+                         group: Optional[str] = None, after_id: Optional[int] = None,
+                         limit: Optional[int] = None) -> List[dict]:
+        # SubmissionOut rows; group is the student's group
+        ...
+
+    @abstractmethod
+    def get_submission(self, submission_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def create_submission(self, assignment_id: int, student_id: int, file_path: str, file_name: str,
+                          comment: Optional[str], file_sha256: Optional[str] = None,
+                          file_size: Optional[int] = None) -> dict:
+        # SUBMISSION_COLUMNS plus job_id of the queued processing job
+        ...
+
+    # Grades
+
+    @abstractmethod
+    def save_grade(self, submission_id: int, grader_id: int, scores: Dict[str, float], feedback: str) -> dict:
+        # One grade per submission: regrading replaces it. Marks the submission
+        # graded and updates the assignment statistics; returns GRADE_COLUMNS.
+        # Raises InvalidGrade, before writing anything, when validate_scores
+        # rejects the scores
+        ...
+
+    @abstractmethod
+    def save_grades(self, grader_id: int, grades: List[dict]) -> List[dict]:
+        # Batch of save_grade in one transaction; grades are dicts with
+        # submission_id, scores and feedback. Invalid items are skipped, the
+        # others all written: one result per item in order, either
+        # {submission_id, status: "error", detail} or {status: "ok"} plus
+        # GRADE_COLUMNS except id and the submission's assignment_id,
+        # course_id, student_id and file_name
+        ...
+
+    # Search (SQLite FTS5, see search.py)
+
+    @abstractmethod
+    def search_assignments(self, match: str, user_id: int, role: str, course_id: Optional[int] = None,
+                           academic_year: Optional[str] = None, limit: int = 20) -> List[dict]:
+        # search.ASSIGNMENT_HIT_COLUMNS rows visible to the user, best match first
+        ...
+
+    @abstractmethod
+    def search_submissions(self, match: str, user_id: int, role: str, course_id: Optional[int] = None,
+                           academic_year: Optional[str] = None, limit: int = 20) -> List[dict]:
+        # search.SUBMISSION_HIT_COLUMNS rows; students only find their own submissions
+        ...
@@ -0,0 +1,301 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import (Assignment, AssignmentStats, Course, CriterionSum, Grade, Job, ScoreBucket, StatsDelta, Submission,
+                    User, as_dict, course_students)
+from repository import GRADE_TARGET_COLUMNS, InvalidGrade, Repository, plan_grade_batch, validate_scores
+import search
+
+# SQLAlchemy implementation of repository.Repository. Lists select only the
+# columns of their response schema (no ORM objects to build); single rows
+# and writes go through the models, so model defaults and events apply.
+
+
+def keyset_page(query, id_column, after_id: Optional[int] = None, limit: Optional[int] = None):
+    # Keyset pagination: rows after the last id of the previous page, in id order
+    if after_id is not None:
+        query = query.where(id_column > after_id)
+    query = query.order_by(id_column)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def courses_query(user_id: int, role: str, academic_year: Optional[str] = None, semester: Optional[int] = None,
+                  after_id: Optional[int] = None, limit: Optional[int] = None):
+    # Enrollment count of each course on the page, looked up in the
+    # (course_id, student_id) index: the cost follows the page size, not the
+    # size of the whole enrollment table
+    enrolled = course_students.alias("enrolled")
+    students_count = (
+        select(func.count())
+        .select_from(enrolled)
+        .where(enrolled.c.course_id == Course.id)
+        .correlate(Course)
+        .scalar_subquery()
+        .label("students_count")
+    )
+    query = select(Course.id, Course.name, Course.code, Course.description, Course.teacher_id,
+                   Course.academic_year, Course.semester, students_count)
+
+    if role == "teacher":
+        query = query.where(Course.teacher_id == user_id)
+    elif role == "student":
+        query = query.join(course_students, course_students.c.course_id == Course.id).where(
+            course_students.c.student_id == user_id
+        )
+    if academic_year is not None:
+        query = query.where(Course.academic_year == academic_year)
+    if semester is not None:
+        query = query.where(Course.semester == semester)
+    return keyset_page(query, Course.id, after_id, limit)
+
+
+def assignments_query(course_id: int, deadline_from: Optional[datetime] = None,
+                      deadline_to: Optional[datetime] = None, after_id: Optional[int] = None,
+                      limit: Optional[int] = None):
+    query = select(
+        Assignment.id, Assignment.course_id, Assignment.title, Assignment.description, Assignment.max_score,
+        Assignment.criteria, Assignment.deadline, Assignment.max_upload_size,
+    ).where(Assignment.course_id == course_id)
+    if deadline_from is not None:
+        query = query.where(Assignment.deadline >= deadline_from)
+    if deadline_to is not None:
+        query = query.where(Assignment.deadline <= deadline_to)
+    return keyset_page(query, Assignment.id, after_id, limit)
+
+
+def submissions_query(assignment_id: int, student_id: Optional[int] = None, status: Optional[str] = None,
+                      group: Optional[str] = None, after_id: Optional[int] = None, limit: Optional[int] = None):
+    # One query: student name and grade are joined in instead of loaded per row
+    query = (
+        select(
+            Submission.id,
+            User.full_name.label("student_name"),
+            Submission.file_name,
+            Submission.submitted_at,
+            Submission.status,
+            Submission.processing_status,
+            Grade.total_score.label("grade"),
+            Grade.feedback,
+        )
+        .join(User, User.id == Submission.student_id)
+        .outerjoin(Grade, Grade.submission_id == Submission.id)
+        .where(Submission.assignment_id == assignment_id)
+    )
+
+    if student_id is not None:
+        query = query.where(Submission.student_id == student_id)
+    if status is not None:
+        query = query.where(Submission.status == status)
+    if group is not None:
+        query = query.where(User.group == group)
+    return keyset_page(query, Submission.id, after_id, limit)
+
+
+INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def insert_ignoring_conflicts(table, rows: List[dict], dialect: str):
+    # One multi-row INSERT ... ON CONFLICT DO NOTHING for the given database
+    return INSERTS[dialect](table).values(rows).on_conflict_do_nothing()
+
+
+def insert_adding_on_conflict(table, rows: List[dict], dialect: str):
+    # One multi-row INSERT ... ON CONFLICT DO UPDATE that adds the values to an
+    # existing row's: the database increments the row, nothing is read first
+    keys = [column.name for column in table.primary_key]
+    statement = INSERTS[dialect](table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + statement.excluded[name] for name in rows[0] if name not in keys},
+    )
+
+
+def apply_stats_delta(session, assignment_id: int, delta: StatsDelta):
+    # Counters, histogram buckets and criteria sums of one assignment (models.StatsDelta)
+    dialect = session.get_bind().dialect.name
+    for model, rows in ((AssignmentStats, [delta.counters(assignment_id)]),
+                        (ScoreBucket, delta.bucket_rows(assignment_id)),
+                        (CriterionSum, delta.criterion_rows(assignment_id))):
+        if rows:
+            session.execute(insert_adding_on_conflict(model.__table__, rows, dialect))
+
+
+class OrmRepository(Repository):
+    kind = "orm"
+
+    def __init__(self, session):
+        self.session = session
+
+    @classmethod
+    def from_session(cls, session):
+        return cls(session)
+
+    def _rows(self, query) -> List[dict]:
+        result = self.session.execute(query)
+        keys = list(result.keys())
+        return [dict(zip(keys, row)) for row in result]
+
+    def get_user_by_username(self, username):
+        # Columns only: main.get_current_user attaches its own User built from the dict
+        row = self.session.execute(select(User.__table__).where(User.username == username)).first()
+        return dict(row._mapping) if row is not None else None
+
+    def user_exists(self, username, email):
+        return self.session.scalar(select(User.id).where(
+            (User.username == username) | (User.email == email)
+        ).limit(1)) is not None
+
+    def create_user(self, email, username, full_name, hashed_password, role="student", group=None):
+        user = User(email=email, username=username, full_name=full_name, hashed_password=hashed_password,
+                    role=role, group=group)
+        self.session.add(user)
+        self.session.flush()
+        return as_dict(user)
+
+    def list_courses(self, user_id, role, academic_year=None, semester=None, after_id=None, limit=None):
+        return self._rows(courses_query(user_id, role, academic_year, semester, after_id, limit))
+
+    def get_course(self, course_id):
+        course = self.session.get(Course, course_id)
+        return as_dict(course) if course is not None else None
+
+    def create_course(self, teacher_id, name, code, description, academic_year, semester):
+        course = Course(name=name, code=code, description=description, teacher_id=teacher_id,
+                        academic_year=academic_year, semester=semester)
+        self.session.add(course)
+        self.session.flush()
+        return {**as_dict(course), "students_count": 0}
+
+    def enroll(self, course_id, student_ids):
+        if not student_ids:
+            return 0
+        dialect = self.session.get_bind().dialect.name
+        rows = [{"course_id": course_id, "student_id": student_id} for student_id in student_ids]
+        return self.session.execute(insert_ignoring_conflicts(course_students, rows, dialect)).rowcount
+
+    def list_assignments(self, course_id, deadline_from=None, deadline_to=None, after_id=None, limit=None):
+        return self._rows(assignments_query(course_id, deadline_from, deadline_to, after_id, limit))
+
+    def get_assignment(self, assignment_id):
+        assignment = self.session.get(Assignment, assignment_id)
+        return as_dict(assignment) if assignment is not None else None
+
+    def create_assignment(self, course_id, title, description, max_score, criteria, deadline,
+                          max_upload_size=None):
+        assignment = Assignment(course_id=course_id, title=title, description=description, max_score=max_score,
+                                criteria=criteria, deadline=deadline, max_upload_size=max_upload_size)
+        self.session.add(assignment)
+        self.session.flush()
+        self.session.add(AssignmentStats.empty(assignment.id))
+        self.session.flush()
+        return as_dict(assignment)
+
+    def list_submissions(self, assignment_id, student_id=None, status=None, group=None, after_id=None, limit=None):
+        return self._rows(submissions_query(assignment_id, student_id, status, group, after_id, limit))
+
+    def get_submission(self, submission_id):
+        submission = self.session.get(Submission, submission_id)
+        return as_dict(submission) if submission is not None else None
+
+    def create_submission(self, assignment_id, student_id, file_path, file_name, comment, file_sha256=None,
+                          file_size=None):
+        submission = Submission(assignment_id=assignment_id, student_id=student_id, file_path=file_path,
+                                file_name=file_name, file_sha256=file_sha256, file_size=file_size,
+                                comment=comment)
+        self.session.add(submission)
+        self.session.flush()
+        job = Job(kind="process_submission", submission_id=submission.id)
+        self.session.add(job)
+        self.session.flush()
+        delta = StatsDelta()
+        delta.submission_count = 1
+        apply_stats_delta(self.session, assignment_id, delta)
+        return {**as_dict(submission), "job_id": job.id}
+
+    def save_grade(self, submission_id, grader_id, scores, feedback):
+        assignment_id, max_score, criteria = self.session.execute(
+            select(Submission.assignment_id, Assignment.max_score, Assignment.criteria)
+            .join(Assignment, Assignment.id == Submission.assignment_id)
+            .where(Submission.id == submission_id)
+        ).one()
+        error = validate_scores(criteria, scores, max_score)
+        if error:
+            raise InvalidGrade(error)
+        # Marking the submission graded is the first write: it locks the
+        # submission (its row, or the whole database on SQLite) until commit, so
+        # a concurrent regrade waits here and the previous grade read below is current
+        self.session.execute(update(Submission).where(Submission.id == submission_id).values(status="graded"))
+        grade = self.session.scalar(
+            select(Grade).where(Grade.submission_id == submission_id).execution_options(populate_existing=True)
+        )
+        total_score = sum(scores.values())
+        delta = StatsDelta()
+        if grade is None:
+            grade = Grade(submission_id=submission_id)
+            self.session.add(grade)
+        else:
+            delta.add_grade(grade.total_score, grade.scores, max_score, sign=-1)
+        delta.add_grade(total_score, scores, max_score)
+        grade.grader_id = grader_id
+        grade.scores = scores
+        grade.total_score = total_score
+        grade.feedback = feedback
+        grade.graded_at = datetime.now()
+        self.session.flush()
+        apply_stats_delta(self.session, assignment_id, delta)
+        return as_dict(grade)
+
+    def save_grades(self, grader_id, grades):
+        # A write that changes nothing locks the submissions first, as in
+        # save_grade, so the current grades read next stay current until commit
+        submission_ids = {grade["submission_id"] for grade in grades}
+        self.session.execute(
+            update(Submission)
+            .where(Submission.id.in_(submission_ids))
+            .values(status=Submission.status)
+            .execution_options(synchronize_session=False)
+        )
+        targets = {row.id: dict(zip(GRADE_TARGET_COLUMNS, row)) for row in self.session.execute(
+            select(Submission.id, Submission.assignment_id, Submission.student_id, Submission.file_name,
+                   Assignment.course_id, Assignment.criteria, Assignment.max_score,
+                   Grade.id.label("grade_id"), Grade.total_score, Grade.scores)
+            .join(Assignment, Assignment.id == Submission.assignment_id)
+            .outerjoin(Grade, Grade.submission_id == Submission.id)
+            .where(Submission.id.in_(submission_ids))
+        )}
+        results, new_grades, regrades, deltas = plan_grade_batch(grader_id, grades, targets)
+
+        # Bulk statements for all valid grades
+        if new_grades:
+            self.session.execute(insert(Grade), new_grades)
+        if regrades:
+            self.session.execute(update(Grade), regrades)
+        saved = [result["submission_id"] for result in results if result["status"] == "ok"]
+        if saved:
+            self.session.execute(
+                update(Submission)
+                .where(Submission.id.in_(saved))
+                .values(status="graded")
+                .execution_options(synchronize_session=False)
+            )
+        for assignment_id, delta in deltas.items():
+            apply_stats_delta(self.session, assignment_id, delta)
+        return results
+
+    def _search(self, statement, convert):
+        # FTS5 MATCH/snippet/rank have no SQLAlchemy construct: the shared statement runs as is
+        sql, params = statement
+        return [convert(row) for row in self.session.connection().exec_driver_sql(sql, tuple(params))]
+
+    def search_assignments(self, match, user_id, role, course_id=None, academic_year=None, limit=20):
+        return self._search(search.assignment_search(match, user_id, role, course_id, academic_year, limit),
+                            search.assignment_hit)
+
+    def search_submissions(self, match, user_id, role, course_id=None, academic_year=None, limit=20):
+        return self._search(search.submission_search(match, user_id, role, course_id, academic_year, limit),
+                            search.submission_hit)
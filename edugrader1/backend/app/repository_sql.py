@@ -0,0 +1,401 @@
+import json
+import sqlite3
+from datetime import datetime
+from typing import Optional
+
+from models import StatsDelta
+from repository import (ASSIGNMENT_COLUMNS, COURSE_COLUMNS, GRADE_TARGET_COLUMNS, SUBMISSION_COLUMNS, USER_COLUMNS,
+                        InvalidGrade, Repository, plan_grade_batch, validate_scores)
+import search
+
+# Hand-written SQLite implementation of repository.Repository.
+# Runs on a plain sqlite3 connection (main_simple.py) or on the connection of
+# a SQLAlchemy session (main.py, both DB modes - statements still go through
+# the engine, so query metrics count them). Every statement is one round trip
+# with the columns listed explicitly; rows are read as tuples and converted
+# here: timestamps are stored the way SQLAlchemy's DateTime stores them and
+# JSON columns as json.dumps text, so either implementation reads what the
+# other wrote.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # sqlalchemy.types.DateTime on SQLite
+
+
+def _timestamp(value: Optional[datetime]):
+    return value.strftime(TIMESTAMP_FORMAT) if value is not None else None
+
+
+def _parse_timestamp(value):
+    # main_simple.py tables fill defaults with CURRENT_TIMESTAMP (no microseconds)
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _parse_json(value):
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def _columns(names, alias=None):
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f'{prefix}"{name}"' for name in names)
+
+
+class _Sqlite3Connection:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+
+    def query(self, sql, params=()):
+        return [tuple(row) for row in self.conn.execute(sql, params).fetchall()]
+
+
+class _SessionConnection:
+    def __init__(self, session):
+        # The session's current connection is looked up per statement, so the
+        # repository stays usable after a commit; qmark parameters on SQLite drivers
+        self.session = session
+
+    def execute(self, sql, params=()):
+        return self.session.connection().exec_driver_sql(sql, tuple(params))
+
+    def query(self, sql, params=()):
+        return [tuple(row) for row in self.execute(sql, params).fetchall()]
+
+
+def _keyset(sql, params, conditions, id_column, after_id, limit):
+    # WHERE from conditions plus keyset pagination: rows after the last id of the previous page
+    if after_id is not None:
+        conditions = conditions + [f"{id_column} > ?"]
+        params = params + [after_id]
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {id_column}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+    return sql, params
+
+
+USER_SELECT = f"SELECT {_columns(USER_COLUMNS)} FROM users"
+COURSE_SELECT = f"SELECT {_columns(COURSE_COLUMNS)} FROM courses"
+ASSIGNMENT_SELECT = f"SELECT {_columns(ASSIGNMENT_COLUMNS)} FROM assignments"
+SUBMISSION_SELECT = f"SELECT {_columns(SUBMISSION_COLUMNS)} FROM submissions"
+
+COURSE_LIST_COLUMNS = COURSE_COLUMNS + ("students_count",)
+COURSE_LIST_SELECT = f'''
+    SELECT {_columns(COURSE_COLUMNS, "c")},
+           (SELECT COUNT(*) FROM course_students e WHERE e.course_id = c.id)
+    FROM courses c
+'''
+
+SUBMISSION_LIST_COLUMNS = ("id", "student_name", "file_name", "submitted_at", "status", "processing_status",
+                           "grade", "feedback")
+SUBMISSION_LIST_SELECT = '''
+    SELECT s.id, u.full_name, s.file_name, s.submitted_at, s.status, s.processing_status,
+           g.total_score, g.feedback
+    FROM submissions s
+    JOIN users u ON u.id = s.student_id
+    LEFT JOIN grades g ON g.submission_id = s.id
+'''
+
+
+def _adding_upsert(table, columns, keys, row_count):
+    # Multi-row INSERT ... ON CONFLICT DO UPDATE that adds the values to an
+    # existing row's: SQLite increments the row, nothing is read first
+    values = ", ".join([f"({', '.join('?' * len(columns))})"] * row_count)
+    added = ", ".join(f'"{name}" = "{name}" + excluded."{name}"' for name in columns if name not in keys)
+    return f"INSERT INTO {table} ({_columns(columns)}) VALUES {values} ON CONFLICT ({_columns(keys)}) DO UPDATE SET {added}"
+
+
+GRADE_UPSERT_COLUMNS = ("submission_id", "grader_id", "scores", "total_score", "feedback", "graded_at")
+
+STATS_TABLES = (  # models.AssignmentStats, ScoreBucket, CriterionSum
+    ("assignment_stats", ("assignment_id",)),
+    ("assignment_score_buckets", ("assignment_id", "bucket")),
+    ("assignment_criterion_sums", ("assignment_id", "criterion")),
+)
+
+
+class SqlRepository(Repository):
+    kind = "sql"
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    def from_session(cls, session):
+        return cls(_SessionConnection(session))
+
+    @classmethod
+    def from_sqlite3(cls, conn: sqlite3.Connection):
+        return cls(_Sqlite3Connection(conn))
+
+    # Row conversion
+
+    @staticmethod
+    def _user(row):
+        user = dict(zip(USER_COLUMNS, row))
+        user["created_at"] = _parse_timestamp(user["created_at"])
+        return user
+
+    @staticmethod
+    def _assignment(row):
+        assignment = dict(zip(ASSIGNMENT_COLUMNS, row))
+        assignment["criteria"] = _parse_json(assignment["criteria"])
+        assignment["deadline"] = _parse_timestamp(assignment["deadline"])
+        return assignment
+
+    @staticmethod
+    def _submission(row):
+        submission = dict(zip(SUBMISSION_COLUMNS, row))
+        submission["submitted_at"] = _parse_timestamp(submission["submitted_at"])
+        submission["checksums"] = _parse_json(submission["checksums"])
+        return submission
+
+    def _one(self, sql, params, convert):
+        rows = self.conn.query(sql, params)
+        return convert(rows[0]) if rows else None
+
+    # Users
+
+    def get_user_by_username(self, username):
+        return self._one(USER_SELECT + " WHERE username = ?", (username,), self._user)
+
+    def user_exists(self, username, email):
+        return bool(self.conn.query("SELECT 1 FROM users WHERE username = ? OR email = ? LIMIT 1",
+                                    (username, email)))
+
+    def create_user(self, email, username, full_name, hashed_password, role="student", group=None):
+        user = {"email": email, "username": username, "full_name": full_name, "hashed_password": hashed_password,
+                "role": role, "group": group, "created_at": datetime.now(), "version": 1}
+        columns = USER_COLUMNS[1:]
+        cursor = self.conn.execute(
+            f"INSERT INTO users ({_columns(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [_timestamp(user[name]) if name == "created_at" else user[name] for name in columns],
+        )
+        return {"id": cursor.lastrowid, **user}
+
+    # Courses
+
+    def list_courses(self, user_id, role, academic_year=None, semester=None, after_id=None, limit=None):
+        sql, conditions, params = COURSE_LIST_SELECT, [], []
+        if role == "teacher":
+            conditions.append("c.teacher_id = ?")
+            params.append(user_id)
+        elif role == "student":
+            sql += " JOIN course_students cs ON cs.course_id = c.id"
+            conditions.append("cs.student_id = ?")
+            params.append(user_id)
+        if academic_year is not None:
+            conditions.append("c.academic_year = ?")
+            params.append(academic_year)
+        if semester is not None:
+            conditions.append("c.semester = ?")
+            params.append(semester)
+        sql, params = _keyset(sql, params, conditions, "c.id", after_id, limit)
+        return [dict(zip(COURSE_LIST_COLUMNS, row)) for row in self.conn.query(sql, params)]
+
+    def get_course(self, course_id):
+        return self._one(COURSE_SELECT + " WHERE id = ?", (course_id,), lambda row: dict(zip(COURSE_COLUMNS, row)))
+
+    def create_course(self, teacher_id, name, code, description, academic_year, semester):
+        cursor = self.conn.execute('''
+            INSERT INTO courses (name, code, description, teacher_id, academic_year, semester)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, code, description, teacher_id, academic_year, semester))
+        return {"id": cursor.lastrowid, "name": name, "code": code, "description": description,
+                "teacher_id": teacher_id, "academic_year": academic_year, "semester": semester,
+                "students_count": 0}
+
+    def enroll(self, course_id, student_ids):
+        if not student_ids:
+            return 0
+        # One multi-row statement; the unique (course_id, student_id) index skips existing rows
+        params = []
+        for student_id in student_ids:
+            params += (course_id, student_id)
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO course_students (course_id, student_id) VALUES "
+            + ", ".join(["(?, ?)"] * len(student_ids)),
+            params,
+        )
+        return cursor.rowcount
+
+    # Assignments
+
+    def list_assignments(self, course_id, deadline_from=None, deadline_to=None, after_id=None, limit=None):
+        conditions, params = ["course_id = ?"], [course_id]
+        # Deadlines are stored as TIMESTAMP_FORMAT text, which sorts like the timestamps
+        if deadline_from is not None:
+            conditions.append("deadline >= ?")
+            params.append(_timestamp(deadline_from))
+        if deadline_to is not None:
+            conditions.append("deadline <= ?")
+            params.append(_timestamp(deadline_to))
+        sql, params = _keyset(ASSIGNMENT_SELECT, params, conditions, "id", after_id, limit)
+        return [self._assignment(row) for row in self.conn.query(sql, params)]
+
+    def get_assignment(self, assignment_id):
+        return self._one(ASSIGNMENT_SELECT + " WHERE id = ?", (assignment_id,), self._assignment)
+
+    def create_assignment(self, course_id, title, description, max_score, criteria, deadline,
+                          max_upload_size=None):
+        cursor = self.conn.execute('''
+            INSERT INTO assignments (course_id, title, description, max_score, criteria, deadline, max_upload_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (course_id, title, description, max_score, json.dumps(criteria), _timestamp(deadline),
+              max_upload_size))
+        assignment_id = cursor.lastrowid
+        self._apply_stats(assignment_id, StatsDelta())
+        return {"id": assignment_id, "course_id": course_id, "title": title, "description": description,
+                "max_score": max_score, "criteria": criteria, "deadline": deadline,
+                "max_upload_size": max_upload_size}
+
+    # Submissions
+
+    def list_submissions(self, assignment_id, student_id=None, status=None, group=None, after_id=None, limit=None):
+        conditions, params = ["s.assignment_id = ?"], [assignment_id]
+        if student_id is not None:
+            conditions.append("s.student_id = ?")
+            params.append(student_id)
+        if status is not None:
+            conditions.append("s.status = ?")
+            params.append(status)
+        if group is not None:
+            conditions.append('u."group" = ?')
+            params.append(group)
+        sql, params = _keyset(SUBMISSION_LIST_SELECT, params, conditions, "s.id", after_id, limit)
+        submissions = []
+        for row in self.conn.query(sql, params):
+            submission = dict(zip(SUBMISSION_LIST_COLUMNS, row))
+            submission["submitted_at"] = _parse_timestamp(submission["submitted_at"])
+            submissions.append(submission)
+        return submissions
+
+    def get_submission(self, submission_id):
+        return self._one(SUBMISSION_SELECT + " WHERE id = ?", (submission_id,), self._submission)
+
+    def create_submission(self, assignment_id, student_id, file_path, file_name, comment, file_sha256=None,
+                          file_size=None):
+        now = datetime.now()
+        submission = {"assignment_id": assignment_id, "student_id": student_id, "file_path": file_path,
+                      "file_name": file_name, "file_sha256": file_sha256, "file_size": file_size,
+                      "comment": comment, "status": "submitted", "submitted_at": now,
+                      "processing_status": "pending", "checksums": None, "extracted_text": None,
+                      "preview": None, "scan_result": None}
+        columns = SUBMISSION_COLUMNS[1:11]  # up to processing_status, the rest is filled in by the job
+        cursor = self.conn.execute(
+            f"INSERT INTO submissions ({_columns(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [_timestamp(now) if name == "submitted_at" else submission[name] for name in columns],
+        )
+        submission_id = cursor.lastrowid
+        job = self.conn.execute('''
+            INSERT INTO jobs (kind, submission_id, status, attempts, created_at)
+            VALUES ('process_submission', ?, 'queued', 0, ?)
+        ''', (submission_id, _timestamp(now)))
+        delta = StatsDelta()
+        delta.submission_count = 1
+        self._apply_stats(assignment_id, delta)
+        return {"id": submission_id, **submission, "job_id": job.lastrowid}
+
+    # Grades
+
+    def _apply_stats(self, assignment_id, delta):
+        # Counters, histogram buckets and criteria sums of one assignment (models.StatsDelta)
+        rows_by_table = (
+            [delta.counters(assignment_id)], delta.bucket_rows(assignment_id), delta.criterion_rows(assignment_id),
+        )
+        for (table, keys), rows in zip(STATS_TABLES, rows_by_table):
+            if rows:
+                columns = list(rows[0])
+                self.conn.execute(_adding_upsert(table, columns, keys, len(rows)),
+                                  [row[name] for row in rows for name in columns])
+
+    def save_grade(self, submission_id, grader_id, scores, feedback):
+        assignment_id, max_score, criteria = self.conn.query('''
+            SELECT s.assignment_id, a.max_score, a.criteria
+            FROM submissions s
+            JOIN assignments a ON a.id = s.assignment_id
+            WHERE s.id = ?
+        ''', (submission_id,))[0]
+        error = validate_scores(_parse_json(criteria), scores, max_score)
+        if error:
+            raise InvalidGrade(error)
+        # Marking the submission graded is the first write: it takes SQLite's
+        # write lock until commit, so a concurrent regrade waits here and the
+        # previous grade read below is current
+        self.conn.execute("UPDATE submissions SET status = 'graded' WHERE id = ?", (submission_id,))
+        grade_id, old_total, old_scores = (self.conn.query(
+            "SELECT id, total_score, scores FROM grades WHERE submission_id = ?", (submission_id,)
+        ) or [(None, None, None)])[0]
+        total_score = sum(scores.values())
+        graded_at = datetime.now()
+        delta = StatsDelta()
+        values = (grader_id, json.dumps(scores), total_score, feedback, _timestamp(graded_at))
+        if grade_id is None:
+            grade_id = self.conn.execute('''
+                INSERT INTO grades (grader_id, scores, total_score, feedback, graded_at, submission_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', values + (submission_id,)).lastrowid
+        else:
+            delta.add_grade(old_total, _parse_json(old_scores), max_score, sign=-1)
+            self.conn.execute('''
+                UPDATE grades SET grader_id = ?, scores = ?, total_score = ?, feedback = ?, graded_at = ?
+                WHERE id = ?
+            ''', values + (grade_id,))
+        delta.add_grade(total_score, scores, max_score)
+        self._apply_stats(assignment_id, delta)
+        return {"id": grade_id, "submission_id": submission_id, "grader_id": grader_id, "scores": scores,
+                "total_score": total_score, "feedback": feedback, "graded_at": graded_at}
+
+    def save_grades(self, grader_id, grades):
+        # A write that changes nothing takes the write lock first, as in
+        # save_grade, so the current grades read next stay current until commit
+        submission_ids = sorted({grade["submission_id"] for grade in grades})
+        placeholders = ", ".join("?" * len(submission_ids))
+        self.conn.execute(f"UPDATE submissions SET status = status WHERE id IN ({placeholders})", submission_ids)
+        targets = {}
+        for row in self.conn.query(f'''
+            SELECT s.id, s.assignment_id, s.student_id, s.file_name, a.course_id, a.criteria, a.max_score,
+                   g.id, g.total_score, g.scores
+            FROM submissions s
+            JOIN assignments a ON a.id = s.assignment_id
+            LEFT JOIN grades g ON g.submission_id = s.id
+            WHERE s.id IN ({placeholders})
+        ''', submission_ids):
+            target = dict(zip(GRADE_TARGET_COLUMNS, row))
+            target["criteria"] = _parse_json(target["criteria"])
+            target["scores"] = _parse_json(target["scores"])
+            targets[target["id"]] = target
+        results, new_grades, regrades, deltas = plan_grade_batch(grader_id, grades, targets)
+
+        # New grades and regrades in one multi-row upsert on the unique submission_id
+        rows = new_grades + regrades
+        if rows:
+            self.conn.execute(
+                f"INSERT INTO grades ({_columns(GRADE_UPSERT_COLUMNS)}) VALUES "
+                + ", ".join([f"({', '.join('?' * len(GRADE_UPSERT_COLUMNS))})"] * len(rows))
+                + " ON CONFLICT (submission_id) DO UPDATE SET "
+                + ", ".join(f'"{name}" = excluded."{name}"' for name in GRADE_UPSERT_COLUMNS[1:]),
+                [value for row in rows for value in (row["submission_id"], grader_id, json.dumps(row["scores"]),
+                                                     row["total_score"], row["feedback"],
+                                                     _timestamp(row["graded_at"]))],
+            )
+        saved = [result["submission_id"] for result in results if result["status"] == "ok"]
+        if saved:
+            self.conn.execute(
+                f"UPDATE submissions SET status = 'graded' WHERE id IN ({', '.join('?' * len(saved))})", saved,
+            )
+        for assignment_id, delta in deltas.items():
+            self._apply_stats(assignment_id, delta)
+        return results
+
+    # Search
+
+    def search_assignments(self, match, user_id, role, course_id=None, academic_year=None, limit=20):
+        sql, params = search.assignment_search(match, user_id, role, course_id, academic_year, limit)
+        return [search.assignment_hit(row) for row in self.conn.query(sql, params)]
+
+    def search_submissions(self, match, user_id, role, course_id=None, academic_year=None, limit=20):
+        sql, params = search.submission_search(match, user_id, role, course_id, academic_year, limit)
+        return [search.submission_hit(row) for row in self.conn.query(sql, params)]
@@ -0,0 +1,48 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Rendered response bodies for conditional GETs.
+# The versions of the resources a response depends on live in the database
+# (cache_versions): triggers bump them inside every write transaction
+# (migrations.add_cache_versions), so a write committed by any uvicorn worker
+# or by main_simple.py changes them for everyone. The route reads them in its
+# own transaction right before rendering; the ETag is derived from the
+# request key and those versions, so it is the same in every worker, and a
+# body cached here under an ETag is only served while the versions match.
+
+
+def response_etag(key: tuple, versions: dict) -> str:
+    # versions: resource -> version; a resource never written has no row
+    digest = hashlib.blake2b(repr((key, sorted(versions.items()))).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, etag: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, etag: str, body: bytes):
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, TypeAdapter
 from typing import Optional, List, Dict
 from datetime import datetime
 
+# Request/response schemas shared by main.py and main_simple.py
+
 # User schemas
 class UserCreate(BaseModel):
     email: EmailStr
@@ -17,7 +19,7 @@ class UserOut(BaseModel):
     username: str
     full_name: str
     role: str
-    group: Optional[str]
+    group: Optional[str] = None
 
 class UserLogin(BaseModel):
     username: str
@@ -57,6 +59,7 @@ class AssignmentCreate(BaseModel):
     max_score: float = 100
     criteria: List[Criteria]
     deadline: datetime
+    max_upload_size: Optional[int] = None
 
 class AssignmentOut(BaseModel):
     id: int
@@ -66,6 +69,18 @@ class AssignmentOut(BaseModel):
     max_score: float
     criteria: List[Dict]
     deadline: datetime
+    max_upload_size: Optional[int] = None
+
+# Submission schemas
+class SubmissionOut(BaseModel):
+    id: int
+    student_name: Optional[str]
+    file_name: Optional[str]
+    submitted_at: Optional[datetime]
+    status: Optional[str]
+    processing_status: Optional[str]
+    grade: Optional[float]
+    feedback: Optional[str]
 
 # Grade schemas
 class GradeCreate(BaseModel):
@@ -78,4 +93,33 @@ class GradeOut(BaseModel):
     submission_id: int
     total_score: float
     feedback: str
-    graded_at: datetime
\ No newline at end of file
+    graded_at: datetime
+
+# Search schemas (snippet is HTML: escaped text with <mark> around the matches)
+class AssignmentHit(BaseModel):
+    id: int
+    course_id: int
+    course_code: str
+    academic_year: str
+    title: str
+    deadline: Optional[datetime]
+    snippet: Optional[str]
+
+class SubmissionHit(BaseModel):
+    id: int
+    assignment_id: int
+    assignment_title: str
+    student_name: Optional[str]
+    file_name: Optional[str]
+    submitted_at: Optional[datetime]
+    status: Optional[str]
+    snippet: Optional[str]
+
+class SearchResults(BaseModel):
+    assignments: List[AssignmentHit] = []
+    submissions: List[SubmissionHit] = []
+
+# List serializers, built once; validation and JSON encoding run in pydantic-core
+COURSE_LIST = TypeAdapter(List[CourseOut])
+ASSIGNMENT_LIST = TypeAdapter(List[AssignmentOut])
+SUBMISSION_LIST = TypeAdapter(List[SubmissionOut])
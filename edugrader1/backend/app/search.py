@@ -0,0 +1,155 @@
+import html
+import re
+from datetime import datetime
+from typing import List, Optional
+
+# Full-text search over assignments (title, description) and submissions
+# (comment, file_name). The FTS5 indexes assignments_fts / submissions_fts
+# are created by migration 6 (migrations.py) as external-content tables:
+# they store only the index, the text stays in the base tables, and triggers
+# keep them in sync on INSERT, DELETE and UPDATE of the indexed columns
+# (status updates of submissions do not touch the index).
+#
+# Every search is one statement: MATCH narrows the rows through the index,
+# the access rules and filters (course, academic year) join on primary keys,
+# and ORDER BY rank LIMIT n returns the best hits (rank is bm25 with the
+# column weights set in the migration). Ranking costs a lookup per match, so
+# the scope is also passed to FTS5 as an id range (see SCOPE below).
+# FTS5 has no SQLAlchemy construct; both repositories run the statements
+# built here. Timings: benchmarks/bench_search.py.
+
+MAX_QUERY_TERMS = 8
+SNIPPET_TOKENS = 12  # words around the matches
+SNIPPET_ELLIPSIS = "…"
+
+# Snippets are built with control characters around the matches, then the
+# text is HTML-escaped and the markers become <mark> tags: the indexed text is
+# user input and must not reach the page as markup
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> Optional[str]:
+    # User input -> FTS5 query: every word is quoted (no operators, no syntax
+    # errors) and all of them must match; the last one also matches as a prefix,
+    # so results show up while the word is still being typed
+    terms = _TERM.findall(text)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _parse_timestamp(value):
+    # Raw driver values: SQLAlchemy's DateTime text or CURRENT_TIMESTAMP
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _scope(role: str, user_id: int, course_id: Optional[int], academic_year: Optional[str]):
+    # Conditions on assignments a / courses c: what the user may see (teachers
+    # their courses, students the courses they are enrolled in, admins
+    # everything) and the filters
+    conditions, params = [], []
+    if role == "teacher":
+        conditions.append("c.teacher_id = ?")
+        params.append(user_id)
+    elif role == "student":
+        conditions.append("a.course_id IN (SELECT course_id FROM course_students WHERE student_id = ?)")
+        params.append(user_id)
+    if course_id is not None:
+        conditions.append("a.course_id = ?")
+        params.append(course_id)
+    if academic_year is not None:
+        conditions.append("c.academic_year = ?")
+        params.append(academic_year)
+    return conditions, params
+
+
+def _where(conditions: List[str]) -> str:
+    return "".join(f" AND {condition}" for condition in conditions)
+
+
+def _statement(select: str, match: str, conditions: List[str], params: list, limit: int):
+    return select + _where(conditions) + " ORDER BY rank LIMIT ?", [_MARK_START, _MARK_END, match] + params + [limit]
+
+
+ASSIGNMENT_HIT_COLUMNS = ("id", "course_id", "course_code", "academic_year", "title", "deadline", "snippet")
+ASSIGNMENT_SEARCH = f'''
+    SELECT a.id, a.course_id, c.code, c.academic_year, a.title, a.deadline,
+           snippet(assignments_fts, -1, ?, ?, '{SNIPPET_ELLIPSIS}', {SNIPPET_TOKENS})
+    FROM assignments_fts
+    JOIN assignments a ON a.id = assignments_fts.rowid
+    JOIN courses c ON c.id = a.course_id
+    WHERE assignments_fts MATCH ?
+'''
+
+SUBMISSION_HIT_COLUMNS = ("id", "assignment_id", "assignment_title", "student_name", "file_name", "submitted_at",
+                          "status", "snippet")
+SUBMISSION_SEARCH = f'''
+    SELECT s.id, s.assignment_id, a.title, u.full_name, s.file_name, s.submitted_at, s.status,
+           snippet(submissions_fts, -1, ?, ?, '{SNIPPET_ELLIPSIS}', {SNIPPET_TOKENS})
+    FROM submissions_fts
+    JOIN submissions s ON s.id = submissions_fts.rowid
+    JOIN assignments a ON a.id = s.assignment_id
+    JOIN courses c ON c.id = a.course_id
+    JOIN users u ON u.id = s.student_id
+    WHERE submissions_fts MATCH ?
+'''
+
+
+# Ids grow with time, so one course or academic year is a narrow id range.
+# The id range of the scope goes to FTS5 as a rowid constraint: only the
+# matches inside it are ranked, so a search in this year's courses costs the
+# same in the fifth year as in the first. The exact conditions still apply.
+SCOPE = "FROM assignments a JOIN courses c ON c.id = a.course_id WHERE 1"
+ASSIGNMENT_BOUNDS = "assignments_fts.rowid BETWEEN (SELECT MIN(a.id) {scope}) AND (SELECT MAX(a.id) {scope})"
+SUBMISSION_BOUNDS = (
+    "submissions_fts.rowid BETWEEN"
+    " (SELECT MIN((SELECT MIN(id) FROM submissions WHERE assignment_id = a.id)) {scope})"
+    " AND (SELECT MAX((SELECT MAX(id) FROM submissions WHERE assignment_id = a.id)) {scope})"
+)
+
+
+def _bounded(bounds: str, conditions: List[str], params: list):
+    if not conditions:
+        return conditions, params  # admin without filters: everything is in scope
+    return conditions + [bounds.format(scope=SCOPE + _where(conditions))], params * 3
+
+
+def assignment_search(match: str, user_id: int, role: str, course_id: Optional[int] = None,
+                      academic_year: Optional[str] = None, limit: int = 20):
+    # (sql, qmark params); match comes from fts_query()
+    conditions, params = _bounded(ASSIGNMENT_BOUNDS, *_scope(role, user_id, course_id, academic_year))
+    return _statement(ASSIGNMENT_SEARCH, match, conditions, params, limit)
+
+
+def submission_search(match: str, user_id: int, role: str, course_id: Optional[int] = None,
+                      academic_year: Optional[str] = None, limit: int = 20):
+    conditions, params = _bounded(SUBMISSION_BOUNDS, *_scope(role, user_id, course_id, academic_year))
+    if role == "student":
+        # Students only find their own submissions
+        conditions, params = conditions + ["s.student_id = ?"], params + [user_id]
+    return _statement(SUBMISSION_SEARCH, match, conditions, params, limit)
+
+
+def assignment_hit(row) -> dict:
+    hit = dict(zip(ASSIGNMENT_HIT_COLUMNS, row))
+    hit["deadline"] = _parse_timestamp(hit["deadline"])
+    hit["snippet"] = highlight(hit["snippet"])
+    return hit
+
+
+def submission_hit(row) -> dict:
+    hit = dict(zip(SUBMISSION_HIT_COLUMNS, row))
+    hit["submitted_at"] = _parse_timestamp(hit["submitted_at"])
+    hit["snippet"] = highlight(hit["snippet"])
+    return hit
@@ -0,0 +1,88 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import CursorResult
+
+# AsyncSession-compatible wrapper around a regular sync Session.
+# Routes are written once against the AsyncSession API
+# (await db.execute(...), await db.commit(), ...). In sync mode every call
+# that touches the database runs in the thread pool, so the event loop is
+# never blocked by driver I/O in either mode.
+
+
+def _buffered(result):
+    # ORM results are prebuffered by the execution option below; Core results
+    # with rows are fetched here, inside the worker thread, like AsyncSession does
+    if isinstance(result, CursorResult) and result.returns_rows:
+        return result.freeze()()
+    return result
+
+
+class ThreadedStream:
+    # Minimal AsyncResult counterpart: rows are fetched in batches in the thread pool
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size):
+        while True:
+            rows = await run_in_threadpool(self._result.fetchmany, size)
+            if not rows:
+                return
+            yield rows
+
+    async def close(self):
+        await run_in_threadpool(self._result.close)
+
+
+class ThreadedSession:
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def info(self):
+        return self.sync_session.info
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, execution_options=None, **kwargs):
+        execution_options = {**(execution_options or {}), "prebuffer_rows": True}
+        return await run_in_threadpool(lambda: _buffered(
+            self.sync_session.execute(statement, params, execution_options=execution_options, **kwargs)
+        ))
+
+    async def stream(self, statement, params=None, execution_options=None, **kwargs):
+        execution_options = {**(execution_options or {}), "stream_results": True}
+        result = await run_in_threadpool(
+            self.sync_session.execute, statement, params, execution_options=execution_options, **kwargs
+        )
+        return ThreadedStream(result)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        result = await self.execute(statement, params, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
@@ -0,0 +1,52 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from repository import REPOSITORY_KINDS
+
+# Runtime configuration of main.py. create_app() takes a Settings; by default
+# it is read from the EDUGRADER_* environment variables. Nothing here touches
+# the disk or the database.
+#
+# EDUGRADER_DB_MODE=sync  - routes use a regular Session, each DB call runs in the thread pool
+# EDUGRADER_DB_MODE=async - routes use AsyncSession over an async driver (aiosqlite locally,
+#                           asyncpg/aiomysql work the same via EDUGRADER_ASYNC_DATABASE_URL)
+# EDUGRADER_WRITE_QUEUE=0 - on SQLite, run the hot writes in the request session
+#                           instead of the group-committing writer (see write_queue.py)
+# EDUGRADER_QUERY_BUDGET  - requests running more SQL queries are logged as a warning (likely N+1)
+# EDUGRADER_REPOSITORY=orm|sql - storage implementation behind the shared routes (see repository.py)
+
+DB_MODES = ("sync", "async")
+
+
+@dataclass(frozen=True)
+class Settings:
+    db_mode: str = "sync"
+    database_url: str = "sqlite:///./edugrader.db"
+    async_database_url: str = "sqlite+aiosqlite:///./edugrader.db"
+    upload_dir: Path = Path("uploads")
+    write_queue: bool = True
+    query_budget: int = 20
+    repository: str = "orm"
+
+    def __post_init__(self):
+        if self.db_mode not in DB_MODES:
+            raise ValueError(f"EDUGRADER_DB_MODE must be 'sync' or 'async', got {self.db_mode!r}")
+        if self.repository not in REPOSITORY_KINDS:
+            raise ValueError(f"EDUGRADER_REPOSITORY must be 'orm' or 'sql', got {self.repository!r}")
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            db_mode=os.getenv("EDUGRADER_DB_MODE", cls.db_mode),
+            database_url=os.getenv("EDUGRADER_DATABASE_URL", cls.database_url),
+            async_database_url=os.getenv("EDUGRADER_ASYNC_DATABASE_URL", cls.async_database_url),
+            upload_dir=Path(os.getenv("EDUGRADER_UPLOAD_DIR", str(cls.upload_dir))),
+            write_queue=os.getenv("EDUGRADER_WRITE_QUEUE", "1") != "0",
+            query_budget=int(os.getenv("EDUGRADER_QUERY_BUDGET", str(cls.query_budget))),
+            repository=os.getenv("EDUGRADER_REPOSITORY", cls.repository),
+        )
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.database_url.startswith("sqlite")
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+
+DEFAULT_MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50 MB, used when the assignment sets no limit
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the {max_size} byte limit")
+        self.max_size = max_size
+
+
+@dataclass
+class StoredFile:
+    path: Path
+    sha256: str
+    size: int
+
+
+def _write_chunk(buffer, hasher, chunk: bytes):
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def _discard(buffer):
+    buffer.close()
+    os.unlink(buffer.name)
+
+
+# Content-addressed file store: files live at <root>/<sha[:2]>/<sha>.
+# Uploads are written through open() chunk by chunk as they arrive
+# (uploads.py), hashing and disk writes run in the thread pool so a large
+# file never blocks the event loop, and identical content is stored only once.
+class SubmissionStorage:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    async def open(self, max_size: int = DEFAULT_MAX_UPLOAD_SIZE) -> "UploadWriter":
+        buffer = await run_in_threadpool(
+            tempfile.NamedTemporaryFile, dir=self.root, prefix=".upload-", delete=False
+        )
+        return UploadWriter(self, buffer, max_size)
+
+    def _commit(self, buffer, sha256: str) -> Path:
+        buffer.close()
+        path = self.path_for(sha256)
+        if path.exists():
+            # Same content is already stored - keep the existing copy
+            os.unlink(buffer.name)
+            return path
+        path.parent.mkdir(exist_ok=True)
+        os.replace(buffer.name, path)
+        return path
+
+
+class UploadWriter:
+    # One file being written into the store: write() chunks as they arrive,
+    # then finish() to move it to its content address, or discard()
+    def __init__(self, storage: SubmissionStorage, buffer, max_size: int):
+        self.storage = storage
+        self.buffer = buffer
+        self.max_size = max_size
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadTooLarge(self.max_size)
+        await run_in_threadpool(_write_chunk, self.buffer, self.hasher, chunk)
+
+    async def discard(self):
+        await run_in_threadpool(_discard, self.buffer)
+
+    async def finish(self) -> StoredFile:
+        sha256 = self.hasher.hexdigest()
+        path = await run_in_threadpool(self.storage._commit, self.buffer, sha256)
+        return StoredFile(path=path, sha256=sha256, size=self.size)
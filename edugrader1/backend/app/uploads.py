@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from storage import StoredFile, SubmissionStorage, UploadTooLarge
+
+# Multipart upload read straight from the request stream.
+# Starlette's form parser spools the whole body to a temporary file before
+# the route runs, so a size limit checked afterwards still costs the full
+# disk space and I/O. Here the file part is written into SubmissionStorage
+# as it arrives, with a running byte count: an oversized upload is rejected
+# on its Content-Length before anything is written, or else as soon as the
+# count passes the limit. The limit may depend on the text fields (the
+# assignment), so they have to come before the file - browsers and HTTP
+# clients send FormData in that order.
+
+MAX_FIELD_SIZE = 64 * 1024  # per text field
+FORM_OVERHEAD = 64 * 1024  # boundaries, part headers and text fields around the file
+
+# OpenAPI request body of the submission upload routes, which read the form
+# themselves instead of declaring Form/File parameters
+UPLOAD_FORM = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["assignment_id", "file"],
+    "properties": {"assignment_id": {"type": "integer"}, "comment": {"type": "string"},
+                   "file": {"type": "string", "format": "binary"}},
+}}}}}
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+@dataclass
+class ReceivedForm:
+    fields: Dict[str, str] = field(default_factory=dict)
+    file_name: Optional[str] = None
+    stored: Optional[StoredFile] = None
+
+
+def _part_name(headers: List[Tuple[bytes, bytes]]):
+    # (name, filename) from the part's Content-Disposition
+    for name, value in headers:
+        if name.lower() == b"content-disposition":
+            _, options = parse_options_header(value)
+            filename = options.get(b"filename")
+            return (options.get(b"name", b"").decode("latin-1"),
+                    filename.decode("utf-8", "replace") if filename is not None else None)
+    raise InvalidUpload("Multipart part without Content-Disposition")
+
+
+class _PartEvents:
+    # The parser's callbacks are synchronous: they queue events, which
+    # receive_form handles (awaiting the database and the disk) after each
+    # network chunk
+    def __init__(self):
+        self.queue = []
+        self.headers = []
+        self.header_name = b""
+        self.header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.headers.clear,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": lambda: self.queue.append(("headers", list(self.headers))),
+            "on_part_data": lambda data, start, end: self.queue.append(("data", data[start:end])),
+            "on_part_end": lambda: self.queue.append(("end", None)),
+        }
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers.append((self.header_name, self.header_value))
+        self.header_name = self.header_value = b""
+
+
+async def receive_form(request: Request, storage: SubmissionStorage, file_field: str,
+                       max_size_for: Callable[[Dict[str, str]], Awaitable[int]]) -> ReceivedForm:
+    # max_size_for(fields) is awaited when the file part starts, with the text
+    # fields received so far, and returns the file's size limit in bytes
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise InvalidUpload("Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length", "")
+
+    events = _PartEvents()
+    parser = MultipartParser(options[b"boundary"], events.callbacks())
+
+    form = ReceivedForm()
+    name = None
+    value = b""
+    writer = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events.queue:
+                if kind == "headers":
+                    name, file_name = _part_name(payload)
+                    value = b""
+                    if name == file_field and file_name is not None:
+                        if form.stored is not None or writer is not None:
+                            raise InvalidUpload(f"More than one '{file_field}' part")
+                        max_size = await max_size_for(form.fields)
+                        if content_length.isdigit() and int(content_length) > max_size + FORM_OVERHEAD:
+                            raise UploadTooLarge(max_size)
+                        form.file_name = file_name
+                        writer = await storage.open(max_size)
+                elif kind == "data":
+                    if writer is not None:
+                        await writer.write(payload)
+                    else:
+                        value += payload
+                        if len(value) > MAX_FIELD_SIZE:
+                            raise InvalidUpload(f"Form field '{name}' exceeds {MAX_FIELD_SIZE} bytes")
+                elif kind == "end":
+                    if writer is not None:
+                        form.stored = await writer.finish()
+                        writer = None
+                    elif name is not None:
+                        form.fields[name] = value.decode("utf-8", "replace")
+                    name = None
+            events.queue.clear()
+        parser.finalize()
+    except MultipartParseError as e:
+        if writer is not None:
+            await writer.discard()
+        raise InvalidUpload(f"Malformed multipart body: {e}")
+    except BaseException:
+        if writer is not None:
+            await writer.discard()
+        raise
+    if writer is not None:
+        await writer.discard()
+        raise InvalidUpload("Multipart body ended inside the file")
+    if form.stored is None:
+        raise InvalidUpload(f"Missing '{file_field}' file")
+    return form
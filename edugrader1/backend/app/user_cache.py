@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process LRU cache of users rows with a TTL.
+# Entries are plain dicts of column values, so they never hold on to a
+# session; main.get_current_user turns them back into ORM objects.
+# Each worker has its own cache: writes in this process invalidate it right
+# away, writes in other workers are picked up once the TTL expires.
+
+
+class UserCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def put(self, user_id: int, values: dict):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+
+from metrics import Histogram, InstanceGauge
+
+# Single writer with group commits for SQLite.
+# SQLite lets one connection write at a time. Request sessions that read first
+# and write later run into "database is locked" under load: the read
+# transaction cannot be upgraded while another connection commits, and
+# busy_timeout does not help there. Here every queued write runs on one
+# dedicated thread and connection. The writer takes whatever is queued (up to
+# max_batch), runs each operation in its own SAVEPOINT inside one
+# BEGIN IMMEDIATE transaction and commits once - one fsync for the whole group.
+# A failing operation only rolls back its savepoint and gets its exception.
+#
+# With several uvicorn workers every process has its own writer; BEGIN
+# IMMEDIATE takes the write lock up front, so writers of different processes
+# wait on busy_timeout instead of failing, and each lock turn commits a group.
+# Readers use WAL and never wait for the writer.
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers do not block the writer and vice versa
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, no fsync per commit
+)
+READ_BUSY_TIMEOUT = 5000  # ms, request sessions (the sqlite3 default)
+WRITE_BUSY_TIMEOUT = 30000  # ms, the writer waits out the writers of other processes
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+COMMIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+logger = logging.getLogger("edugrader.writes")
+
+batch_size = Histogram("edugrader_write_batch_size", "Write operations per group commit", BATCH_BUCKETS)
+commit_seconds = Histogram("edugrader_write_commit_seconds", "Time spent running a group commit", COMMIT_BUCKETS)
+queue_depth = InstanceGauge("edugrader_write_queue_depth", "Write operations waiting for the writer",
+                            lambda write_queue: write_queue._queue.qsize())
+
+_STOP = object()
+
+
+def configure_sqlite(engine, immediate: bool = False):
+    # WAL and busy_timeout on every new connection. immediate=True is for the
+    # writer: it takes the write lock at BEGIN and also makes pysqlite
+    # savepoints work, since the driver no longer opens transactions on its own.
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        if immediate:
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.execute(f"PRAGMA busy_timeout={WRITE_BUSY_TIMEOUT if immediate else READ_BUSY_TIMEOUT}")
+        cursor.close()
+
+    if immediate:
+        @event.listens_for(engine, "begin")
+        def begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class WriteQueue:
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self.session_factory = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        queue_depth.track(self)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    async def run(self, operation):
+        # operation(session) runs on the writer thread with a sync Session; its
+        # return value (or exception) comes back once the group is committed
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((operation, loop, future))
+        return await future
+
+    def start(self, session_factory):
+        # session_factory: sync sessions on a configure_sqlite(immediate=True) engine
+        with self._lock:
+            self.session_factory = session_factory
+            self._thread = threading.Thread(target=self._writer, name="edugrader-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Operations already queued are still committed
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            batch = [item for item in batch if item is not _STOP]
+            if batch:
+                self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        outcomes = []
+        session = self.session_factory()
+        try:
+            with session.begin():
+                for operation, _, _ in batch:
+                    try:
+                        with session.begin_nested():
+                            outcomes.append((operation(session), None))
+                    except Exception as e:
+                        outcomes.append((None, e))
+        except Exception as e:
+            # The commit itself failed: nothing in the group was written
+            logger.exception("Group commit of %d writes failed", len(batch))
+            outcomes = [(None, e)] * len(batch)
+        finally:
+            session.close()
+        batch_size.observe(len(batch))
+        commit_seconds.observe(time.perf_counter() - start)
+        for (_, loop, future), (result, error) in zip(batch, outcomes):
+            loop.call_soon_threadsafe(_resolve, future, result, error)
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return  # the request was cancelled while waiting
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
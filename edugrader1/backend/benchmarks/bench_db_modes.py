@@ -0,0 +1,69 @@
+# Benchmark of the sync and async database modes of main.py under concurrent load.
+# Each mode runs in its own process (EDUGRADER_DB_MODE is read at import) and
+# fires a mix of GET /api/courses and GET /api/submissions/assignment/{id}
+# requests from `--concurrency` concurrent clients.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_db_modes.py
+#   python benchmarks/bench_db_modes.py --concurrency 50 --requests 2000
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_app, seed_assignment
+
+
+async def drive(main, concurrency, requests):
+    import httpx
+
+    urls = []
+    timings = []
+
+    async def client_loop(client, count):
+        for i in range(count):
+            start = time.perf_counter()
+            response = await client.get(urls[i % len(urls)], headers=headers)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+
+    async with main.lifespan(main.app), httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        assignment_id, _, headers = seed_assignment(main, 100, tag="modes")
+        urls += ["/api/courses", f"/api/submissions/assignment/{assignment_id}?limit=50"]
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, requests // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{main.app.state.settings.db_mode:>6} {len(timings) / elapsed:>10.0f} {statistics.median(timings):>9.2f} {p95:>9.2f}")
+
+
+def child(concurrency, requests):
+    main = load_app(tempfile.mkdtemp(prefix="edugrader-bench-"))
+    asyncio.run(drive(main, concurrency, requests))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async database mode")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args.concurrency, args.requests)
+    else:
+        print(f"{'mode':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+        for mode in ("sync", "async"):
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode,
+                 "--concurrency", str(args.concurrency), "--requests", str(args.requests)],
+                env={**os.environ, "EDUGRADER_DB_MODE": mode},
+                check=True,
+            )
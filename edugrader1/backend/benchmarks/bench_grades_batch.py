@@ -0,0 +1,54 @@
+# Benchmark for POST /api/grades/batch
+# Seeds N ungraded submissions and grades them in batches, reporting
+# grades per second and the number of SQL queries per batch.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_grades_batch.py
+#   python benchmarks/bench_grades_batch.py --submissions 2000 --batch 100
+
+import argparse
+import tempfile
+import time
+
+from common import load_app, seed_assignment
+
+
+def run(submissions, batch):
+    from fastapi.testclient import TestClient
+
+    main = load_app(tempfile.mkdtemp(prefix="edugrader-bench-"))
+    with TestClient(main.app) as client:
+        measure(main, client, submissions, batch)
+
+
+def measure(main, client, submissions, batch):
+    from sqlalchemy import event
+
+    queries = []
+    for engine in (main.app.state.database.engine, main.app.state.database.write_engine):
+        if engine is not None:
+            event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+    _, submission_ids, headers = seed_assignment(main, submissions, tag="batch", graded=False)
+
+    queries.clear()
+    start = time.perf_counter()
+    for i in range(0, len(submission_ids), batch):
+        payload = [{"submission_id": sid, "scores": {"total": 75}, "feedback": "ok"}
+                   for sid in submission_ids[i:i + batch]]
+        response = client.post("/api/grades/batch", json=payload, headers=headers)
+        assert response.status_code == 200
+        assert all(item["status"] == "ok" for item in response.json())
+    elapsed = time.perf_counter() - start
+
+    batches = -(-submissions // batch)
+    print(f"graded {submissions} submissions in {batches} batches of {batch}")
+    print(f"{submissions / elapsed:.0f} grades/s, {len(queries) / batches:.1f} queries per batch")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch grading")
+    parser.add_argument("--submissions", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+    run(args.submissions, args.batch)
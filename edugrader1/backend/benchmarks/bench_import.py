@@ -0,0 +1,76 @@
+# Cold import time of the backends.
+# Every sample is a fresh interpreter in an empty directory, so nothing is
+# cached between runs. Three steps are timed for main.py:
+#   import         - `import main`; opens no database and creates no files
+#   import+migrate - import followed by main.migrate(), what the import used
+#                    to do on its own (create_all and the migrations)
+#   startup        - import and the lifespan of create_app() on an already
+#                    migrated database, what a uvicorn worker pays on start
+# main_simple.py is timed the same way with init_db() as its migrate step.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_import.py
+#   python benchmarks/bench_import.py --repeat 20
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import APP_DIR
+
+STEPS = {
+    "main": {
+        "import": "import main",
+        "import+migrate": "import main; main.migrate()",
+        "startup": (
+            "import asyncio, main\n"
+            "async def serve():\n"
+            "    async with main.lifespan(main.app):\n"
+            "        pass\n"
+            "asyncio.run(serve())"
+        ),
+    },
+    "main_simple": {
+        "import": "import main_simple",
+        "import+migrate": "import main_simple; main_simple.init_db()",
+    },
+}
+
+TIMER = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "{code}\n"
+    "elapsed = time.perf_counter() - start\n"
+    "import os\n"
+    "print(elapsed * 1000, len(os.listdir('.')))\n"
+)
+
+
+def sample(code, migrated):
+    workdir = tempfile.mkdtemp(prefix="edugrader-import-")
+    env = {**os.environ, "PYTHONPATH": str(APP_DIR), "PYTHONDONTWRITEBYTECODE": "1"}
+    if migrated:
+        subprocess.run([sys.executable, "-c", "import main; main.migrate()"], cwd=workdir, env=env, check=True)
+    output = subprocess.run([sys.executable, "-c", TIMER.format(code=code)], cwd=workdir, env=env,
+                            check=True, capture_output=True, text=True).stdout.split()
+    return float(output[0]), int(output[1]) - migrated
+
+
+def run(repeat):
+    print(f"{'module':<12} {'step':<15} {'p50 ms':>8} {'min ms':>8} {'files':>6}")
+    for module, steps in STEPS.items():
+        for step, code in steps.items():
+            samples = [sample(code, migrated=step == "startup") for _ in range(repeat)]
+            timings = [elapsed for elapsed, _ in samples]
+            print(f"{module:<12} {step:<15} {statistics.median(timings):>8.1f} {min(timings):>8.1f} "
+                  f"{samples[-1][1]:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cold import of the backends")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    run(args.repeat)
@@ -0,0 +1,309 @@
+# Contract checks and timings of the storage backends in repository*.py.
+# Every backend runs the same scenario on its own fresh database and must
+# return the same values; then each repository method is timed on a seeded
+# database. Backends:
+#   orm         - OrmRepository on a SQLAlchemy Session (main.py, EDUGRADER_REPOSITORY=orm)
+#   sql         - SqlRepository on the Session's connection (main.py, EDUGRADER_REPOSITORY=sql)
+#   sql/sqlite3 - SqlRepository on a plain sqlite3 connection, tables from
+#                 main_simple.init_db (main_simple.py)
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_repositories.py
+#   python benchmarks/bench_repositories.py --size 2000 --repeat 200
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from common import APP_DIR
+
+sys.path.insert(0, str(APP_DIR))
+
+from migrations import migrate_engine  # noqa: E402
+from models import Base  # noqa: E402
+from repository import (ASSIGNMENT_COLUMNS, COURSE_COLUMNS, SUBMISSION_COLUMNS, USER_COLUMNS,  # noqa: E402
+                        InvalidGrade)
+from repository_orm import OrmRepository  # noqa: E402
+from repository_sql import SqlRepository  # noqa: E402
+from write_queue import configure_sqlite  # noqa: E402
+
+DEADLINE = datetime(2030, 1, 1, 23, 59)
+CRITERIA = [{"name": "code", "max_score": 60.0}, {"name": "report", "max_score": 40.0}]
+
+
+class Backend:
+    def __init__(self, repo, commit, query, close):
+        self.repo = repo
+        self.commit = commit
+        self.query = query  # raw SQL for checks the interface does not expose
+        self.close = close
+
+
+def session_backend(path, kind):
+    engine = create_engine(f"sqlite:///{path}")
+    configure_sqlite(engine)  # same pragmas as main.py, so only the repository differs
+    Base.metadata.create_all(bind=engine)
+    migrate_engine(engine)
+    session = sessionmaker(bind=engine)()
+    repo = OrmRepository.from_session(session) if kind == "orm" else SqlRepository.from_session(session)
+
+    def query(sql):
+        return [tuple(row) for row in session.connection().exec_driver_sql(sql).fetchall()]
+
+    def close():
+        session.close()
+        engine.dispose()
+
+    return Backend(repo, session.commit, query, close)
+
+
+def sqlite3_backend(path):
+    # main_simple.py's own schema: init_db() plus the migrations, on its per-thread connection
+    import main_simple
+
+    main_simple.DB_PATH = path
+    main_simple._local.conn = None
+    main_simple.init_db()
+    conn = main_simple.get_db()
+    return Backend(SqlRepository.from_sqlite3(conn), conn.commit,
+                   lambda sql: [tuple(row) for row in conn.execute(sql).fetchall()], conn.close)
+
+
+BACKENDS = {
+    "orm": lambda path: session_backend(path, "orm"),
+    "sql": lambda path: session_backend(path, "sql"),
+    "sql/sqlite3": sqlite3_backend,
+}
+
+
+def comparable(value):
+    # Timestamps differ between runs; their type must not
+    if isinstance(value, datetime):
+        return "<datetime>"
+    if isinstance(value, dict):
+        return {key: comparable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [comparable(item) for item in value]
+    return value
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def run_contract(backend):
+    # Returns everything the repository returned, for comparison between backends
+    repo = backend.repo
+    results = []
+
+    def record(name, value):
+        results.append((name, comparable(value)))
+        return value
+
+    teacher = record("create_user", repo.create_user("t@bench.local", "teacher", "Teacher", "x", role="teacher"))
+    check(tuple(teacher) == USER_COLUMNS, f"create_user keys: {tuple(teacher)}")
+    check(isinstance(teacher["created_at"], datetime), "created_at is not a datetime")
+    students = [repo.create_user(f"s{i}@bench.local", f"s{i}", f"Student {i}", "x", group="IS-21")
+                for i in range(3)]
+    backend.commit()
+    check(repo.user_exists("s0", "nobody@bench.local"), "user_exists by username")
+    check(repo.user_exists("nobody", "s1@bench.local"), "user_exists by email")
+    check(not repo.user_exists("nobody", "nobody@bench.local"), "user_exists for a missing user")
+    user = record("get_user_by_username", repo.get_user_by_username("s0"))
+    check(user == students[0], f"get_user_by_username: {user} != {students[0]}")
+    check(repo.get_user_by_username("nobody") is None, "missing user is not None")
+
+    course = record("create_course", repo.create_course(teacher["id"], "Databases", "DB-1", None, "2025/2026", 1))
+    check(tuple(course) == COURSE_COLUMNS + ("students_count",), f"create_course keys: {tuple(course)}")
+    other = repo.create_course(teacher["id"], "Networks", "NET-1", "TCP/IP", "2025/2026", 2)
+    check(record("enroll", repo.enroll(course["id"], [s["id"] for s in students[:2]])) == 2, "enroll count")
+    check(record("enroll again", repo.enroll(course["id"], [students[0]["id"], students[2]["id"]])) == 1,
+          "existing enrollments must be skipped")
+    check(repo.enroll(course["id"], []) == 0, "empty enroll")
+    backend.commit()
+
+    courses = record("list_courses teacher", repo.list_courses(teacher["id"], "teacher"))
+    check([c["id"] for c in courses] == [course["id"], other["id"]], "teacher courses ordered by id")
+    check([c["students_count"] for c in courses] == [3, 0], f"students_count: {courses}")
+    check(len(record("list_courses student", repo.list_courses(students[0]["id"], "student"))) == 1,
+          "student sees enrolled courses only")
+    check(len(repo.list_courses(teacher["id"], "admin")) == 2, "admin sees every course")
+    check([c["id"] for c in record("list_courses semester", repo.list_courses(
+        teacher["id"], "teacher", academic_year="2025/2026", semester=2))] == [other["id"]], "course filters")
+    check(repo.list_courses(teacher["id"], "admin", academic_year="2024/2025") == [], "academic year filter")
+    check([c["id"] for c in repo.list_courses(teacher["id"], "admin", after_id=course["id"], limit=1)]
+          == [other["id"]], "course keyset page")
+    check(repo.get_course(course["id"]) == {k: course[k] for k in COURSE_COLUMNS}, "get_course")
+    check(repo.get_course(10 ** 6) is None, "missing course is not None")
+
+    assignment = record("create_assignment", repo.create_assignment(
+        course["id"], "Lab 1", "SQL joins", 100.0, CRITERIA, DEADLINE, max_upload_size=1024))
+    check(tuple(assignment) == ASSIGNMENT_COLUMNS, f"create_assignment keys: {tuple(assignment)}")
+    second = repo.create_assignment(course["id"], "Lab 2", None, 50.0, [], DEADLINE + timedelta(days=7))
+    backend.commit()
+    check(repo.get_assignment(assignment["id"]) == assignment, "get_assignment round trip (criteria, deadline)")
+    check(record("list_assignments", repo.list_assignments(course["id"])) == [assignment, second],
+          "list_assignments ordered by id")
+    check(record("list_assignments window", repo.list_assignments(
+        course["id"], deadline_from=DEADLINE + timedelta(days=1))) == [second], "deadline window start")
+    check(repo.list_assignments(course["id"], deadline_from=DEADLINE, deadline_to=DEADLINE) == [assignment],
+          "deadline window includes both ends")
+    check(repo.list_assignments(course["id"], after_id=assignment["id"], limit=5) == [second],
+          "assignment keyset page")
+    check(backend.query("SELECT COUNT(*) FROM assignment_stats")[0][0] == 2, "stats rows created with assignments")
+
+    submissions = []
+    for student in students:
+        submission = repo.create_submission(assignment["id"], student["id"], f"/files/{student['id']}", "lab.zip",
+                                            "done", file_sha256="ab" * 32, file_size=10)
+        submissions.append(submission)
+    backend.commit()
+    record("create_submission", submissions[0])
+    check(set(submissions[0]) == set(SUBMISSION_COLUMNS) | {"job_id"}, f"create_submission keys: {submissions[0]}")
+    check(submissions[0]["processing_status"] == "pending" and submissions[0]["job_id"], "submission job queued")
+    stored = repo.get_submission(submissions[0]["id"])
+    check(stored == {k: submissions[0][k] for k in SUBMISSION_COLUMNS}, "get_submission round trip")
+    check(repo.get_submission(10 ** 6) is None, "missing submission is not None")
+
+    grade = record("save_grade", repo.save_grade(submissions[0]["id"], teacher["id"], {"code": 50, "report": 30}, "ok"))
+    regrade = record("save_grade again", repo.save_grade(submissions[0]["id"], teacher["id"], {"code": 60, "report": 35},
+                                                         "better"))
+    try:
+        repo.save_grade(submissions[0]["id"], teacher["id"], {"code": 600, "zzz": 40}, "too much")
+        rejected = None
+    except InvalidGrade as e:
+        rejected = str(e)
+    check(record("save_grade invalid", rejected) == "Score for 'code' exceeds 60.0", f"save_grade validates: {rejected}")
+    backend.commit()
+    check(regrade["id"] == grade["id"] and regrade["total_score"] == 95, "regrading replaces the grade")
+    check(repo.get_submission(submissions[0]["id"])["status"] == "graded", "submission marked graded")
+    stats = record("stats", backend.query(
+        f"SELECT submission_count, graded_count, score_sum, score_sq_sum FROM assignment_stats "
+        f"WHERE assignment_id = {assignment['id']}")[0])
+    check(stats == (3, 1, 95.0, 9025.0), f"assignment stats: {stats}")
+    buckets = record("stats buckets", backend.query(
+        f"SELECT bucket, count FROM assignment_score_buckets WHERE assignment_id = {assignment['id']} AND count != 0"))
+    check(buckets == [(9, 1)], f"histogram buckets: {buckets}")
+    criteria = record("stats criteria", backend.query(
+        f"SELECT criterion, score_sum FROM assignment_criterion_sums WHERE assignment_id = {assignment['id']} "
+        f"ORDER BY criterion"))
+    check(criteria == [("code", 60.0), ("report", 35.0)], f"criteria sums: {criteria}")
+
+    listed = record("list_submissions", repo.list_submissions(assignment["id"]))
+    check([s["id"] for s in listed] == [s["id"] for s in submissions], "list_submissions ordered by id")
+    check(listed[0]["grade"] == 95 and listed[0]["feedback"] == "better" and listed[1]["grade"] is None,
+          "grades joined into the list")
+    own = record("list_submissions student", repo.list_submissions(assignment["id"], student_id=students[1]["id"]))
+    check([s["id"] for s in own] == [submissions[1]["id"]], "student filter")
+    page = record("list_submissions page", repo.list_submissions(assignment["id"], after_id=submissions[0]["id"],
+                                                                 limit=1))
+    check([s["id"] for s in page] == [submissions[1]["id"]], "keyset page")
+    graded = record("list_submissions status", repo.list_submissions(assignment["id"], status="graded"))
+    check([s["id"] for s in graded] == [submissions[0]["id"]], "status filter")
+    check(len(repo.list_submissions(assignment["id"], group="IS-21")) == 3, "group filter")
+    check(repo.list_submissions(assignment["id"], group="IS-22") == [], "group filter without matches")
+
+    batch = record("save_grades", repo.save_grades(teacher["id"], [
+        {"submission_id": submissions[1]["id"], "scores": {"code": 40, "report": 20}, "feedback": "batch"},
+        {"submission_id": submissions[0]["id"], "scores": {"code": 50, "report": 30}, "feedback": "regraded"},
+        {"submission_id": submissions[1]["id"], "scores": {"code": 1}, "feedback": "twice"},
+        {"submission_id": submissions[2]["id"], "scores": {"style": 5}, "feedback": ""},
+        {"submission_id": 10 ** 6, "scores": {}, "feedback": ""},
+    ]))
+    backend.commit()
+    check([r["status"] for r in batch] == ["ok", "ok", "error", "error", "error"], f"save_grades: {batch}")
+    check([r["detail"] for r in batch[2:]] == ["Duplicate submission in batch", "Unknown criterion 'style'",
+                                                "Submission not found"], f"save_grades errors: {batch[2:]}")
+    check(batch[0]["course_id"] == course["id"] and batch[0]["student_id"] == students[1]["id"],
+          "save_grades results carry the submission")
+    graded = repo.list_submissions(assignment["id"], status="graded")
+    check([s["id"] for s in graded] == [submissions[0]["id"], submissions[1]["id"]], "batch marks graded")
+    check([s["grade"] for s in graded] == [80, 60], "batch regrade replaces the grade")
+    stats = record("stats after batch", backend.query(
+        f"SELECT submission_count, graded_count, score_sum, score_sq_sum FROM assignment_stats "
+        f"WHERE assignment_id = {assignment['id']}")[0])
+    check(stats == (3, 2, 140.0, 10000.0), f"assignment stats after batch: {stats}")
+    buckets = record("stats buckets after batch", backend.query(
+        f"SELECT bucket, count FROM assignment_score_buckets WHERE assignment_id = {assignment['id']} AND count != 0"))
+    check(buckets == [(6, 1), (8, 1)], f"histogram buckets after batch: {buckets}")
+    return results
+
+
+def seed(repo, commit, size):
+    teacher = repo.create_user("t@bench.local", "teacher", "Teacher", "x", role="teacher")
+    course = repo.create_course(teacher["id"], "Bench", "BENCH", None, "2025/2026", 1)
+    assignment = repo.create_assignment(course["id"], "Lab", None, 100.0, CRITERIA, DEADLINE)
+    students = [repo.create_user(f"s{i}@bench.local", f"s{i}", f"Student {i}", "x") for i in range(size)]
+    repo.enroll(course["id"], [s["id"] for s in students])
+    submissions = [repo.create_submission(assignment["id"], s["id"], "", "lab.zip", None) for s in students]
+    for submission in submissions[::2]:
+        repo.save_grade(submission["id"], teacher["id"], {"code": 40, "report": 30}, "ok")
+    commit()
+    return teacher, course, assignment, students, submissions
+
+
+def timed(operation, repeat, commit=None):
+    start = time.perf_counter()
+    for i in range(repeat):
+        operation(i)
+        if commit is not None:
+            commit()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run_timings(backend, size, repeat):
+    repo = backend.repo
+    teacher, course, assignment, students, submissions = seed(repo, backend.commit, size)
+    middle = submissions[size // 2]["id"]
+    return {
+        "get_user_by_username": timed(lambda i: repo.get_user_by_username(f"s{i % size}"), repeat),
+        "list_courses": timed(lambda i: repo.list_courses(teacher["id"], "teacher"), repeat),
+        "list_assignments": timed(lambda i: repo.list_assignments(course["id"]), repeat),
+        f"list_submissions ({size})": timed(lambda i: repo.list_submissions(assignment["id"]), repeat),
+        "list_submissions page 50": timed(lambda i: repo.list_submissions(assignment["id"], after_id=middle,
+                                                                          limit=50), repeat),
+        "create_submission+commit": timed(lambda i: repo.create_submission(
+            assignment["id"], students[i % size]["id"], "", "lab.zip", None), repeat, backend.commit),
+        "save_grade+commit": timed(lambda i: repo.save_grade(
+            submissions[i % size]["id"], teacher["id"], {"code": 50, "report": i % 40}, "ok"), repeat, backend.commit),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Contract checks and timings of the storage backends")
+    parser.add_argument("--size", type=int, default=500, help="students/submissions in the timing database")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="edugrader-bench-")
+    os.chdir(workdir)
+
+    transcripts = {}
+    for name, make in BACKENDS.items():
+        backend = make(os.path.join(workdir, f"contract-{name.replace('/', '-')}.db"))
+        try:
+            transcripts[name] = run_contract(backend)
+        finally:
+            backend.close()
+    reference = transcripts["orm"]
+    for name, transcript in transcripts.items():
+        for (step, expected), (_, actual) in zip(reference, transcript):
+            check(expected == actual, f"{name} differs from orm in {step}:\n  orm: {expected}\n  {name}: {actual}")
+    print(f"contract: {len(reference)} results identical across {', '.join(transcripts)}")
+
+    timings = {}
+    for name, make in BACKENDS.items():
+        backend = make(os.path.join(workdir, f"timing-{name.replace('/', '-')}.db"))
+        try:
+            timings[name] = run_timings(backend, args.size, args.repeat)
+        finally:
+            backend.close()
+    print(f"\n{'us per call':<28}" + "".join(f"{name:>13}" for name in timings))
+    for operation in timings["orm"]:
+        print(f"{operation:<28}" + "".join(f"{timings[name][operation]:>13.0f}" for name in timings))
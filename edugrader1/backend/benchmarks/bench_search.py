@@ -0,0 +1,118 @@
+# Benchmark of /api/search's queries (search.py) as history accumulates.
+# Seeds one academic year at a time (courses, assignments, commented
+# submissions - the FTS5 triggers index them on insert) and after each year
+# times the ranked search of submissions for a common, a medium and a rare
+# word: unscoped (admin), in one teacher's courses (one course a year) and in
+# the current academic year. Only the matches inside the id range of the
+# scope are ranked (search.SCOPE), so the year-scoped search should stay flat.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_search.py
+#   python benchmarks/bench_search.py --years 8 --courses 40
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from common import APP_DIR
+
+sys.path.insert(0, str(APP_DIR))
+
+from migrations import migrate_engine  # noqa: E402
+from models import Base  # noqa: E402
+from repository_sql import SqlRepository  # noqa: E402
+from search import fts_query  # noqa: E402
+
+# Word frequencies follow Zipf's law like real text: VOCABULARY[0] is in
+# ~15% of the submissions, rank 50 in ~0.5%, rank 2000 in ~0.01%
+VOCABULARY = [f"w{rank}" for rank in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+QUERIES = {"common": "w0", "medium": "w50", "rare": "w2000"}
+
+def text(rng, words):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words))
+
+
+def seed_year(conn, rng, year, courses, assignments, submissions, teacher_id, student_ids):
+    # Teacher 1 teaches the first course of every year
+    academic_year = f"{2000 + year}/{2001 + year}"
+    for number in range(courses):
+        course_id = conn.execute(
+            "INSERT INTO courses (name, code, teacher_id, academic_year, semester) VALUES (?, ?, ?, ?, 1)",
+            (f"Course {number}", f"C{year}-{number}", teacher_id if number == 0 else teacher_id + 1, academic_year),
+        ).lastrowid
+        for _ in range(assignments):
+            assignment_id = conn.execute(
+                "INSERT INTO assignments (course_id, title, description, max_score, criteria, deadline) "
+                "VALUES (?, ?, ?, 100, '[]', '2030-01-01 00:00:00.000000')",
+                (course_id, text(rng, 3), text(rng, 30)),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO submissions (assignment_id, student_id, file_path, file_name, comment, status, "
+                "submitted_at, processing_status) VALUES (?, ?, '', ?, ?, 'submitted', "
+                "'2025-01-01 00:00:00.000000', 'ready')",
+                [(assignment_id, rng.choice(student_ids), f"report_{i}.pdf", text(rng, 12))
+                 for i in range(submissions)],
+            )
+    conn.commit()
+    return academic_year
+
+
+def timed(operation, repeat):
+    operation()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark full-text search as academic years accumulate")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--courses", type=int, default=20, help="courses per year")
+    parser.add_argument("--assignments", type=int, default=10, help="assignments per course")
+    parser.add_argument("--submissions", type=int, default=30, help="submissions per assignment")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="edugrader-bench-"), "edugrader.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    migrate_engine(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    rng = random.Random(42)
+    teacher_id = conn.execute("INSERT INTO users (username, email, full_name, hashed_password, role) "
+                              "VALUES ('t', 't@x', 'Teacher', 'x', 'teacher')").lastrowid
+    conn.execute("INSERT INTO users (username, email, full_name, hashed_password, role) "
+                 "VALUES ('t2', 't2@x', 'Teacher 2', 'x', 'teacher')")
+    student_ids = [conn.execute("INSERT INTO users (username, email, full_name, hashed_password) "
+                                "VALUES (?, ?, ?, 'x')", (f"s{i}", f"s{i}@x", f"Student {i}")).lastrowid
+                   for i in range(200)]
+    repo = SqlRepository.from_sqlite3(conn)
+
+    columns = ("all", "teacher", "year")
+    print(f"{'':>19}" + "".join(f" | {name + ' term, ms':^26}" for name in QUERIES))
+    print(f"{'years':>5} {'submissions':>13}" + f" | {' '.join(f'{c:>8}' for c in columns)}" * len(QUERIES))
+    for year in range(1, args.years + 1):
+        academic_year = seed_year(conn, rng, year, args.courses, args.assignments, args.submissions,
+                                  teacher_id, student_ids)
+        total = conn.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+        line = f"{year:>5} {total:>13}"
+        for word in QUERIES.values():
+            match = fts_query(word)
+            timings = (
+                timed(lambda: repo.search_submissions(match, 0, "admin"), args.repeat),
+                timed(lambda: repo.search_submissions(match, teacher_id, "teacher"), args.repeat),
+                timed(lambda: repo.search_submissions(match, 0, "admin", academic_year=academic_year), args.repeat),
+            )
+            line += " | " + " ".join(f"{t:>8.2f}" for t in timings)
+        print(line)
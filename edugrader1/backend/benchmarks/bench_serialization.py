@@ -0,0 +1,94 @@
+# Benchmark of JSON serialization for the list endpoints.
+# Rows are loaded once with the routes' own queries; only the work done after
+# the query is timed, per 1,000 rows:
+#   dicts + response_model  - rows copied into dicts, validated by FastAPI's
+#                             response_model and encoded with json.dumps (old path)
+#   dicts + orjson          - same, with ORJSONResponse as the response class
+#   type adapter            - precompiled TypeAdapter over dicts + dump_json,
+#                             what the routes do now (main.dump_rows)
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_serialization.py
+#   python benchmarks/bench_serialization.py --rows 5000 --repeat 20
+
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from common import load_app, seed_assignment
+
+
+async def response_model_path(field, response_class, rows):
+    from fastapi.routing import serialize_response
+
+    content = [dict(row._mapping) for row in rows]
+    return response_class(await serialize_response(field=field, response_content=content)).body
+
+
+async def measure(name, fn, count, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        if asyncio.iscoroutine(body):
+            body = await body
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<26} {best / count * 1000 * 1000:>9.2f} ms per 1,000 rows  ({len(body)} bytes)")
+
+
+async def run(rows, repeat):
+    main = load_app(tempfile.mkdtemp(prefix="edugrader-bench-"))
+    async with main.lifespan(main.app):
+        await compare(main, rows, repeat)
+
+
+async def compare(main, rows, repeat):
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.utils import create_response_field
+    import repository_orm
+
+    assignment_id, _, _ = seed_assignment(main, rows, tag="serialize")
+
+    db = main.app.state.database.sessionmaker()
+    teacher = db.scalar(main.select(main.User).where(main.User.username == "teacher_serialize"))
+    course_id = db.scalar(main.select(main.Assignment.course_id).where(main.Assignment.id == assignment_id))
+    db.add_all([
+        main.Course(name=f"Course {i}", code=f"SER-{i}", teacher_id=teacher.id, academic_year="2025/2026", semester=1)
+        for i in range(rows - 1)
+    ])
+    db.add_all([
+        main.Assignment(course_id=course_id, title=f"Lab {i}", max_score=100,
+                        criteria=[{"name": "code", "max_score": 60}, {"name": "report", "max_score": 40}],
+                        deadline=datetime.now() + timedelta(days=7))
+        for i in range(rows - 1)
+    ])
+    db.commit()
+
+    # Every path starts from the same fetched rows
+    datasets = {
+        "courses": (main.CourseOut, main.COURSE_LIST, repository_orm.courses_query(None, "admin")),
+        "assignments": (main.AssignmentOut, main.ASSIGNMENT_LIST, repository_orm.assignments_query(course_id)),
+        "submissions": (main.SubmissionOut, main.SUBMISSION_LIST, repository_orm.submissions_query(assignment_id)),
+    }
+    for name, (model, adapter, query) in datasets.items():
+        fetched = db.execute(query).all()
+        field = create_response_field(name=f"bench_{name}", type_=List[model])
+        print(f"{name} ({len(fetched)} rows)")
+        await measure("dicts + response_model", lambda: response_model_path(field, JSONResponse, fetched),
+                      len(fetched), repeat)
+        await measure("dicts + orjson", lambda: response_model_path(field, ORJSONResponse, fetched),
+                      len(fetched), repeat)
+        await measure("type adapter", lambda: main.dump_rows(adapter, [dict(row._mapping) for row in fetched]),
+                      len(fetched), repeat)
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark list serialization paths")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
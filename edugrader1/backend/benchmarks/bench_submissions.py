@@ -0,0 +1,60 @@
+# Benchmark for GET /api/submissions/assignment/{assignment_id}
+# Seeds a throwaway SQLite database with N submissions (half of them graded)
+# and measures latency and number of SQL queries per request, both for the
+# full list (one page of up to 1000 rows) and for one keyset page (?limit=).
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_submissions.py
+#   python benchmarks/bench_submissions.py --sizes 10 100 300 1000 --repeat 20 --page 50
+
+import argparse
+import statistics
+import tempfile
+import time
+
+from common import load_app, seed_assignment
+
+def measure(client, url, headers, repeat, queries, expected):
+    timings = []
+    for _ in range(repeat):
+        queries.clear()
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200 and len(response.json()) == expected
+    return len(queries), statistics.median(timings)
+
+
+def run(sizes, repeat, page):
+    from fastapi.testclient import TestClient
+
+    main = load_app(tempfile.mkdtemp(prefix="edugrader-bench-"))
+    with TestClient(main.app) as client:
+        report(main, client, sizes, repeat, page)
+
+
+def report(main, client, sizes, repeat, page):
+    from sqlalchemy import event
+
+    queries = []
+    event.listen(main.app.state.database.engine, "before_cursor_execute",
+                 lambda *args: queries.append(1))
+
+    print(f"{'N':>6} {'queries':>8} {'full p50 ms':>12} {'page p50 ms':>12}")
+    for size in sizes:
+        assignment_id, _, headers = seed_assignment(main, size, tag=size)
+        url = f"/api/submissions/assignment/{assignment_id}"
+
+        count, full_ms = measure(client, f"{url}?limit=1000", headers, repeat, queries, size)
+        _, page_ms = measure(client, f"{url}?limit={page}", headers,
+                             repeat, queries, min(page, size))
+        print(f"{size:>6} {count:>8} {full_ms:>12.2f} {page_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the submissions listing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat, args.page)
@@ -0,0 +1,123 @@
+# Write throughput of main.py under several uvicorn workers.
+# The loadtest.py database is seeded once, then for every worker count a
+# fresh copy is served by uvicorn and `--concurrency` clients send only
+# writes: grades, uploads and enrollments, the requests that pile up at a
+# deadline. Each worker count runs with the single-writer queue
+# (EDUGRADER_WRITE_QUEUE=1) and without it, so the two can be compared;
+# failed requests are mostly "database is locked" errors answered with 500.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/bench_writes.py
+#   python benchmarks/bench_writes.py --workers 1 2 4 8 --requests 3000 --concurrency 64
+#   EDUGRADER_DB_MODE=async python benchmarks/bench_writes.py --write-queue on
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from common import database_path, load_app
+from loadtest import MainBackend, percentile, seed, start_server
+
+
+class WriteBackend(MainBackend):
+    def mix(self):
+        return [
+            (45, self.op_grade),
+            (35, self.op_upload),
+            (20, self.op_enroll),
+        ]
+
+    async def op_enroll(self, client):
+        user_id = self.student()
+        course_id = self.rng.choice(list(self.data["course_assignments"]))
+        return ("POST /api/courses/{course_id}/enroll",
+                await client.post(f"/api/courses/{course_id}/enroll", **self.auth(user_id)))
+
+
+async def drive(backend, url, args):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        actors = backend.data["teachers"][:args.actors] + backend.data["students"][:args.actors]
+        await backend.sign_in(client, actors)
+
+        weights, operations = zip(*backend.mix())
+        timings = []
+        statuses = Counter()
+        remaining = args.requests
+
+        async def client_loop():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                operation = backend.rng.choices(operations, weights)[0]
+                start = time.perf_counter()
+                _, response = await operation(client)
+                timings.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    timings.sort()
+    ok = sum(count for status, count in statuses.items() if status < 400)
+    return {
+        "writes_per_s": round(ok / elapsed, 1),
+        "errors": sum(statuses.values()) - ok,
+        "p50_ms": round(percentile(timings, 0.50), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "statuses": dict(statuses),
+    }
+
+
+def run(args):
+    template = tempfile.mkdtemp(prefix="edugrader-writes-")
+    app = load_app(template)
+    db_path = database_path(app)
+    data = seed(db_path, WriteBackend.hash_password(app), args, random.Random(args.seed))
+
+    modes = {"on": ["1"], "off": ["0"], "both": ["0", "1"]}[args.write_queue]
+    results = []
+    for workers in args.workers:
+        for write_queue in modes:
+            workdir = tempfile.mkdtemp(prefix="edugrader-writes-run-")
+            shutil.copy(os.path.join(template, db_path), workdir)
+            os.environ["EDUGRADER_WRITE_QUEUE"] = write_queue
+            server, url = start_server("main", workdir, workers)
+            try:
+                result = asyncio.run(drive(WriteBackend(data, random.Random(args.seed)), url, args))
+            finally:
+                server.terminate()
+                server.wait()
+            results.append({"workers": workers, "write_queue": write_queue == "1", **result})
+            print(f"{workers:>7} {'on' if write_queue == '1' else 'off':>11} {result['writes_per_s']:>9.1f} "
+                  f"{result['errors']:>6} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}  {result['statuses']}",
+                  flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark write throughput against uvicorn workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--write-queue", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--courses", type=int, default=30)
+    parser.add_argument("--enrollments", type=int, default=4, help="courses per student")
+    parser.add_argument("--assignments", type=int, default=5, help="assignments per course")
+    parser.add_argument("--submit-rate", type=float, default=0.6, help="share of assignments a student submitted")
+    parser.add_argument("--grade-rate", type=float, default=0.5, help="share of submissions already graded")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--actors", type=int, default=50, help="students and teachers signed in before the run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'write queue':>11} {'writes/s':>9} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    run(args)
@@ -0,0 +1,71 @@
+# Helpers shared by the benchmark scripts
+
+import importlib
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def load_app(workdir, module="main"):
+    # main.py / main_simple.py use edugrader.db and uploads/ in the current directory.
+    # Importing them opens nothing, so the schema is set up here explicitly
+    os.chdir(workdir)
+    sys.path.insert(0, str(APP_DIR))
+    app = importlib.import_module(module)
+    if module == "main":
+        app.migrate()
+    else:
+        app.init_db()
+    return app
+
+
+def database_path(app):
+    # SQLite file of a module returned by load_app
+    if hasattr(app, "DB_PATH"):
+        return app.DB_PATH
+    return make_url(app.app.state.settings.database_url).database
+
+
+def seed_assignment(main, size, tag, graded=True):
+    # One teacher, one course and one assignment with `size` student submissions.
+    # When graded is True every second submission already has a grade.
+    # Needs the app's lifespan to be running (main.app.state.database).
+    db = main.app.state.database.sessionmaker()
+    teacher = main.User(email=f"t_{tag}@bench.local", username=f"teacher_{tag}",
+                        full_name="Teacher", hashed_password="x", role="teacher")
+    db.add(teacher)
+    db.flush()
+    course = main.Course(name="Bench", code=f"BENCH-{tag}", teacher_id=teacher.id,
+                         academic_year="2025/2026", semester=1)
+    db.add(course)
+    db.flush()
+    assignment = main.Assignment(course_id=course.id, title="Lab", max_score=100,
+                                 criteria=[{"name": "total", "max_score": 100}],
+                                 deadline=datetime.now() + timedelta(days=7))
+    db.add(assignment)
+    db.flush()
+    submission_ids = []
+    for i in range(size):
+        student = main.User(email=f"s_{tag}_{i}@bench.local", username=f"s_{tag}_{i}",
+                            full_name=f"Student {i}", hashed_password="x", role="student")
+        db.add(student)
+        db.flush()
+        submission = main.Submission(assignment_id=assignment.id, student_id=student.id,
+                                     file_path="", file_name=f"lab_{i}.zip")
+        db.add(submission)
+        db.flush()
+        submission_ids.append(submission.id)
+        if graded and i % 2 == 0:
+            db.add(main.Grade(submission_id=submission.id, grader_id=teacher.id,
+                              scores={"total": 80}, total_score=80, feedback="ok"))
+            submission.status = "graded"
+    db.commit()
+    token = main.create_user_token(main.as_dict(teacher))
+    assignment_id = assignment.id
+    db.close()
+    return assignment_id, submission_ids, {"Authorization": f"Bearer {token}"}
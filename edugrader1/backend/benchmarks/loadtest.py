@@ -0,0 +1,431 @@
+# Load test of main.py and main_simple.py with a realistic request mix.
+# A fresh SQLite database is seeded with users, courses, enrollments,
+# assignments, submissions and grades, then `--concurrency` clients send
+# `--requests` requests picked by weight from the backend's mix. Latency
+# percentiles and requests/second are reported per route; --json writes the
+# same numbers to a file that can be diffed between versions.
+#
+# Requests go to the app in-process by default, or to a local uvicorn started
+# for the run with --serve. Each backend runs in its own process, and both
+# get the same mix of routes (Backend.mix); only login and the way the token
+# is sent differ.
+#
+# Usage (from edugrader1/backend):
+#   python benchmarks/loadtest.py
+#   python benchmarks/loadtest.py --backend main --students 2000 --requests 5000 --json before.json
+#   python benchmarks/loadtest.py --backend main --serve --workers 4
+#   EDUGRADER_DB_MODE=async python benchmarks/loadtest.py --backend main
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import APP_DIR, database_path, load_app
+
+PASSWORD = "bench"
+CRITERIA = [{"name": "code", "max_score": 60}, {"name": "report", "max_score": 40}]
+UPLOAD_SIZE = 16 * 1024
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # what SQLAlchemy writes to SQLite
+
+
+def seed(db_path, hashed_password, args, rng):
+    # Rows go in with explicit ids through plain sqlite3, which is much faster
+    # than the ORM and works for both backends: they share the schema.
+    conn = sqlite3.connect(db_path)
+    now = datetime.now()
+    next_id = {}
+    for table in ("users", "courses", "assignments", "submissions", "grades"):
+        next_id[table] = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+    tag = f"lt{next_id['users']}"
+
+    def ids(table, count):
+        start = next_id[table]
+        next_id[table] += count
+        return list(range(start, start + count))
+
+    teachers = ids("users", args.teachers)
+    students = ids("users", args.students)
+    conn.executemany(
+        "INSERT INTO users (id, email, username, full_name, hashed_password, role, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(user_id, f"{tag}_{user_id}@bench.local", f"{tag}_{user_id}", f"User {user_id}",
+          hashed_password, role, now.strftime(TIME_FORMAT))
+         for role, user_ids in (("teacher", teachers), ("student", students)) for user_id in user_ids],
+    )
+
+    courses = ids("courses", args.courses)
+    course_teacher = {course_id: teachers[i % len(teachers)] for i, course_id in enumerate(courses)}
+    conn.executemany(
+        "INSERT INTO courses (id, name, code, teacher_id, academic_year, semester) VALUES (?, ?, ?, ?, ?, ?)",
+        [(course_id, f"Course {course_id}", f"{tag}-{course_id}", teacher_id, "2025/2026", 1 + course_id % 2)
+         for course_id, teacher_id in course_teacher.items()],
+    )
+
+    enrollments = {student_id: rng.sample(courses, min(args.enrollments, len(courses))) for student_id in students}
+    conn.executemany(
+        "INSERT INTO course_students (course_id, student_id) VALUES (?, ?)",
+        [(course_id, student_id) for student_id, course_ids in enrollments.items() for course_id in course_ids],
+    )
+
+    course_assignments = {course_id: ids("assignments", args.assignments) for course_id in courses}
+    deadline = (now + timedelta(days=14)).strftime(TIME_FORMAT)
+    conn.executemany(
+        "INSERT INTO assignments (id, course_id, title, max_score, criteria, deadline) VALUES (?, ?, ?, ?, ?, ?)",
+        [(assignment_id, course_id, f"Lab {assignment_id}", 100, json.dumps(CRITERIA), deadline)
+         for course_id, assignment_ids in course_assignments.items() for assignment_id in assignment_ids],
+    )
+
+    submissions = []
+    grades = []
+    teacher_submissions = {teacher_id: [] for teacher_id in teachers}
+    for student_id, course_ids in enrollments.items():
+        for course_id in course_ids:
+            for assignment_id in course_assignments[course_id]:
+                if rng.random() >= args.submit_rate:
+                    continue
+                submission_id = ids("submissions", 1)[0]
+                graded = rng.random() < args.grade_rate
+                submissions.append((submission_id, assignment_id, student_id, "", f"lab_{submission_id}.zip",
+                                    "graded" if graded else "submitted", now.strftime(TIME_FORMAT)))
+                teacher_submissions[course_teacher[course_id]].append(submission_id)
+                if graded:
+                    scores = {"code": rng.randint(0, 60), "report": rng.randint(0, 40)}
+                    grades.append((ids("grades", 1)[0], submission_id, course_teacher[course_id],
+                                   json.dumps(scores), sum(scores.values()), "ok", now.strftime(TIME_FORMAT)))
+    conn.executemany(
+        "INSERT INTO submissions (id, assignment_id, student_id, file_path, file_name, status, submitted_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        submissions,
+    )
+    conn.executemany(
+        "INSERT INTO grades (id, submission_id, grader_id, scores, total_score, feedback, graded_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        grades,
+    )
+
+    # assignment_stats is maintained by the routes; rebuild it for the bulk-loaded rows
+    from migrations import rebuild_assignment_stats
+    rebuild_assignment_stats(conn)
+    conn.commit()
+    conn.close()
+
+    usernames = {user_id: f"{tag}_{user_id}" for user_id in teachers + students}
+    return {
+        "usernames": usernames,
+        "teachers": teachers,
+        "students": students,
+        "enrollments": enrollments,
+        "course_assignments": course_assignments,
+        "teacher_courses": {teacher_id: [c for c, t in course_teacher.items() if t == teacher_id]
+                            for teacher_id in teachers},
+        "teacher_submissions": teacher_submissions,
+        "counts": {"users": len(usernames), "courses": len(courses),
+                   "enrollments": sum(len(c) for c in enrollments.values()),
+                   "assignments": len(courses) * args.assignments,
+                   "submissions": len(submissions), "grades": len(grades)},
+    }
+
+
+class Backend:
+    # Request mix of both backends: [(weight, operation)], an operation picks its
+    # actor and arguments with the run's rng and returns (route, response).
+    # Subclasses say how to log in and how a request carries the token
+    module = None
+
+    def __init__(self, data, rng):
+        self.data = data
+        self.rng = rng
+        self.tokens = {}
+        self.students = []
+        self.teachers = []
+
+    @staticmethod
+    def hash_password(app):
+        raise NotImplementedError
+
+    async def login(self, client, user_id):
+        raise NotImplementedError
+
+    def auth(self, user_id):
+        raise NotImplementedError
+
+    def mix(self):
+        return [
+            (5, self.op_login),
+            (25, self.op_courses),
+            (20, self.op_assignments),
+            (15, self.op_upload),
+            (10, self.op_submissions),
+            (20, self.op_grade),
+            (5, self.op_search),
+        ]
+
+    async def sign_in(self, client, actors):
+        # Tokens of the actors are fetched before the measured run
+        for user_id in actors:
+            response = await self.login(client, user_id)
+            response.raise_for_status()
+            self.tokens[user_id] = response.json()["access_token"]
+        teachers = set(self.data["teachers"])
+        self.teachers = [user_id for user_id in actors if user_id in teachers]
+        self.students = [user_id for user_id in actors if user_id not in teachers]
+
+    def student(self):
+        return self.rng.choice(self.students)
+
+    def teacher(self):
+        return self.rng.choice(self.teachers)
+
+    async def op_login(self, client):
+        user_id = self.rng.choice(self.data["students"])
+        return "POST /api/auth/login", await self.login(client, user_id)
+
+    async def op_courses(self, client):
+        user_id = self.teacher() if self.rng.random() < 0.2 else self.student()
+        return "GET /api/courses", await client.get("/api/courses", **self.auth(user_id))
+
+    async def op_assignments(self, client):
+        user_id = self.student()
+        course_id = self.rng.choice(self.data["enrollments"][user_id])
+        return ("GET /api/assignments/course/{course_id}",
+                await client.get(f"/api/assignments/course/{course_id}", **self.auth(user_id)))
+
+    async def op_upload(self, client):
+        user_id = self.student()
+        course_id = self.rng.choice(self.data["enrollments"][user_id])
+        assignment_id = self.rng.choice(self.data["course_assignments"][course_id])
+        content = self.rng.randbytes(UPLOAD_SIZE)
+        return ("POST /api/submissions",
+                await client.post("/api/submissions", data={"assignment_id": assignment_id, "comment": "bench"},
+                                  files={"file": ("lab.zip", content)}, **self.auth(user_id)))
+
+    async def op_submissions(self, client):
+        user_id = self.teacher()
+        course_id = self.rng.choice(self.data["teacher_courses"][user_id])
+        assignment_id = self.rng.choice(self.data["course_assignments"][course_id])
+        return ("GET /api/submissions/assignment/{assignment_id}",
+                await client.get(f"/api/submissions/assignment/{assignment_id}?limit=50", **self.auth(user_id)))
+
+    async def op_grade(self, client):
+        user_id = self.teacher()
+        submission_id = self.rng.choice(self.data["teacher_submissions"][user_id])
+        scores = {"code": self.rng.randint(0, 60), "report": self.rng.randint(0, 40)}
+        return ("POST /api/grades",
+                await client.post("/api/grades", json={"submission_id": submission_id, "scores": scores,
+                                                       "feedback": "bench"}, **self.auth(user_id)))
+
+    async def op_search(self, client):
+        user_id = self.teacher() if self.rng.random() < 0.5 else self.student()
+        return "GET /api/search", await client.get("/api/search?q=lab", **self.auth(user_id))
+
+
+class MainBackend(Backend):
+    module = "main"
+
+    @staticmethod
+    def hash_password(app):
+        return app.pwd_context.hash(PASSWORD)
+
+    async def login(self, client, user_id):
+        return await client.post("/api/auth/login",
+                                 data={"username": self.data["usernames"][user_id], "password": PASSWORD})
+
+    def auth(self, user_id):
+        return {"headers": {"Authorization": f"Bearer {self.tokens[user_id]}"}}
+
+
+class SimpleBackend(Backend):
+    module = "main_simple"
+
+    @staticmethod
+    def hash_password(app):
+        return app.get_password_hash(PASSWORD)
+
+    async def login(self, client, user_id):
+        return await client.post("/api/auth/login",
+                                 json={"username": self.data["usernames"][user_id], "password": PASSWORD})
+
+    def auth(self, user_id):
+        return {"params": {"token": self.tokens[user_id]}}
+
+
+
+BACKENDS = {"main": MainBackend, "simple": SimpleBackend}
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of a sorted list
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize(timings, errors, elapsed):
+    timings = sorted(timings)
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "rps": round(len(timings) / elapsed, 1),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "p50_ms": round(percentile(timings, 0.50), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "p99_ms": round(percentile(timings, 0.99), 2),
+    }
+
+
+async def drive(backend, client, args):
+    actors = backend.data["teachers"][:args.actors] + backend.data["students"][:args.actors]
+    await backend.sign_in(client, actors)
+
+    weights, operations = zip(*backend.mix())
+    timings = {}
+    errors = {}
+    remaining = args.requests
+
+    async def client_loop():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            operation = backend.rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            route, response = await operation(client)
+            timings.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+            errors[route] = errors.get(route, 0) + (response.status_code >= 400)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    everything = [t for route_timings in timings.values() for t in route_timings]
+    return elapsed, {
+        "total": summarize(everything, sum(errors.values()), elapsed),
+        "routes": {route: summarize(timings[route], errors[route], elapsed) for route in sorted(timings)},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module, workdir, workers):
+    import httpx
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": str(APP_DIR)},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/docs")
+            return server, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def run(args):
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="edugrader-loadtest-")
+    backend_class = BACKENDS[args.backend]
+    app = load_app(workdir, backend_class.module)
+    rng = random.Random(args.seed)
+    db_path = database_path(app)
+    data = seed(db_path, backend_class.hash_password(app), args, rng)
+    backend = backend_class(data, rng)
+
+    server = None
+    if args.serve:
+        server, url = start_server(backend_class.module, workdir, args.workers)
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+    else:
+        client = httpx.AsyncClient(app=app.app, base_url="http://loadtest", timeout=60)
+
+    async def main():
+        # In-process runs need the app's startup (main.py opens its database there)
+        lifespan = contextlib.nullcontext() if server else app.app.router.lifespan_context(app.app)
+        async with lifespan, client:
+            return await drive(backend, client, args)
+
+    try:
+        elapsed, results = asyncio.run(main())
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    return {
+        "backend": args.backend,
+        "db_mode": app.app.state.settings.db_mode if hasattr(app.app.state, "settings") else "sqlite3",
+        "target": f"uvicorn x{args.workers}" if args.serve else "in-process",
+        "config": {key: getattr(args, key) for key in (
+            "students", "teachers", "courses", "enrollments", "assignments", "submit_rate", "grade_rate",
+            "requests", "concurrency", "actors", "seed")},
+        "seeded": data["counts"],
+        "elapsed_s": round(elapsed, 3),
+        **results,
+    }
+
+
+def print_report(result):
+    print(f"\n{result['backend']} ({result['db_mode']}, {result['target']}) - "
+          f"{result['total']['requests']} requests in {result['elapsed_s']} s")
+    print(f"{'route':<50} {'count':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, row in [*result["routes"].items(), ("total", result["total"])]:
+        print(f"{route:<50} {row['requests']:>6} {row['errors']:>4} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the EduGrader backends")
+    parser.add_argument("--backend", choices=["main", "simple", "both"], default="both")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--courses", type=int, default=30)
+    parser.add_argument("--enrollments", type=int, default=4, help="courses per student")
+    parser.add_argument("--assignments", type=int, default=5, help="assignments per course")
+    parser.add_argument("--submit-rate", type=float, default=0.6, help="share of assignments a student submitted")
+    parser.add_argument("--grade-rate", type=float, default=0.5, help="share of submissions already graded")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--actors", type=int, default=50, help="students and teachers signed in before the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", action="store_true", help="run against a local uvicorn instead of in-process")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --serve")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.backend != "both":
+        results = [run(args)]
+    else:
+        # One process per backend: both create edugrader.db in the current directory on import
+        results = []
+        for backend in ("main", "simple"):
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--backend", backend,
+                           "--json", output.name]
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+                results.extend(json.load(open(output.name))["runs"])
+
+    for result in results:
+        print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": results}, f, indent=2)
@@ -0,0 +1,78 @@
+# Apps built by create_app keep their database, uploads and queues on
+# app.state, so two apps with different settings run side by side in one process.
+# Run from edugrader1/backend: python -m pytest tests
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from settings import Settings
+
+
+def make_app(tmp_path, name, **options):
+    settings = Settings(database_url=f"sqlite:///{tmp_path / name}.db",
+                        async_database_url=f"sqlite+aiosqlite:///{tmp_path / name}.db",
+                        upload_dir=tmp_path / f"{name}_uploads", **options)
+    main.migrate(settings)
+    return main.create_app(settings)
+
+
+def login(client, username, role):
+    client.post("/api/auth/register", json={"email": f"{username}@example.com", "username": username,
+                                            "full_name": username, "password": "secret", "role": role})
+    token = client.post("/api/auth/login", data={"username": username, "password": "secret"}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+def submit_and_grade(client, tag):
+    teacher = login(client, f"teacher_{tag}", "teacher")
+    student = login(client, f"student_{tag}", "student")
+    course = client.post("/api/courses", json={"name": tag, "code": tag.upper(), "academic_year": "2025/2026",
+                                                "semester": 1}, headers=teacher).json()
+    assignment = client.post("/api/assignments", json={
+        "course_id": course["id"], "title": f"Lab {tag}", "max_score": 10, "criteria": [],
+        "deadline": (datetime.now() + timedelta(days=1)).isoformat(),
+    }, headers=teacher).json()
+    response = client.post("/api/submissions", data={"assignment_id": str(assignment["id"])},
+                           files={"file": (f"{tag}.txt", tag.encode())}, headers=student)
+    assert response.status_code == 200, response.text
+    response = client.post("/api/grades", json={"submission_id": response.json()["id"], "scores": {"total": 7},
+                                                "feedback": "ok"}, headers=teacher)
+    assert response.status_code == 200, response.text
+    return teacher, course["id"]
+
+
+@pytest.mark.parametrize("options", [
+    {"db_mode": "sync", "repository": "orm", "write_queue": True},
+    {"db_mode": "async", "repository": "sql", "write_queue": False},
+])
+def test_two_apps_in_one_process(tmp_path, options):
+    first = make_app(tmp_path, "first")
+    second = make_app(tmp_path, "second", **options)
+    with TestClient(first) as first_client, TestClient(second) as second_client:
+        first_teacher, first_course = submit_and_grade(first_client, "first")
+        second_teacher, second_course = submit_and_grade(second_client, "second")
+
+        # Each app only sees its own database
+        assert [c["code"] for c in first_client.get("/api/courses", headers=first_teacher).json()] == ["FIRST"]
+        assert [c["code"] for c in second_client.get("/api/courses", headers=second_teacher).json()] == ["SECOND"]
+        gradebook = second_client.get(f"/api/courses/{second_course}/gradebook", headers=second_teacher)
+        assert gradebook.text.count("\n") == 1  # the header line: nobody is enrolled
+
+        assert first.state.database is not second.state.database
+        assert first.state.write_queue.running
+        assert second.state.write_queue.running == options["write_queue"]
+
+    for name in ("first", "second"):
+        assert len([path for path in (tmp_path / f"{name}_uploads").rglob("*") if path.is_file()]) == 1
+
+
+def test_metrics_have_one_family_per_name(tmp_path):
+    # `python main.py` builds main.app on import and then a second app through the factory
+    with TestClient(make_app(tmp_path, "first")), TestClient(make_app(tmp_path, "second")) as client:
+        families = [line.split()[2] for line in client.get("/metrics").text.splitlines()
+                    if line.startswith("# TYPE ")]
+    assert "edugrader_event_subscribers" in families
+    assert len(families) == len(set(families))
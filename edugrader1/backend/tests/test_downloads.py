@@ -0,0 +1,94 @@
+# Range and conditional requests of FileDownload (downloads.py): partial
+# content, 416 past the end, a stale If-Range falls back to the whole file,
+# and a matching If-None-Match is a 304.
+# Run from edugrader1/backend: python -m pytest tests
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from downloads import FileDownload, stat_file
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+ETAG = '"abc123"'
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "lab.zip"
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.api_route("/file", methods=["GET", "HEAD"])
+    def download(request: Request):
+        size, mtime = stat_file(path)
+        return FileDownload(path, size, mtime, "lab.zip", ETAG, request.headers)
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_whole_file(client):
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == ETAG
+
+
+def test_open_ended_range_from_zero(client):
+    response = client.get("/file", headers={"Range": "bytes=0-"})
+    assert response.status_code == 206
+    assert response.content == CONTENT
+    assert response.headers["content-range"] == f"bytes 0-{len(CONTENT) - 1}/{len(CONTENT)}"
+
+
+def test_middle_range(client):
+    response = client.get("/file", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-length"] == "100"
+
+
+@pytest.mark.parametrize("length", [500, len(CONTENT) + 1])
+def test_suffix_range(client, length):
+    response = client.get("/file", headers={"Range": f"bytes=-{length}"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-length:]
+    start = max(len(CONTENT) - length, 0)
+    assert response.headers["content-range"] == f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("header", [f"bytes={len(CONTENT)}-", f"bytes={len(CONTENT) + 10}-{len(CONTENT) + 20}"])
+def test_range_past_the_end(client, header):
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.content == b""
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range(client):
+    # The range applies only while the client's copy is current
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": ETAG})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+    response = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert "content-range" not in response.headers
+
+
+@pytest.mark.parametrize("header", [ETAG, f'W/{ETAG}', f'"other", {ETAG}', "*"])
+def test_if_none_match(client, header):
+    response = client.get("/file", headers={"If-None-Match": header, "Range": "bytes=0-9"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == ETAG
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_head_sends_headers_only(client):
+    response = client.head("/file", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == b""
+    assert response.headers["content-length"] == "10"
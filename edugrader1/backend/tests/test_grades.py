@@ -0,0 +1,78 @@
+# Grades are validated before anything is written (repository.validate_scores):
+# a bad score is a 400, never a crash in the statistics update.
+# Run from edugrader1/backend: python -m pytest tests
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from repository import REPOSITORY_KINDS
+from settings import Settings
+
+
+def login(client, username, role):
+    client.post("/api/auth/register", json={"email": f"{username}@example.com", "username": username,
+                                            "full_name": username, "password": "secret", "role": role})
+    token = client.post("/api/auth/login", data={"username": username, "password": "secret"}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+@pytest.fixture(params=REPOSITORY_KINDS)
+def client(request, tmp_path):
+    settings = Settings(database_url=f"sqlite:///{tmp_path / 'grades.db'}",
+                        async_database_url=f"sqlite+aiosqlite:///{tmp_path / 'grades.db'}",
+                        upload_dir=tmp_path / "uploads", repository=request.param)
+    main.migrate(settings)
+    with TestClient(main.create_app(settings)) as client:
+        yield client
+
+
+def submissions(client, count):
+    # A teacher's headers and the ids of `count` submissions to one assignment
+    teacher = login(client, "teacher", "teacher")
+    course = client.post("/api/courses", json={"name": "Python", "code": "PY-1", "academic_year": "2025/2026",
+                                               "semester": 1}, headers=teacher).json()
+    assignment = client.post("/api/assignments", json={
+        "course_id": course["id"], "title": "Lab 1", "max_score": 100,
+        "criteria": [{"name": "code", "max_score": 60}, {"name": "report", "max_score": 40}],
+        "deadline": (datetime.now() + timedelta(days=1)).isoformat(),
+    }, headers=teacher).json()
+    ids = []
+    for i in range(count):
+        student = login(client, f"student{i}", "student")
+        response = client.post("/api/submissions", data={"assignment_id": str(assignment["id"])},
+                               files={"file": (f"lab{i}.txt", b"lab")}, headers=student)
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+    return teacher, assignment["id"], ids
+
+
+def graded_count(client, teacher, assignment_id):
+    return client.get(f"/api/assignments/{assignment_id}/stats", headers=teacher).json()["graded"]
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf")])
+def test_non_finite_score_is_rejected(client, value):
+    teacher, assignment_id, (submission_id,) = submissions(client, 1)
+    response = client.post("/api/grades", json={"submission_id": submission_id, "scores": {"code": value},
+                                                "feedback": ""}, headers=teacher)
+    assert response.status_code == 400
+    assert "finite" in response.json()["detail"]
+    assert graded_count(client, teacher, assignment_id) == 0
+
+
+def test_non_finite_score_in_batch_fails_only_its_item(client):
+    teacher, assignment_id, ids = submissions(client, 3)
+    response = client.post("/api/grades/batch", json=[
+        {"submission_id": ids[0], "scores": {"code": 50, "report": 30}, "feedback": "good"},
+        {"submission_id": ids[1], "scores": {"code": float("nan")}, "feedback": ""},
+        {"submission_id": ids[2], "scores": {"code": 40}, "feedback": "ok"},
+    ], headers=teacher)
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [result["status"] for result in results] == ["ok", "error", "ok"]
+    assert results[1]["submission_id"] == ids[1] and "finite" in results[1]["detail"]
+    assert [result["total_score"] for result in results if result["status"] == "ok"] == [80, 40]
+    assert graded_count(client, teacher, assignment_id) == 2
@@ -0,0 +1,108 @@
+# Keyset pagination contract of the list routes (pagination.py), the same in
+# main.py and main_simple.py: pages follow X-Next-Cursor without gaps or
+# duplicates, the last page has no cursor, and a tampered cursor is a 400.
+# Run from edugrader1/backend: python -m pytest tests
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import main_simple
+from pagination import NEXT_CURSOR_HEADER
+from repository_sql import SqlRepository
+from settings import Settings
+
+ROWS = 7  # per list; pages of 3 end with a short one
+PAGE = 3
+
+
+def seed(db_path, teacher_id):
+    # ROWS courses of the teacher, ROWS assignments in the first one and ROWS submissions to its first assignment
+    conn = sqlite3.connect(db_path)
+    repo = SqlRepository.from_sqlite3(conn)
+    student = repo.create_user("student@example.com", "student", "Student", "x")
+    courses = [repo.create_course(teacher_id, f"Course {i}", f"C-{i}", None, "2025/2026", 1)["id"]
+               for i in range(ROWS)]
+    deadline = datetime.now() + timedelta(days=7)
+    assignments = [repo.create_assignment(courses[0], f"Lab {i}", None, 100.0, [], deadline)["id"]
+                   for i in range(ROWS)]
+    submissions = [repo.create_submission(assignments[0], student["id"], "", f"lab{i}.zip", None)["id"]
+                   for i in range(ROWS)]
+    conn.commit()
+    conn.close()
+    return {"/api/courses": courses,
+            f"/api/assignments/course/{courses[0]}": assignments,
+            f"/api/submissions/assignment/{assignments[0]}": submissions}
+
+
+def register(client):
+    response = client.post("/api/auth/register", json={"email": "teacher@example.com", "username": "teacher",
+                                                       "full_name": "Teacher", "password": "secret",
+                                                       "role": "teacher"})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+@pytest.fixture
+def main_backend(tmp_path):
+    settings = Settings(database_url=f"sqlite:///{tmp_path / 'main.db'}",
+                        async_database_url=f"sqlite+aiosqlite:///{tmp_path / 'main.db'}",
+                        upload_dir=tmp_path / "uploads")
+    main.migrate(settings)
+    with TestClient(main.create_app(settings)) as client:
+        lists = seed(tmp_path / "main.db", register(client))
+        token = client.post("/api/auth/login", data={"username": "teacher", "password": "secret"}).json()
+        yield client, {"headers": {"Authorization": f"Bearer {token['access_token']}"}}, lists
+
+
+@pytest.fixture
+def simple_backend(tmp_path, monkeypatch):
+    # main_simple keeps its database path and per-thread connections in module globals
+    monkeypatch.setattr(main_simple, "DB_PATH", str(tmp_path / "simple.db"))
+    monkeypatch.setattr(main_simple, "_local", threading.local())
+    main_simple.init_db()
+    with TestClient(main_simple.app) as client:
+        lists = seed(tmp_path / "simple.db", register(client))
+        token = client.post("/api/auth/login", json={"username": "teacher", "password": "secret"}).json()
+        yield client, {"params": {"token": token["access_token"]}}, lists
+
+
+@pytest.fixture(params=["main", "simple"])
+def backend(request):
+    return request.getfixturevalue(f"{request.param}_backend")
+
+
+def get(client, auth, url, **params):
+    return client.get(url, **{**auth, "params": {**auth.get("params", {}), **params}})
+
+
+def test_pages_cover_every_row_once(backend):
+    client, auth, lists = backend
+    for url, ids in lists.items():
+        seen, cursors = [], []
+        response = get(client, auth, url, limit=PAGE)
+        while True:
+            assert response.status_code == 200, (url, response.text)
+            page = [row["id"] for row in response.json()]
+            assert 0 < len(page) <= PAGE
+            seen.extend(page)
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+            assert len(page) == PAGE
+            cursors.append(cursor)
+            response = get(client, auth, url, limit=PAGE, cursor=cursor)
+        assert seen == sorted(ids), url
+        assert len(cursors) == (len(ids) - 1) // PAGE
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor!", "eyJpZCI6ICJ4In0", "e30"])  # garbage, {"id": "x"}, {}
+def test_tampered_cursor_is_rejected(backend, cursor):
+    client, auth, lists = backend
+    for url in lists:
+        response = get(client, auth, url, limit=PAGE, cursor=cursor)
+        assert response.status_code == 400, (url, response.text)
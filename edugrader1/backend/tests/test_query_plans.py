@@ -0,0 +1,104 @@
+# Every statement the routes send must use an index (query_plans.py).
+# Run from edugrader1/backend: python -m pytest tests
+
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from migrations import migrate_engine
+from models import Base
+from query_plans import StatementTrace, check_calls, full_scans, read_calls, write_calls
+from repository import REPOSITORY_KINDS
+from repository_orm import OrmRepository
+from repository_sql import SqlRepository
+
+REPOSITORIES = {"orm": OrmRepository, "sql": SqlRepository}
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # Migrated database with one row of everything the calls look up
+    path = tmp_path / "plans.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    migrate_engine(engine)
+    with Session(engine) as session:
+        repo = OrmRepository(session)
+        teacher = repo.create_user("teacher@example.com", "teacher", "Teacher", "x", role="teacher")
+        student = repo.create_user("student@example.com", "student", "Student", "x", group="IS-21")
+        course = repo.create_course(teacher["id"], "Python", "PY-1", None, "2025/2026", 1)
+        repo.enroll(course["id"], [student["id"]])
+        assignment = repo.create_assignment(course["id"], "Lab 1", "First lab", 100.0, [], datetime(2025, 10, 1))
+        repo.create_submission(assignment["id"], student["id"], "", "lab1.zip", "lab report")
+        session.commit()
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def session(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def driver_connection(session):
+    return session.connection().connection.driver_connection
+
+
+@pytest.mark.parametrize("kind", REPOSITORY_KINDS)
+def test_repository_queries_use_indexes(session, kind):
+    repo = REPOSITORIES[kind].from_session(session)
+    calls = {**read_calls(repo), **write_calls(repo)}
+    assert check_calls(driver_connection(session), calls) == {}
+
+
+def test_sqlite3_repository_queries_use_indexes(db_path):
+    # main_simple.py: SqlRepository on a plain sqlite3 connection
+    conn = sqlite3.connect(db_path)
+    repo = SqlRepository.from_sqlite3(conn)
+    assert check_calls(conn, {**read_calls(repo), **write_calls(repo)}) == {}
+    conn.close()
+
+
+def test_gradebook_uses_indexes(session):
+    import main
+    calls = {"gradebook": lambda: session.execute(main.gradebook_query(1)).all()}
+    assert check_calls(driver_connection(session), calls) == {}
+
+
+def test_statements_are_traced(session):
+    # Otherwise the checks above would pass without looking at anything
+    with StatementTrace(driver_connection(session)) as trace:
+        OrmRepository(session).list_courses(1, "teacher")
+    assert any("course_students" in sql for sql in trace.statements)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM submissions WHERE comment = 'x'",
+    # Reads only the (course_id, student_id) index, but all of it
+    "SELECT course_id, COUNT(student_id) FROM course_students GROUP BY course_id",
+])
+def test_full_scans_are_reported(session, sql):
+    assert full_scans(driver_connection(session), sql)
+
+
+def test_check_command_needs_a_migrated_database(tmp_path):
+    result = subprocess.run([sys.executable, "migrations.py", "check", str(tmp_path / "empty.db")],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    assert result.returncode == 1
+    assert "not applied" in result.stdout
+
+
+def test_check_command_passes_on_a_migrated_database(db_path):
+    result = subprocess.run([sys.executable, "migrations.py", "check", str(db_path)],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
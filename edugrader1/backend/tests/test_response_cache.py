@@ -0,0 +1,129 @@
+# Conditional GETs stay correct with several workers: cache versions live in
+# the database and are bumped by triggers inside every write (response_cache.py),
+# so a write committed by one worker, or by main_simple.py, changes the ETag
+# every other worker computes.
+# Run from edugrader1/backend: python -m pytest tests
+
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from settings import Settings
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+@pytest.fixture
+def settings(tmp_path):
+    settings = Settings(database_url=f"sqlite:///{tmp_path / 'cache.db'}",
+                        async_database_url=f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}",
+                        upload_dir=tmp_path / "uploads")
+    main.migrate(settings)
+    return settings
+
+
+def login(client, username, role="teacher"):
+    client.post("/api/auth/register", json={"email": f"{username}@example.com", "username": username,
+                                            "full_name": username, "password": "secret", "role": role})
+    token = client.post("/api/auth/login", data={"username": username, "password": "secret"}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+def create_course(client, headers, code):
+    response = client.post("/api/courses", json={"name": code, "code": code, "academic_year": "2025/2026",
+                                                 "semester": 1}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def conditional_get(client, url, headers, etag):
+    return client.get(url, headers={**headers, "If-None-Match": etag})
+
+
+def test_writes_of_other_workers_and_main_simple(settings, tmp_path):
+    # Two apps on one database stand for two uvicorn workers: nothing in memory is shared
+    with TestClient(main.create_app(settings)) as first, TestClient(main.create_app(settings)) as second:
+        teacher = login(first, "teacher")
+        course_id = create_course(first, teacher, "PY-1")
+
+        etag = first.get("/api/courses", headers=teacher).headers["ETag"]
+        assert second.get("/api/courses", headers=teacher).headers["ETag"] == etag
+        assert conditional_get(second, "/api/courses", teacher, etag).status_code == 304
+
+        # A course created through the second worker
+        create_course(second, teacher, "PY-2")
+        response = conditional_get(first, "/api/courses", teacher, etag)
+        assert response.status_code == 200
+        assert [course["code"] for course in response.json()] == ["PY-1", "PY-2"]
+
+        # main_simple.py writes with plain sqlite3 and knows nothing about the cache
+        etag = response.headers["ETag"]
+        assignments = f"/api/assignments/course/{course_id}"
+        assignments_etag = first.get(assignments, headers=teacher).headers["ETag"]
+        conn = sqlite3.connect(tmp_path / "cache.db")
+        student_id = conn.execute("INSERT INTO users (username, role) VALUES ('student', 'student')").lastrowid
+        conn.execute("INSERT INTO course_students (course_id, student_id) VALUES (?, ?)", (course_id, student_id))
+        conn.execute("INSERT INTO assignments (course_id, title, max_score, criteria, deadline) "
+                     "VALUES (?, 'Lab 1', 10, '[]', ?)", (course_id, (datetime.now() + timedelta(days=1)).isoformat()))
+        conn.commit()
+        conn.close()
+
+        response = conditional_get(second, "/api/courses", teacher, etag)
+        assert response.status_code == 200
+        assert response.json()[0]["students_count"] == 1
+        response = conditional_get(first, assignments, teacher, assignments_etag)
+        assert response.status_code == 200
+        assert [assignment["title"] for assignment in response.json()] == ["Lab 1"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_two_uvicorn_workers(settings, tmp_path):
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": str(APP_DIR), "EDUGRADER_DATABASE_URL": settings.database_url,
+           "EDUGRADER_ASYNC_DATABASE_URL": settings.async_database_url,
+           "EDUGRADER_UPLOAD_DIR": str(settings.upload_dir)}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", "2",
+                               "--log-level", "warning"], cwd=tmp_path, env=env)
+    try:
+        # No keep-alive: every request gets a new connection, which either worker may accept
+        limits = httpx.Limits(max_keepalive_connections=0)
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    client.get("/docs")
+                    break
+                except httpx.TransportError:
+                    assert time.monotonic() < deadline, "uvicorn did not start"
+                    time.sleep(0.2)
+
+            teacher = login(client, "teacher")
+            etag = client.get("/api/courses", headers=teacher).headers["ETag"]
+            for i in range(5):
+                create_course(client, teacher, f"PY-{i}")
+                # The requests are spread over both workers; none may answer 304 or an old page
+                responses = [conditional_get(client, "/api/courses", teacher, etag) for _ in range(10)]
+                assert {response.status_code for response in responses} == {200}
+                assert {len(response.json()) for response in responses} == {i + 1}
+                etags = {response.headers["ETag"] for response in responses}
+                assert len(etags) == 1
+                etag = etags.pop()
+                assert conditional_get(client, "/api/courses", teacher, etag).status_code == 304
+    finally:
+        server.terminate()
+        server.wait(timeout=30)